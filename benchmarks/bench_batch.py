@@ -0,0 +1,98 @@
+# Compare answering lookups with one main.py process each, as runner.sh
+# does, against a single --batch process, both reading hotels from a
+# catalogue. Then time the queries of the batch inside one service with and
+# without the query cache.
+#
+#     python3 benchmarks/bench_batch.py [hotels] [queries] [processes]
+#
+# Queries draw hotel and destination ids from a Zipf distribution, so that
+# popular lookups repeat as they do in batch jobs. Only the first processes
+# queries are run one process each, the total is extrapolated.
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from application.hotel_service import HotelService  # noqa: E402
+from application.merge_strategy import DefaultMergeStrategy  # noqa: E402
+from bench_projection import make_hotel  # noqa: E402
+from infrastructure.mapped_repository import (  # noqa: E402
+    MappedHotelRepository, write_catalogue)
+
+MAIN = os.path.join(os.path.dirname(__file__), "..", "src", "main.py")
+
+
+# Draw lookups of one to three hotels or one destination, popular ones
+# first
+def make_queries(rng: random.Random, hotels, count: int):
+    hotel_ids = [hotel.id for hotel in hotels]
+    destinations = sorted({hotel.destination_id for hotel in hotels})
+    weights = [1 / rank for rank in range(1, len(hotel_ids) + 1)]
+    queries = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            ids = rng.choices(hotel_ids, weights, k=rng.randint(1, 3))
+            queries.append((",".join(ids), "none"))
+        else:
+            queries.append(("none", rng.choice(destinations[:50])))
+    return queries
+
+
+# Time answering the queries with a service over the catalogue
+def time_service(catalogue: str, queries, cache_size: int) -> float:
+    service = HotelService(MappedHotelRepository(catalogue), [],
+                           DefaultMergeStrategy(),
+                           query_cache_size=cache_size)
+    started = time.perf_counter()
+    for hotel_ids, destination_ids in queries:
+        service.find_hotels(
+            [] if hotel_ids == "none" else hotel_ids.split(","),
+            [] if destination_ids == "none" else [destination_ids])
+    return time.perf_counter() - started
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    rng = random.Random(42)
+    hotels = [make_hotel(rng, index) for index in range(count)]
+    queries = make_queries(rng, hotels, total)
+
+    with tempfile.TemporaryDirectory() as directory:
+        catalogue = os.path.join(directory, "hotels.cat")
+        write_catalogue(catalogue, hotels)
+        command = [sys.executable, MAIN, "--no-ingest", "--catalogue",
+                   catalogue, "--format", "compact"]
+
+        started = time.perf_counter()
+        for hotel_ids, destination_ids in queries[:processes]:
+            subprocess.run(command + [hotel_ids, destination_ids],
+                           stdout=subprocess.DEVNULL, check=True)
+        per_process = (time.perf_counter() - started) / processes
+        print(f"process per query: {per_process * 1000:8.2f} ms/query, "
+              f"{per_process * total:8.2f}s for {total} queries")
+
+        batch = os.path.join(directory, "queries.txt")
+        with open(batch, "w", encoding="utf-8") as file:
+            for query in queries:
+                file.write(" ".join(query) + "\n")
+        started = time.perf_counter()
+        subprocess.run(command + ["--batch", batch],
+                       stdout=subprocess.DEVNULL, check=True)
+        seconds = time.perf_counter() - started
+        print(f"--batch:           {seconds / total * 1000:8.2f} ms/query, "
+              f"{seconds:8.2f}s for {total} queries")
+
+        for label, cache_size in (("without cache", 0), ("with cache", 1024)):
+            seconds = time_service(catalogue, queries, cache_size)
+            print(f"service {label:14} {seconds / total * 1e6:8.1f} "
+                  f"us/query")
+
+
+if __name__ == "__main__":
+    main()
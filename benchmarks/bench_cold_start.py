@@ -0,0 +1,71 @@
+# Measure the time from starting main.py to the first byte of its answer
+# when querying hotels already merged, from a catalogue file and from an
+# SQLite database, for catalogues of growing size.
+#
+#     python3 benchmarks/bench_cold_start.py [hotels,...] [runs]
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from bench_projection import make_hotel  # noqa: E402
+from infrastructure.mapped_repository import write_catalogue  # noqa: E402
+from infrastructure.repositories import SqliteHotelRepository  # noqa: E402
+
+MAIN = os.path.join(os.path.dirname(__file__), "..", "src", "main.py")
+
+
+# Run a command, returning the seconds until it wrote its first byte
+def first_byte(command) -> float:
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+    process.stdout.read(1)
+    seconds = time.perf_counter() - started
+    process.communicate()
+    return seconds
+
+
+# Get the median of the first byte times of a command over runs
+def median_first_byte(command, runs: int) -> float:
+    return statistics.median(first_byte(command) for _ in range(runs))
+
+
+def main():
+    sizes = [int(size) for size in (sys.argv[1] if len(sys.argv) > 1 else
+                                    "1000,10000,100000").split(",")]
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    interpreter = median_first_byte([sys.executable, "-c", "print()"], runs)
+    print(f"interpreter alone: {interpreter * 1000:7.1f} ms")
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            hotels = [make_hotel(rng, index) for index in range(size)]
+            catalogue = os.path.join(directory, f"{size}.cat")
+            database = os.path.join(directory, f"{size}.db")
+            started = time.perf_counter()
+            write_catalogue(catalogue, hotels)
+            written = time.perf_counter() - started
+            repository = SqliteHotelRepository(database)
+            repository.put_all(hotels)
+            repository.close()
+            hotel_id = hotels[size // 2].id
+
+            query = [sys.executable, MAIN, hotel_id, "none", "--no-ingest"]
+            mapped = median_first_byte(query + ["--catalogue", catalogue],
+                                       runs)
+            sqlite = median_first_byte(query + ["--db", database], runs)
+            print(f"{size:>8} hotels: catalogue {mapped * 1000:7.1f} ms "
+                  f"sqlite {sqlite * 1000:7.1f} ms "
+                  f"({os.path.getsize(catalogue) / 1e6:.1f} MB written in "
+                  f"{written:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Time radius and bounding-box queries on the grid index against a scan of
+# every point, checking both return the same hotels. Points cluster around
+# a few hundred cities, as hotels do.
+#
+#     python3 benchmarks/bench_geo.py [points] [queries]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from domain.geo import haversine_km, in_bbox  # noqa: E402
+from infrastructure.geo_index import GeoIndex  # noqa: E402
+
+
+# Build points around random cities
+def make_points(rng: random.Random, count: int):
+    cities = [(rng.uniform(-60, 70), rng.uniform(-180, 180))
+              for _ in range(500)]
+    points = []
+    for index in range(count):
+        lat, lng = rng.choice(cities)
+        lat = max(-90.0, min(90.0, rng.gauss(lat, 0.3)))
+        lng = (rng.gauss(lng, 0.3) + 180) % 360 - 180
+        points.append((f"h{index}", lat, lng))
+    return points, cities
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(42)
+    points, cities = make_points(rng, count)
+
+    started = time.perf_counter()
+    index = GeoIndex()
+    for hotel_id, lat, lng in points:
+        index.add(hotel_id, lat, lng)
+    print(f"index {count} points: {time.perf_counter() - started:.2f}s")
+
+    near = []
+    for _ in range(queries):
+        lat, lng = rng.choice(cities)
+        near.append((lat + rng.uniform(-0.2, 0.2),
+                     lng + rng.uniform(-0.2, 0.2), rng.choice([1, 2, 5])))
+    # The first query of a cell builds its arrays, warm them up once
+    for lat, lng, radius_km in near:
+        index.near(lat, lng, radius_km)
+    started = time.perf_counter()
+    for lat, lng, radius_km in near:
+        index.near(lat, lng, radius_km)
+    seconds = (time.perf_counter() - started) / queries
+    print(f"near, index: {seconds * 1000:8.3f} ms/query")
+
+    started = time.perf_counter()
+    for lat, lng, radius_km in near[:5]:
+        expected = sorted(hotel_id for hotel_id, point_lat, point_lng in points
+                          if haversine_km(lat, lng, point_lat,
+                                          point_lng) <= radius_km)
+        found = sorted(hotel_id
+                       for hotel_id, _ in index.near(lat, lng, radius_km))
+        assert found == expected, "index and scan differ"
+    seconds = (time.perf_counter() - started) / 5
+    print(f"near, scan:  {seconds * 1000:8.3f} ms/query")
+
+    boxes = []
+    for _ in range(queries):
+        lat, lng = rng.choice(cities)
+        boxes.append((lat - 0.05, lng - 0.1, lat + 0.05, lng + 0.1))
+    started = time.perf_counter()
+    for bbox in boxes:
+        index.within(bbox)
+    seconds = (time.perf_counter() - started) / queries
+    print(f"bbox, index: {seconds * 1000:8.3f} ms/query")
+
+    for bbox in boxes[:5]:
+        expected = sorted(hotel_id for hotel_id, lat, lng in points
+                          if in_bbox(lat, lng, bbox))
+        assert sorted(index.within(bbox)) == expected, "index and scan differ"
+
+
+if __name__ == "__main__":
+    main()
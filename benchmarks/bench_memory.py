@@ -0,0 +1,92 @@
+# Measure how many bytes the merged catalogue takes per hotel.
+#
+#     python3 benchmarks/bench_memory.py [hotels]
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from infrastructure.repositories import InMemoryHotelRepository  # noqa: E402
+from infrastructure.suppliers.acme import AcmeSupplier  # noqa: E402
+from infrastructure.suppliers.patagonia import PatagoniaSupplier  # noqa: E402
+from infrastructure.suppliers.paperflies import (  # noqa: E402
+    PaperfliesSupplier)
+
+CITIES = [("Singapore", "SG"), ("Tokyo", "JP"), ("Paris", "FR"),
+          ("Sydney", "AU"), ("New York", "US")]
+GENERAL = ["Pool", "BusinessCenter", "WiFi ", "DryCleaning", " Breakfast",
+           "Bar", "outdoor pool", "indoor pool", "childcare", "wifi"]
+ROOM = ["tv", "coffee machine", "kettle", "hair dryer", "iron", "aircon",
+        "minibar", "bathtub"]
+CONDITIONS = ["All children are welcome.", "Pets are not allowed.",
+              "WiFi is available in all areas and is free of charge."]
+
+
+# Build the raw records of one hotel in the format of each supplier.
+# Strings are rebuilt for every hotel, as a JSON decoder would.
+def raw_records(rng: random.Random, index: int):
+    hotel_id = f"h{index}"
+    destination = 1000 + index % 500
+    city, country = rng.choice(CITIES)
+    name = f"Hotel {index}"
+    images = [{"url": f"https://img/{hotel_id}/{n}.jpg",
+               "description": "Room"} for n in range(3)]
+    acme = {"Id": hotel_id, "DestinationId": destination, "Name": name,
+            "Latitude": rng.uniform(-90, 90),
+            "Longitude": rng.uniform(-180, 180),
+            "Address": f"{index} Main Street", "City": "".join(city),
+            "Country": "".join(country), "Description": "A hotel. " * 20,
+            "Facilities": ["".join(a) for a in rng.sample(GENERAL, 5)]}
+    patagonia = {"id": hotel_id, "destination": destination, "name": name,
+                 "lat": rng.uniform(-90, 90), "lng": rng.uniform(-180, 180),
+                 "address": f"{index} Main Street", "info": "Nice. " * 20,
+                 "amenities": ["".join(a) for a in rng.sample(ROOM, 4)],
+                 "images": {"rooms": images, "amenities": images[:1]}}
+    paperflies = {"hotel_id": hotel_id, "destination_id": destination,
+                  "hotel_name": name,
+                  "location": {"address": f"{index} Main Street",
+                               "country": "".join(country)},
+                  "details": "Great. " * 20,
+                  "amenities": {"general": ["".join(a) for a in
+                                            rng.sample(GENERAL, 4)],
+                                "room": ["".join(a) for a in
+                                         rng.sample(ROOM, 4)]},
+                  "images": {"rooms": [{"link": i["url"], "caption": "Room"}
+                                       for i in images],
+                             "site": [{"link": images[0]["url"],
+                                       "caption": "Front"}]},
+                  "booking_conditions": ["".join(c) for c in CONDITIONS]}
+    return acme, patagonia, paperflies
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(42)
+    suppliers = [AcmeSupplier(), PatagoniaSupplier(), PaperfliesSupplier()]
+
+    # Trace from before decoding, so that strings kept from the raw records
+    # are counted as part of the catalogue
+    gc.collect()
+    tracemalloc.start()
+    records = [raw_records(rng, index) for index in range(count)]
+    repository = InMemoryHotelRepository()
+    for position, supplier in enumerate(suppliers):
+        repository.save_all(supplier.parse_hotel(hotel[position])
+                            for hotel in records)
+    hotels = repository.find_by_criteria([], [])
+    # Drop the raw records so only the catalogue is still traced
+    del records
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"hotels: {len(hotels)}")
+    print(f"bytes per hotel: {current / len(hotels):.0f}")
+    print(f"peak bytes per hotel during ingest: {peak / len(hotels):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Compare pairwise merging with the single-pass N-way merge as the number of
+# suppliers per hotel grows.
+#
+#     python3 benchmarks/bench_merge.py [hotels] [repeat]
+import os
+import random
+import sys
+import time
+from functools import reduce
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from application.merge_strategy import DefaultMergeStrategy  # noqa: E402
+from domain.models import (Hotel, Location, Amenities, Images,  # noqa: E402
+                           ImageItem)
+
+AMENITIES = [
+    "Pool", "outdoor pool", "indoor pool", "BusinessCenter",
+    "business center", "WiFi ", "wifi", "DryCleaning", "dry cleaning",
+    " Breakfast", "Bar", "BathTub", "Tub", "Aircon", "tv", "TV",
+    "coffee machine", "kettle", "hair dryer", "iron", "minibar", "childcare",
+]
+
+
+# Build one supplier's copy of a hotel
+def make_record(rng: random.Random, hotel_id: str) -> Hotel:
+    def images():
+        return [ImageItem(url=f"https://img/{hotel_id}/{rng.randint(0, 9)}",
+                          description=rng.choice(["Room", "Bar", None]))
+                for _ in range(rng.randint(0, 4))]
+
+    return Hotel(
+        id=hotel_id,
+        destination_id=str(rng.randint(1, 50)),
+        name=rng.choice(["", f"Hotel {hotel_id}"]),
+        location=Location(lat=rng.choice([None, rng.uniform(-90, 90)]),
+                          lng=rng.choice([None, rng.uniform(-180, 180)]),
+                          address=rng.choice(["", "1 Main Street"]),
+                          city=rng.choice(["", "Singapore"]),
+                          country=rng.choice(["", "SG"])),
+        description=rng.choice(["", "A hotel."]),
+        amenities=Amenities(general=rng.sample(AMENITIES, 6),
+                            room=rng.sample(AMENITIES, 4)),
+        images=Images(rooms=images(), site=images(), amenities=images()),
+        booking_conditions=rng.sample(["Pets", "WiFi", "Kids", "Smoking"],
+                                      rng.randint(0, 3)))
+
+
+# Time a merge function over every hotel, keeping the best of repeat runs
+def best_time(merge, hotels, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for records in hotels:
+            merge(records)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    strategy = DefaultMergeStrategy()
+
+    def pairwise(records):
+        return reduce(strategy.merge, records)
+
+    print(f"{'suppliers':>9} {'pairwise s':>11} {'n-way s':>9} {'speedup':>8}")
+    for suppliers in (2, 3, 4, 6, 8, 12):
+        rng = random.Random(suppliers)
+        hotels = [[make_record(rng, str(i)) for _ in range(suppliers)]
+                  for i in range(count)]
+
+        # Both paths must agree before their timings mean anything
+        for records in hotels:
+            assert pairwise(records) == strategy.merge_all(records)
+
+        pairwise_time = best_time(pairwise, hotels, repeat)
+        nway_time = best_time(strategy.merge_all, hotels, repeat)
+        print(f"{suppliers:>9} {pairwise_time:>11.3f} {nway_time:>9.3f} "
+              f"{pairwise_time / nway_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
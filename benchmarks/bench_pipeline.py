@@ -0,0 +1,270 @@
+# Time every stage of the ingest and query pipeline on synthetic supplier
+# feeds served by a local stub server, and store the results to compare
+# runs.
+#
+#     python3 benchmarks/bench_pipeline.py [--hotels N] [--overlap F]
+#         [--skew F] [--repository memory|sqlite] [--compare]
+#
+# Stages are ingest (HotelService.process_hotels: download, decode, parse
+# and save every feed), merge (merge staged records, the in-memory
+# repository merges on first read), query (single hotel and destination
+# lookups) and serialize (encode every hotel as indented JSON). Ingest is
+# broken down into the fetch, decode, parse and save timers the service
+# records. Feeds download concurrently, so fetch adds up the time of every
+# supplier. Items are bytes for fetch and records, hotels or queries
+# otherwise. Peak RSS is the high-water mark of the process after each
+# stage.
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from application.hotel_service import HotelService  # noqa: E402
+from application.merge_strategy import DefaultMergeStrategy  # noqa: E402
+from application.metrics import Metrics  # noqa: E402
+from infrastructure.hotel_encoder import HotelEncoder  # noqa: E402
+from infrastructure.http_transport import (HttpTransport,  # noqa: E402
+                                           MemoryResponseCache)
+from infrastructure.repositories import (  # noqa: E402
+    InMemoryHotelRepository, SqliteHotelRepository)
+from infrastructure.suppliers.acme import AcmeSupplier  # noqa: E402
+from infrastructure.suppliers.patagonia import PatagoniaSupplier  # noqa: E402
+from infrastructure.suppliers.paperflies import (  # noqa: E402
+    PaperfliesSupplier)
+from stub_server import StubServer  # noqa: E402
+from synthetic_feeds import write_feeds  # noqa: E402
+
+RESULTS = os.path.join(os.path.dirname(__file__), "results.jsonl")
+
+
+# Discards written output, counting its bytes
+class CountingSink:
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+
+
+# Peak resident set size of the process so far, in MiB
+def peak_rss_mib() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+# Run one stage, recording its time, throughput and the peak RSS after it.
+# The stage returns how many items it processed.
+def run_stage(stages: dict, name: str, function) -> None:
+    started = time.perf_counter()
+    items = function()
+    seconds = time.perf_counter() - started
+    stages[name] = {
+        "seconds": round(seconds, 4),
+        "items": items,
+        "per_second": round(items / seconds, 1) if seconds else None,
+        "peak_rss_mib": round(peak_rss_mib(), 1),
+    }
+    print(f"{name:>10}: {seconds:9.3f}s {items:>10} items "
+          f"{stages[name]['per_second'] or 0:>12.0f}/s "
+          f"peak RSS {stages[name]['peak_rss_mib']:.0f} MiB")
+
+
+# Add the time the service recorded in each step of ingest as stages of
+# their own
+def add_breakdown(stages: dict, metrics: Metrics, fetched: int,
+                  records: int) -> None:
+    seconds = {}
+    for timer in metrics.summary()["timers"]:
+        seconds[timer["name"]] = (seconds.get(timer["name"], 0.0) +
+                                  timer["seconds"])
+    for name in ("fetch", "decode", "parse", "save"):
+        items = fetched if name == "fetch" else records
+        stage = stages[f"ingest.{name}"] = {
+            "seconds": round(seconds.get(name, 0.0), 4),
+            "items": items,
+            "per_second": (round(items / seconds[name], 1)
+                           if seconds.get(name) else None),
+            "peak_rss_mib": stages["ingest"]["peak_rss_mib"],
+        }
+        print(f"{'.' + name:>10}: {stage['seconds']:9.3f}s {items:>10} "
+              f"items {stage['per_second'] or 0:>12.0f}/s")
+
+
+# Get synthetic feeds for the parameters, generating them unless a previous
+# run already did
+def prepare_feeds(args) -> str:
+    directory = args.data_dir or os.path.join(
+        tempfile.gettempdir(), "hotel-merger-bench",
+        f"{args.hotels}-{args.overlap}-{args.skew}-{args.seed}")
+    marker = os.path.join(directory, "feeds.json")
+    if not os.path.exists(marker):
+        started = time.perf_counter()
+        counts = write_feeds(directory, args.hotels, args.overlap, args.skew,
+                             args.seed)
+        with open(marker, "w") as file:
+            json.dump(counts, file)
+        print(f"generated feeds in {time.perf_counter() - started:.1f}s "
+              f"into {directory}")
+    return directory
+
+
+# Get the current git revision, if any
+def revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except OSError:
+        return ""
+
+
+# Run every stage against the stub server
+def run_pipeline(args, base_url: str) -> dict:
+    # Nothing is cached, every run downloads the feeds
+    transport = HttpTransport(cache=MemoryResponseCache(max_entry_bytes=0))
+    suppliers = [
+        AcmeSupplier(transport, api_url=f"{base_url}/acme"),
+        PatagoniaSupplier(transport, api_url=f"{base_url}/patagonia"),
+        PaperfliesSupplier(transport, api_url=f"{base_url}/paperflies"),
+    ]
+    for supplier in suppliers:
+        supplier.timeout = 3600
+    if args.repository == "sqlite":
+        database = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        database.close()
+        repository = SqliteHotelRepository(database.name)
+    else:
+        repository = InMemoryHotelRepository()
+
+    metrics = Metrics()
+    # Queries are not cached, every one reaches the repository
+    service = HotelService(repository, suppliers, DefaultMergeStrategy(),
+                           batch_size=args.batch_size, metrics=metrics,
+                           query_cache_size=0)
+    stages = {}
+
+    def ingest():
+        report = service.process_hotels()
+        if report.failed:
+            raise RuntimeError(f"suppliers failed: {report.failed}")
+        return int(sum(counter["value"]
+                       for counter in metrics.summary()["counters"]
+                       if counter["name"] == "records_parsed"))
+
+    hotels = []
+
+    def merge():
+        hotels.extend(service.find_hotels([], []))
+        return len(hotels)
+
+    def query():
+        rng = random.Random(args.seed)
+        for _ in range(args.queries):
+            hotel = rng.choice(hotels)
+            service.find_hotels([hotel.id], [])
+            service.find_hotels([], [hotel.destination_id])
+        return args.queries * 2
+
+    def serialize():
+        sink = CountingSink()
+        HotelEncoder("json", cache=False).write(hotels, sink)
+        return len(hotels)
+
+    run_stage(stages, "ingest", ingest)
+    fetched = sum(stats.bytes_on_wire
+                  for stats in transport.stats().values())
+    add_breakdown(stages, metrics, fetched, stages["ingest"]["items"])
+    run_stage(stages, "merge", merge)
+    run_stage(stages, "query", query)
+    run_stage(stages, "serialize", serialize)
+    if args.repository == "sqlite":
+        repository.close()
+        os.unlink(database.name)
+    return stages
+
+
+# Print how every stage compares with the last stored run of the same
+# parameters
+def compare(result: dict, previous: dict) -> None:
+    print(f"compared with {previous['revision'] or 'unknown'} "
+          f"at {previous['timestamp']}:")
+    for name, stage in result["stages"].items():
+        before = previous["stages"].get(name)
+        if not before or not before["seconds"]:
+            continue
+        ratio = stage["seconds"] / before["seconds"]
+        print(f"{name:>10}: {before['seconds']:9.3f}s -> "
+              f"{stage['seconds']:9.3f}s ({ratio:.2f}x time), peak RSS "
+              f"{before['peak_rss_mib']:.0f} -> {stage['peak_rss_mib']:.0f} "
+              "MiB")
+
+
+# Find the last stored run with the same parameters
+def last_result(path: str, params: dict):
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path) as file:
+        for line in file:
+            result = json.loads(line)
+            if result["params"] == params:
+                previous = result
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hotels", type=int, default=10000)
+    parser.add_argument("--overlap", type=float, default=0.5,
+                        help="Share of hotels listed by every supplier")
+    parser.add_argument("--skew", type=float, default=1.0,
+                        help="Zipf exponent of amenity popularity")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repository", choices=("memory", "sqlite"),
+                        default="memory")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--data-dir",
+                        help="Directory of the generated feeds")
+    parser.add_argument("--results", default=RESULTS,
+                        help="File the results of every run are added to")
+    parser.add_argument("--compare", action="store_true",
+                        help="Compare with the last run of the same "
+                        "parameters")
+    args = parser.parse_args()
+
+    params = {"hotels": args.hotels, "overlap": args.overlap,
+              "skew": args.skew, "seed": args.seed,
+              "repository": args.repository, "batch_size": args.batch_size,
+              "queries": args.queries}
+    directory = prepare_feeds(args)
+    previous = last_result(args.results, params) if args.compare else None
+
+    with StubServer(directory) as server:
+        stages = run_pipeline(args, server.url)
+
+    result = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "revision": revision(),
+        "python": platform.python_version(),
+        "params": params,
+        "stages": stages,
+    }
+    with open(args.results, "a") as file:
+        file.write(json.dumps(result) + "\n")
+    if previous:
+        compare(result, previous)
+
+
+if __name__ == "__main__":
+    main()
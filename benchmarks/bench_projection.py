@@ -0,0 +1,100 @@
+# Compare querying and encoding whole hotels with a projection of a few
+# fields, from memory and from SQLite: seconds to the first byte written,
+# total seconds and bytes of output.
+#
+#     python3 benchmarks/bench_projection.py [hotels] [fields]
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from domain.models import (Amenities, Hotel, ImageItem, Images,  # noqa: E402
+                           Location)
+from infrastructure.hotel_encoder import HotelEncoder  # noqa: E402
+from infrastructure.repositories import (  # noqa: E402
+    InMemoryHotelRepository, SqliteHotelRepository)
+from infrastructure.serialization import project_fields  # noqa: E402
+
+WORDS = ("quiet rooms close to the station with a rooftop bar pool and views "
+         "over the bay breakfast served daily in the garden").split()
+
+
+# Build a hotel with a long description, images and booking conditions, as
+# suppliers send them
+def make_hotel(rng: random.Random, index: int) -> Hotel:
+    def text(words):
+        return " ".join(rng.choices(WORDS, k=words))
+
+    def images(count):
+        return [ImageItem(url=f"https://img.example/{index}/{n}.jpg",
+                          description=text(3)) for n in range(count)]
+
+    return Hotel(id=f"h{index}", destination_id=str(rng.randint(1, 500)),
+                 name=f"Hotel {index}",
+                 location=Location(lat=rng.uniform(-90, 90),
+                                   lng=rng.uniform(-180, 180),
+                                   address=f"{index} Main Street",
+                                   city="Singapore", country="SG"),
+                 description=text(120),
+                 amenities=Amenities(general=rng.sample(WORDS, 6),
+                                     room=rng.sample(WORDS, 4)),
+                 images=Images(rooms=images(6), site=images(4),
+                               amenities=images(3)),
+                 booking_conditions=[text(30) for _ in range(5)])
+
+
+# Stream that records when its first byte was written
+class FirstByteStream(io.RawIOBase):
+    def __init__(self):
+        self.first_byte = None
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter()
+        self.size += len(data)
+        return len(data)
+
+
+# Query every hotel and write it with the given projection
+def measure(repository, fields):
+    stream = FirstByteStream()
+    started = time.perf_counter()
+    hotels = repository.find_by_criteria([], [], fields)
+    HotelEncoder("compact", cache=False, fields=fields).write(hotels, stream)
+    finished = time.perf_counter()
+    return stream.first_byte - started, finished - started, stream.size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    fields = project_fields((sys.argv[2] if len(sys.argv) > 2 else
+                             "id,name,location").split(","))
+    rng = random.Random(42)
+    hotels = [make_hotel(rng, index) for index in range(count)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        repositories = {
+            "memory": InMemoryHotelRepository(),
+            "sqlite": SqliteHotelRepository(
+                os.path.join(directory, "hotels.db")),
+        }
+        for name, repository in repositories.items():
+            repository.save_all(hotels)
+            repository.find_by_criteria([], [])
+            for label, projection in (("all fields", None),
+                                      (",".join(fields), fields)):
+                first_byte, total, size = measure(repository, projection)
+                print(f"{name:6} {label:20} first byte {first_byte:6.3f}s "
+                      f"total {total:6.3f}s {size / 1e6:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
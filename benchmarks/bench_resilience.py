@@ -0,0 +1,99 @@
+# Fetch a supplier served by the stub server under injected faults, plain and
+# wrapped in ResilientSupplier, and compare the latency percentiles of the
+# fetches and the share of them that returned hotels.
+#
+#     python3 benchmarks/bench_resilience.py [fetches] [hotels]
+#
+# Scenarios are healthy, flaky (30% of requests fail), slow tail (3% of
+# requests take a second longer) and down (every request fails). The
+# resilient supplier first fetches the healthy feed once, so that it has a
+# snapshot to fall back to; fetches served from it are counted as stale.
+# Fetches run back to back as in a server, serving the snapshot while a slow
+# fetch goes on in the background.
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from infrastructure.http_transport import HttpTransport  # noqa: E402
+from infrastructure.snapshot_store import MemorySnapshotStore  # noqa: E402
+from infrastructure.suppliers.acme import AcmeSupplier  # noqa: E402
+from infrastructure.suppliers.resilient import (  # noqa: E402
+    ResiliencePolicy, ResilientSupplier)
+from stub_server import FaultPlan, Faults, StubServer  # noqa: E402
+from synthetic_feeds import write_feeds  # noqa: E402
+
+SCENARIOS = {
+    "healthy": Faults(delay=0.01),
+    "flaky": Faults(delay=0.01, error_rate=0.3),
+    "slow tail": Faults(delay=0.01, slow_rate=0.03, slow_delay=1.0),
+    "down": Faults(down=True),
+}
+
+# Short waits so that a run takes seconds, the ratios are what matter
+POLICY = ResiliencePolicy(attempts=3, backoff=0.05, max_backoff=0.5,
+                          deadline=5.0, hedge_after=0.2, failure_threshold=3,
+                          reset_after=1.0, stale_while_revalidate=True)
+
+
+# Get the value below which share of the sorted values fall
+def percentile(values, share: float) -> float:
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+# Fetch the feed the given number of times, returning the sorted latencies
+# and how many fetches returned fresh and stale hotels
+def measure(supplier, fetches: int):
+    latencies = []
+    fresh = stale = 0
+    for _ in range(fetches):
+        started = time.perf_counter()
+        try:
+            pages = supplier.fetch()
+        except Exception:
+            latencies.append(time.perf_counter() - started)
+            continue
+        for page in pages:
+            page.close()
+        latencies.append(time.perf_counter() - started)
+        if supplier.stale_reason:
+            stale += 1
+        else:
+            fresh += 1
+    return sorted(latencies), fresh, stale
+
+
+def main():
+    fetches = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    hotels = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    plan = FaultPlan(seed=42)
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_feeds(directory, hotels)
+        with StubServer(directory, faults=plan) as server:
+            transport = HttpTransport()
+            url = f"{server.url}/acme"
+            for scenario, faults in SCENARIOS.items():
+                plain = AcmeSupplier(transport, api_url=url)
+                resilient = ResilientSupplier(
+                    AcmeSupplier(transport, api_url=url), POLICY,
+                    MemorySnapshotStore(), random.Random(42))
+                plan.clear()
+                resilient.fetch()
+                plan.set("acme", faults)
+                for label, supplier in (("plain", plain),
+                                        ("resilient", resilient)):
+                    latencies, fresh, stale = measure(supplier, fetches)
+                    print(f"{scenario:9} {label:9} "
+                          f"p50 {percentile(latencies, 0.5) * 1000:7.1f} ms "
+                          f"p95 {percentile(latencies, 0.95) * 1000:7.1f} ms "
+                          f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms "
+                          f"available {(fresh + stale) / fetches:6.1%} "
+                          f"(stale {stale / fetches:6.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Time amenity and name-prefix queries on the inverted index against a scan
+# of every hotel, checking both return the same hotels.
+#
+#     python3 benchmarks/bench_search.py [hotels] [queries]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from application.merge_strategy import DefaultMergeStrategy  # noqa: E402
+from domain.models import Amenities, Hotel  # noqa: E402
+from domain.search import (hotel_amenities, matches_name,  # noqa: E402
+                           name_tokens)
+from infrastructure.search_index import SearchIndex  # noqa: E402
+from synthetic_feeds import AmenitySampler  # noqa: E402
+
+WORDS = ["Grand", "Royal", "Beach", "Park", "City", "Garden", "Palace", "Inn",
+         "Resort", "Suites", "Plaza", "Bay", "Harbour", "Central", "Villas"]
+
+
+# Build hotels with Zipf-distributed amenities and names of common words
+# and a rare one
+def make_hotels(rng: random.Random, count: int):
+    sampler = AmenitySampler(rng, 1.1)
+    return [
+        Hotel(id=f"h{index}", destination_id="1",
+              name=" ".join(rng.sample(WORDS, 2) +
+                            [f"w{rng.randint(0, 99999)}"]),
+              location=None, description=None,
+              amenities=Amenities(general=sampler.sample(8),
+                                  room=sampler.sample(4)),
+              images=None, booking_conditions=())
+        for index in range(count)
+    ]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    rng = random.Random(42)
+    hotels = make_hotels(rng, count)
+    amenity_key = DefaultMergeStrategy().amenity_key
+
+    started = time.perf_counter()
+    index = SearchIndex(amenity_key)
+    for position, hotel in enumerate(hotels):
+        index.add(position, hotel)
+    print(f"index {count} hotels: {time.perf_counter() - started:.2f}s")
+
+    keys = sorted({amenity_key(amenity) for hotel in hotels[:1000]
+                   for amenity in hotel_amenities(hotel)})
+    cases = [(rng.sample(keys[:12], 3), None) for _ in range(queries // 2)]
+    cases += [((), rng.choice(WORDS)[:3] + " w1") for _ in range(queries // 2)]
+
+    started = time.perf_counter()
+    for amenities, name in cases:
+        index.hotel_ids(index.match(amenities, name))
+    seconds = (time.perf_counter() - started) / len(cases)
+    print(f"index: {seconds * 1000:8.3f} ms/query")
+
+    started = time.perf_counter()
+    for amenities, name in cases[:3] + cases[-3:]:
+        wanted = {amenity_key(amenity) for amenity in amenities}
+        prefixes = name_tokens(name)
+        expected = [
+            hotel.id for hotel in hotels
+            if wanted.issubset(map(amenity_key, hotel_amenities(hotel)))
+            and matches_name(hotel.name, prefixes)
+        ]
+        found = index.hotel_ids(index.match(amenities, name))
+        assert found == expected, "index and scan differ"
+    seconds = (time.perf_counter() - started) / 6
+    print(f"scan:  {seconds * 1000:8.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
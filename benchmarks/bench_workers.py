@@ -0,0 +1,104 @@
+# Compare ingest time of HotelService with one process and with sharded
+# parse-and-merge on 2, 4, ... worker processes, checking that every worker
+# count produces exactly the serial result.
+#
+#     python3 benchmarks/bench_workers.py [hotels] [max workers] [pages]
+#
+# Feeds are split into pages, as paginated suppliers serve them, since
+# workers decode whole pages. Besides the wall time, the CPU time of the
+# parent and its workers is printed: it stays close to the serial one when
+# no work is repeated, and wall time only scales with workers up to the
+# number of cores.
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from application.hotel_service import HotelService  # noqa: E402
+from application.merge_strategy import DefaultMergeStrategy  # noqa: E402
+from infrastructure.http_transport import (HttpTransport,  # noqa: E402
+                                           MemoryResponseCache)
+from infrastructure.repositories import InMemoryHotelRepository  # noqa: E402
+from infrastructure.suppliers.acme import AcmeSupplier  # noqa: E402
+from infrastructure.suppliers.patagonia import PatagoniaSupplier  # noqa: E402
+from infrastructure.suppliers.paperflies import (  # noqa: E402
+    PaperfliesSupplier)
+from stub_server import StubServer  # noqa: E402
+from synthetic_feeds import write_feeds  # noqa: E402
+
+
+# Split every feed of directory into pages, which the stub server links
+def paginate(directory: str, pages: int) -> None:
+    for name in ("acme", "patagonia", "paperflies"):
+        path = os.path.join(directory, f"{name}.json")
+        with open(path, encoding="utf-8") as file:
+            records = json.load(file)
+        os.unlink(path)
+        size = -(-len(records) // pages)
+        for page in range(pages):
+            label = name if page == 0 else f"{name}.{page + 1}"
+            with open(os.path.join(directory, f"{label}.json"), "w",
+                      encoding="utf-8") as file:
+                json.dump(records[page * size:(page + 1) * size], file)
+
+
+# CPU seconds used so far by the process and its finished children
+def cpu_seconds() -> float:
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+# Ingest every feed with the given number of workers, returning the merged
+# hotels, the seconds it took and the CPU seconds it used
+def ingest(base_url: str, workers: int):
+    transport = HttpTransport(cache=MemoryResponseCache(max_entry_bytes=0))
+    suppliers = [
+        AcmeSupplier(transport, api_url=f"{base_url}/acme"),
+        PatagoniaSupplier(transport, api_url=f"{base_url}/patagonia"),
+        PaperfliesSupplier(transport, api_url=f"{base_url}/paperflies"),
+    ]
+    for supplier in suppliers:
+        supplier.timeout = 3600
+    merge_strategy = DefaultMergeStrategy()
+    service = HotelService(InMemoryHotelRepository(merge_strategy),
+                           suppliers, merge_strategy, workers=workers)
+    started = time.perf_counter()
+    cpu_started = cpu_seconds()
+    report = service.process_hotels()
+    hotels = service.find_hotels([], [])
+    seconds = time.perf_counter() - started
+    assert not report.failed, report.failed
+    return hotels, seconds, cpu_seconds() - cpu_started
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    pages = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    print(f"{os.cpu_count()} cores")
+    with tempfile.TemporaryDirectory() as directory:
+        write_feeds(directory, count)
+        paginate(directory, pages)
+        with StubServer(directory) as server:
+            expected, serial, serial_cpu = ingest(server.url, 1)
+            print(f"workers  1: {serial:7.2f}s, {serial_cpu:7.2f}s CPU")
+            workers = 2
+            while workers <= max_workers:
+                hotels, seconds, cpu = ingest(server.url, workers)
+                assert hotels == expected, "sharded result differs"
+                print(f"workers {workers:2}: {seconds:7.2f}s, {cpu:7.2f}s CPU "
+                      f"({serial / seconds:.2f}x faster, "
+                      f"{cpu / serial_cpu:.2f}x CPU)")
+                workers *= 2
+
+
+if __name__ == "__main__":
+    main()
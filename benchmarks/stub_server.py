@@ -0,0 +1,168 @@
+# Serve supplier feeds from a directory over local HTTP, as
+# /suppliers/<name> for every <name>.json in it. A feed split into pages
+# <name>.json, <name>.2.json, ... links every page to the next one, as
+# paginated suppliers do. Errors, delays and outages can be injected per
+# supplier.
+#
+#     python3 benchmarks/stub_server.py DIRECTORY [port]
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+
+# Faults injected into the responses of one supplier
+@dataclass
+class Faults:
+    # Share of requests answered with a 503
+    error_rate: float = 0.0
+    # Seconds every response is delayed
+    delay: float = 0.0
+    # Share of requests delayed by slow_delay more, the slow tail
+    slow_rate: float = 0.0
+    slow_delay: float = 0.0
+    # Answer every request with a 503
+    down: bool = False
+
+
+# Faults of every supplier by name, drawing from a seeded generator so runs
+# can be repeated
+class FaultPlan:
+    def __init__(self, seed: int = 0):
+        self._faults: Dict[str, Faults] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # Set the faults of a supplier, replacing its previous ones
+    def set(self, name: str, faults: Faults) -> None:
+        with self._lock:
+            self._faults[name] = faults
+
+    # Remove every fault
+    def clear(self) -> None:
+        with self._lock:
+            self._faults.clear()
+
+    # Draw the fate of a request to a supplier: seconds to wait and whether
+    # to fail it
+    def draw(self, name: str) -> Tuple[float, bool]:
+        with self._lock:
+            faults = self._faults.get(name)
+            if faults is None:
+                return 0.0, False
+            delay = faults.delay
+            if self._rng.random() < faults.slow_rate:
+                delay += faults.slow_delay
+            failed = faults.down or self._rng.random() < faults.error_rate
+        return delay, failed
+
+
+# Answers GET /suppliers/<name> with the feed file, supporting ETags
+class FeedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    directory = "."
+    faults: Optional[FaultPlan] = None
+
+    def do_GET(self):
+        prefix = "/suppliers/"
+        name = self.path.split("?", 1)[0]
+        # Only feeds directly in the directory are served
+        feed = name[len(prefix):]
+        path = os.path.join(self.directory, f"{feed}.json")
+        if (not name.startswith(prefix) or "/" in feed or ".." in feed
+                or not os.path.isfile(path)):
+            self._send_empty(404)
+            return
+
+        if self.faults is not None:
+            delay, failed = self.faults.draw(feed)
+            time.sleep(delay)
+            if failed:
+                self._send_empty(503)
+                return
+
+        stat = os.stat(path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send_empty(304, etag)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(stat.st_size))
+        self.send_header("ETag", etag)
+        next_page = self._next_page(feed)
+        if next_page is not None:
+            self.send_header("Link", f'<{next_page}>; rel="next"')
+        self.end_headers()
+        with open(path, "rb") as file:
+            shutil.copyfileobj(file, self.wfile, 1024 * 1024)
+
+    # Get the name of the page after a feed page, if there is one
+    def _next_page(self, feed: str) -> Optional[str]:
+        name, _, number = feed.partition(".")
+        next_page = f"{name}.{int(number or 1) + 1}"
+        if os.path.isfile(os.path.join(self.directory, f"{next_page}.json")):
+            return next_page
+        return None
+
+    # Send a response without a body
+    def _send_empty(self, status: int, etag: str = None):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+
+    # Keep benchmark output free of request logs
+    def log_message(self, format, *args):
+        pass
+
+
+# Stub server running in a background thread, for use in a with block
+class StubServer:
+    # Serve directory on a free local port unless one is given, with the
+    # faults of the plan if one is given
+    def __init__(self, directory: str, port: int = 0,
+                 faults: Optional[FaultPlan] = None):
+        handler = type("Handler", (FeedHandler, ),
+                       {"directory": os.path.abspath(directory),
+                        "faults": faults})
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+
+    # Base URL of the supplier feeds
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/suppliers"
+
+    def __enter__(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    directory = sys.argv[1]
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    with StubServer(directory, port) as server:
+        print(f"Serving {directory} at {server.url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
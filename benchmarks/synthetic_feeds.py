@@ -0,0 +1,143 @@
+# Write Acme, Patagonia and Paperflies shaped supplier feeds of any size.
+#
+#     python3 benchmarks/synthetic_feeds.py DIRECTORY [hotels] [overlap] [skew]
+#
+# Every hotel is listed by one supplier, and by all three with probability
+# overlap. Amenities are drawn from a Zipf distribution with exponent skew,
+# so a few amenities are very common, as in real feeds. Feeds are written
+# record by record, so that millions of hotels fit in constant memory.
+import json
+import os
+import random
+import sys
+from typing import Dict
+
+# Feed file name of every supplier, served as /suppliers/<name>
+SUPPLIERS = ("acme", "patagonia", "paperflies")
+
+CITIES = [("Singapore", "SG"), ("Tokyo", "JP"), ("Paris", "FR"),
+          ("Sydney", "AU"), ("New York", "US"), ("London", "GB"),
+          ("Berlin", "DE"), ("Bangkok", "TH")]
+# Amenities in decreasing popularity, with the spelling variants that
+# suppliers use for the same amenity
+AMENITIES = ["WiFi ", "wifi", "Pool", "outdoor pool", "indoor pool",
+             "BusinessCenter", "business center", " Breakfast", "Bar",
+             "DryCleaning", "dry cleaning", "tv", "TV", "Aircon", "aircon",
+             "coffee machine", "kettle", "hair dryer", "iron", "minibar",
+             "BathTub", "Tub", "bathtub", "childcare", "Parking", "Gym",
+             "Spa", "concierge", "laundry", "safe"]
+CONDITIONS = ["All children are welcome.", "Pets are not allowed.",
+              "WiFi is available in all areas and is free of charge.",
+              "Check-in starts at 3 PM.", "Breakfast is served from 6 AM."]
+
+
+# Draws amenity lists with Zipf skewed popularity
+class AmenitySampler:
+    # Compute cumulative weights once, rank r has weight 1 / r ** skew
+    def __init__(self, rng: random.Random, skew: float):
+        self._rng = rng
+        total = 0.0
+        self._cumulative = []
+        for rank in range(1, len(AMENITIES) + 1):
+            total += 1.0 / rank ** skew
+            self._cumulative.append(total)
+
+    # Draw up to count distinct amenities
+    def sample(self, count: int):
+        drawn = self._rng.choices(AMENITIES, cum_weights=self._cumulative,
+                                  k=count)
+        return list(dict.fromkeys(drawn))
+
+
+# Build the record of one hotel in the format of every supplier
+def hotel_records(rng: random.Random, sampler: AmenitySampler, index: int,
+                  destinations: int) -> Dict[str, dict]:
+    hotel_id = f"h{index}"
+    destination = 1000 + rng.randrange(destinations)
+    city, country = rng.choice(CITIES)
+    name = f"Hotel {index}"
+    address = f"{index} Main Street"
+    lat, lng = rng.uniform(-90, 90), rng.uniform(-180, 180)
+    images = [{"url": f"https://img.example/{hotel_id}/{n}.jpg",
+               "description": rng.choice(["Room", "Double room", "Bar"])}
+              for n in range(rng.randint(1, 5))]
+    return {
+        "acme": {
+            "Id": hotel_id, "DestinationId": destination, "Name": name,
+            "Latitude": lat, "Longitude": lng, "Address": address,
+            "City": city, "Country": country, "PostalCode": "000000",
+            "Description": "A hotel. " * rng.randint(5, 40),
+            "Facilities": sampler.sample(rng.randint(3, 10)),
+        },
+        "patagonia": {
+            "id": hotel_id, "destination": destination, "name": name,
+            "lat": lat, "lng": lng, "address": address,
+            "info": "Nice. " * rng.randint(5, 40),
+            "amenities": sampler.sample(rng.randint(3, 10)),
+            "images": {"rooms": images, "amenities": images[:1]},
+        },
+        "paperflies": {
+            "hotel_id": hotel_id, "destination_id": destination,
+            "hotel_name": name,
+            "location": {"address": address, "country": country},
+            "details": "Great. " * rng.randint(5, 40),
+            "amenities": {"general": sampler.sample(rng.randint(2, 8)),
+                          "room": sampler.sample(rng.randint(2, 8))},
+            "images": {"rooms": [{"link": image["url"],
+                                  "caption": image["description"]}
+                                 for image in images],
+                       "site": [{"link": images[0]["url"],
+                                 "caption": "Front"}]},
+            "booking_conditions": rng.sample(CONDITIONS,
+                                             rng.randint(0, 3)),
+        },
+    }
+
+
+# Write the feed of every supplier into directory, returning the number of
+# records written per supplier
+def write_feeds(directory: str, hotels: int, overlap: float = 0.5,
+                skew: float = 1.0, seed: int = 42) -> Dict[str, int]:
+    rng = random.Random(seed)
+    sampler = AmenitySampler(rng, skew)
+    destinations = max(1, hotels // 20)
+    os.makedirs(directory, exist_ok=True)
+    files = {name: open(os.path.join(directory, f"{name}.json"), "wb")
+             for name in SUPPLIERS}
+    counts = dict.fromkeys(SUPPLIERS, 0)
+    try:
+        for feed in files.values():
+            feed.write(b"[")
+        for index in range(hotels):
+            records = hotel_records(rng, sampler, index, destinations)
+            if rng.random() < overlap:
+                listed_by = SUPPLIERS
+            else:
+                listed_by = (rng.choice(SUPPLIERS), )
+            for name in listed_by:
+                feed = files[name]
+                if counts[name]:
+                    feed.write(b",\n")
+                feed.write(json.dumps(records[name],
+                                      ensure_ascii=False).encode("utf-8"))
+                counts[name] += 1
+        for feed in files.values():
+            feed.write(b"]\n")
+    finally:
+        for feed in files.values():
+            feed.close()
+    return counts
+
+
+def main():
+    directory = sys.argv[1]
+    hotels = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    overlap = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+    skew = float(sys.argv[4]) if len(sys.argv) > 4 else 1.0
+    counts = write_feeds(directory, hotels, overlap, skew)
+    for name, count in counts.items():
+        print(f"{name}: {count} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import sys
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Mapping, Set, Tuple
+from domain.search import amenity_key
+
+
+# Compiled amenity vocabulary. Raw amenity strings are mapped once to a
+# canonical key, used to compare amenities, and to the term that is
+# displayed. Both are interned, and the mapping is memoized in a bounded
+# cache, so merging only does dictionary lookups and set operations.
+class AmenityVocabulary:
+    # Compile the vocabulary tables
+    def __init__(self, preferred_terms: Mapping[str, str],
+                 exclude_if_specific: Mapping[str, Iterable[str]],
+                 move_to_room: Iterable[str], cache_size: int = 65536):
+        self._preferred_terms = {
+            sys.intern(key): sys.intern(term)
+            for key, term in preferred_terms.items()
+        }
+        # Generic key -> keys of the specific terms that make it redundant
+        self._specifics: Dict[str, FrozenSet[str]] = {
+            sys.intern(generic):
+            frozenset(self._normalize(specific) for specific in specifics)
+            for generic, specifics in exclude_if_specific.items()
+        }
+        # Keys of amenities that belong to the room list only
+        self.room_only: FrozenSet[str] = frozenset(
+            sys.intern(key) for key in move_to_room)
+        self._cache_size = cache_size
+        self.lookup = lru_cache(maxsize=cache_size)(self._compile)
+
+    # Pickle the tables only, the memoized lookups are rebuilt on demand
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["lookup"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.lookup = lru_cache(maxsize=self._cache_size)(self._compile)
+
+    # Get the canonical key of a raw amenity
+    def key(self, amenity: str) -> str:
+        return self.lookup(amenity)[0]
+
+    # Get the preferred term of a raw amenity
+    def term(self, amenity: str) -> str:
+        return self.lookup(amenity)[1]
+
+    # Get the key of the preferred term of a raw amenity, the same for every
+    # spelling of an amenity before and after merging
+    def canonical_key(self, amenity: str) -> str:
+        return self.key(self.term(amenity))
+
+    # Get the generic keys made redundant by specific keys present in keys
+    def redundant_generics(self, keys: Set[str]) -> Set[str]:
+        return {
+            generic for generic, specifics in self._specifics.items()
+            if generic in keys and not specifics.isdisjoint(keys)
+        }
+
+    # Compute the canonical key and preferred term of a raw amenity
+    def _compile(self, amenity: str) -> Tuple[str, str]:
+        key = self._normalize(amenity)
+        term = self._preferred_terms.get(key, amenity).lower()
+        return key, sys.intern(term)
+
+    # Normalize an amenity for comparison
+    def _normalize(self, amenity: str) -> str:
+        return sys.intern(amenity_key(amenity))
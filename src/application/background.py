@@ -0,0 +1,24 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+
+# Run function on a new daemon thread, returning the future of its result.
+# Daemon threads are not waited for when the process exits, so a request
+# still running past its deadline does not keep the process alive.
+def run_in_background(function: Callable, *args,
+                      name: Optional[str] = None) -> Future:
+    future: Future = Future()
+
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = function(*args)
+        except BaseException as error:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
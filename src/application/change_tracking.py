@@ -0,0 +1,46 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, List, Tuple
+from domain.models import Hotel
+
+
+# Hotel ids affected by one refresh
+@dataclass
+class ChangeSet:
+    added: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    # Whether the refresh changed nothing
+    @property
+    def empty(self) -> bool:
+        return not (self.added or self.updated or self.removed)
+
+
+# What was last seen in the feed of one supplier
+@dataclass
+class SupplierSnapshot:
+    # Digest of the whole feed, to skip decoding an unchanged one
+    feed_digest: bytes
+    # Parsed hotel of every record, by record fingerprint
+    hotels: Dict[bytes, Hotel]
+    # Fingerprints of the records of every hotel id, in feed order
+    records: Dict[str, Tuple[bytes, ...]]
+
+
+# Get a digest of every page of a feed, leaving the pages ready to be read
+def feed_digest(pages: List[BinaryIO]) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for body in pages:
+        for chunk in iter(lambda: body.read(64 * 1024), b""):
+            digest.update(chunk)
+        body.seek(0)
+    return digest.digest()
+
+
+# Get a fingerprint of a raw supplier record that ignores key order
+def record_fingerprint(data: Any) -> bytes:
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"),
+                         ensure_ascii=False)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).digest()
@@ -1,43 +1,449 @@
-from domain.interfaces import IHotelRepository, ISupplier, IMergeStrategy
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import (BinaryIO, Callable, Dict, Iterator, List, Optional,
+                    Sequence, Tuple)
+from application.background import run_in_background
+from application.change_tracking import (ChangeSet, SupplierSnapshot,
+                                         feed_digest, record_fingerprint)
+from domain.geo import BoundingBox
+from domain.interfaces import (IHotelReader, IHotelRepository, ISupplier,
+                               IMergeStrategy)
+from application.metrics import Metrics
+from application.query_cache import QueryCache, query_key
 from domain.models import Hotel
-from typing import List
+
+# Returned by next once a feed has no records left. None cannot be used, a
+# feed may hold null records, which must fail to parse like any bad record.
+_END = object()
+
+
+# Outcome of one ingestion run across all suppliers
+@dataclass
+class IngestReport:
+    succeeded: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    # Suppliers that could not be reached but served an earlier copy of
+    # their feed, with the reason
+    stale: Dict[str, str] = field(default_factory=dict)
+    # Suppliers whose feed failed partway, with the number of their records
+    # read and saved before the failure. They are listed in failed too.
+    incomplete: Dict[str, int] = field(default_factory=dict)
+
+    # A run is partial when at least one supplier failed or timed out
+    @property
+    def partial(self) -> bool:
+        return bool(self.failed)
+
+    # Describe every supplier that failed or is stale, one line each
+    def warnings(self) -> List[str]:
+        lines = []
+        for supplier_name, reason in self.failed.items():
+            saved = self.incomplete.get(supplier_name)
+            if saved is None:
+                lines.append(f"{supplier_name} skipped ({reason})")
+            else:
+                lines.append(f"{supplier_name} failed partway ({reason}), "
+                             f"its first {saved} records were kept")
+        for supplier_name, reason in self.stale.items():
+            lines.append(f"{supplier_name} is stale ({reason})")
+        return lines
+
+
+# Raised when the feed of a supplier fails partway, once the records read
+# before the failure are saved
+class IncompleteFeedError(Exception):
+    def __init__(self, error: Exception, saved: int):
+        super().__init__(str(error))
+        self.error = error
+        self.saved = saved
 
 
 class HotelService:
-    # Initialize hotel service with repository, suppliers, and merge strategy
-    def __init__(self, repository: IHotelRepository,
-                 suppliers: List[ISupplier], merge_strategy: IMergeStrategy):
+    # Initialize hotel service with repository, suppliers, and merge strategy.
+    # Parsed hotels are handed to the repository batch_size at a time. With
+    # more than one worker, parsing and merging run on that many processes.
+    # Time spent in every stage is recorded into metrics. The results of the
+    # last query_cache_size distinct find_hotels queries are cached until
+    # hotels are next processed or refreshed. A read-only repository can be
+    # queried but not processed or refreshed into.
+    def __init__(self, repository: IHotelReader,
+                 suppliers: List[ISupplier], merge_strategy: IMergeStrategy,
+                 batch_size: int = 1000, metrics: Optional[Metrics] = None,
+                 workers: int = 1, query_cache_size: int = 1024):
         self._repository = repository
         self._suppliers = suppliers
         self._merge_strategy = merge_strategy
+        self._batch_size = batch_size
+        self._workers = workers
+        self.metrics = metrics or Metrics()
+        # What refresh last saw from every supplier, by supplier name
+        self._snapshots: Dict[str, SupplierSnapshot] = {}
+        self._subscribers: List[Callable[[ChangeSet], None]] = []
+        self._query_cache = QueryCache(query_cache_size)
+        # Held by queries while they read the repository and by refresh
+        # while it writes to it, so that queries may run on other threads
+        # and never see a change set half applied
+        self._lock = threading.Lock()
+
+    # Process hotels from all suppliers. Feeds are downloaded concurrently,
+    # then decoded and saved one supplier at a time in bounded batches. A
+    # supplier whose feed fails partway keeps the records read before the
+    # failure and is reported as incomplete.
+    def process_hotels(self) -> IngestReport:
+        # Fail before fetching anything into a read-only repository
+        self._writable()
+        # Hotels are about to change under the cached results
+        self._query_cache.clear()
+        if self._workers > 1:
+            return self._process_sharded()
+
+        report = IngestReport()
+        for supplier, pages in self._fetch_all(report):
+            try:
+                self._ingest(supplier, pages)
+            except IncompleteFeedError as error:
+                self._fail(report, supplier, self._describe(error.error))
+                if error.saved:
+                    report.incomplete[supplier.name] = error.saved
+                continue
+            except Exception as error:
+                self._fail(report, supplier, self._describe(error))
+                continue
+            report.succeeded.append(supplier.name)
+        return report
+
+    # Process hotels from all suppliers, parsing and merging them on worker
+    # processes. The merged hotels and the report are the same as when they
+    # are processed serially, and the merged hotels in the same order.
+    def _process_sharded(self) -> IngestReport:
+        # Imported here, multiprocessing is only needed with workers
+        from application.sharded_merge import ShardedMerger
+
+        report = IngestReport()
+        fetched = list(self._fetch_all(report))
+        if not fetched:
+            return report
+
+        merger = ShardedMerger(self._suppliers, self._merge_strategy,
+                               self._workers, self.metrics)
+        with self.metrics.timer("parse_merge"):
+            merged, counts, failures = merger.merge(
+                [(self._suppliers.index(supplier), pages)
+                 for supplier, pages in fetched], self._stored)
+        for supplier, _ in fetched:
+            index = self._suppliers.index(supplier)
+            self.metrics.increment("records_parsed", counts.get(index, 0),
+                                   supplier=supplier.name)
+            if index in failures:
+                self._fail(report, supplier, self._describe(failures[index]))
+                if counts.get(index):
+                    report.incomplete[supplier.name] = counts[index]
+                continue
+            report.succeeded.append(supplier.name)
+
+        with self.metrics.timer("save"):
+            self._writable().put_all(merged)
+        return report
+
+    # Get the repository to write hotels into. Raises TypeError if it is
+    # read-only.
+    def _writable(self) -> IHotelRepository:
+        if not isinstance(self._repository, IHotelRepository):
+            raise TypeError(f"{type(self._repository).__name__} is "
+                            "read-only, hotels cannot be processed into it")
+        return self._repository
+
+    # Get the stored copies of hotels, to merge supplier records after them
+    # as save_all would
+    def _stored(self, hotel_ids: List[str]) -> List[Hotel]:
+        if not hotel_ids:
+            return []
+        return self._repository.find_by_criteria(hotel_ids, [])
+
+    # Refresh hotels from all suppliers incrementally. Records that did not
+    # change since the last refresh are neither parsed nor merged again, and
+    # only hotels with at least one changed record are merged and stored.
+    # Use either this or process_hotels on a repository, not both.
+    def refresh(self) -> Tuple[IngestReport, ChangeSet]:
+        self._writable()
+        report = IngestReport()
+        # Ids of hotels with a changed record, in first seen order
+        changed: Dict[str, None] = {}
+        for supplier, pages in self._fetch_all(report):
+            try:
+                changed.update(self._refresh_supplier(supplier, pages))
+            except Exception as error:
+                # Keep what was last seen from this supplier
+                self._fail(report, supplier, self._describe(error))
+                continue
+            report.succeeded.append(supplier.name)
 
-    # Process hotels from all suppliers
-    def process_hotels(self):
-        for supplier in self._suppliers:
-            raw_data = supplier.get_hotels()
-            hotels = [supplier.parse_hotel(item) for item in raw_data]
-            self._repository.save_all(hotels)
+        with self.metrics.timer("apply_changes"):
+            changes = self._apply_changes(list(changed))
+        if not changes.empty:
+            for subscriber in self._subscribers:
+                subscriber(changes)
+        return report, changes
 
-    # Find hotels based on criteria
-    def find_hotels(self, hotel_ids: List[str],
-                    destination_ids: List[str]) -> List[Hotel]:
-        hotels = self._repository.find_by_criteria(hotel_ids, destination_ids)
+    # Register a callback that receives the change set of every refresh
+    # that changed something
+    def subscribe(self, subscriber: Callable[[ChangeSet], None]) -> None:
+        self._subscribers.append(subscriber)
 
-        # If both hotel_ids and destination_ids are empty, return all hotels
-        if not hotel_ids and not destination_ids:
+    # Find hotels based on criteria, answering repeated queries from the
+    # cache. Queries listing the same ids or fields in another order or more
+    # than once are the same query. Results are shared with the cache, so
+    # they are returned as tuples.
+    def find_hotels(self,
+                    hotel_ids: List[str],
+                    destination_ids: List[str],
+                    fields: Optional[Sequence[str]] = None
+                    ) -> Sequence[Hotel]:
+        with self.metrics.timer("find"):
+            key = query_key(hotel_ids, destination_ids, fields)
+            hotels = self._query_cache.get(key)
+            if hotels is not None:
+                self.metrics.increment("query_cache_hits")
+                return hotels
+            self.metrics.increment("query_cache_misses")
+            with self._lock:
+                hotels = tuple(self._repository.find_by_criteria(
+                    hotel_ids, destination_ids, fields))
+                self._query_cache.put(key, hotels)
             return hotels
 
-        # Filter hotels based on criteria
-        filtered_hotels = []
-        for hotel in hotels:
-            # If hotel_ids is provided, hotel must match one of them
-            if hotel_ids and hotel.id not in hotel_ids:
+    # Find hotels within radius_km of a point, nearest first, with their
+    # distance in km
+    def find_near(self,
+                  lat: float,
+                  lng: float,
+                  radius_km: float,
+                  limit: Optional[int] = None,
+                  fields: Optional[Sequence[str]] = None
+                  ) -> List[Tuple[Hotel, float]]:
+        with self.metrics.timer("find_near"), self._lock:
+            return self._repository.find_near(lat, lng, radius_km, limit,
+                                              fields)
+
+    # Find hotels matching the id and destination criteria that have every
+    # given amenity and whose name words start with the words of name
+    def search_hotels(self,
+                      hotel_ids: List[str],
+                      destination_ids: List[str],
+                      amenities: Sequence[str] = (),
+                      name: Optional[str] = None,
+                      fields: Optional[Sequence[str]] = None) -> List[Hotel]:
+        with self.metrics.timer("search"), self._lock:
+            return self._repository.search(hotel_ids, destination_ids,
+                                           amenities, name, fields)
+
+    # Find hotels in a bounding box
+    def find_in_bbox(self,
+                     bbox: BoundingBox,
+                     fields: Optional[Sequence[str]] = None) -> List[Hotel]:
+        with self.metrics.timer("find_in_bbox"), self._lock:
+            return self._repository.find_in_bbox(bbox, fields)
+
+    # Download every supplier feed concurrently, yielding them in supplier
+    # order so merging stays deterministic. Suppliers that fail or miss
+    # their deadline are added to the report instead.
+    def _fetch_all(
+        self, report: IngestReport
+    ) -> Iterator[Tuple[ISupplier, List[BinaryIO]]]:
+        if not self._suppliers:
+            return
+
+        # Fetches run on daemon threads, one that misses its deadline is left
+        # to finish without holding up the run or the exit of the process
+        started = time.monotonic()
+        futures = [
+            run_in_background(self._fetch, supplier,
+                              name=f"fetch-{supplier.name}")
+            for supplier in self._suppliers
+        ]
+        for supplier, future in zip(self._suppliers, futures):
+            # Each supplier gets its own deadline, counted from the start
+            remaining = supplier.timeout - (time.monotonic() - started)
+            try:
+                pages = future.result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                future.add_done_callback(self._close_pages)
+                self._fail(report, supplier,
+                           f"timed out after {supplier.timeout}s")
                 continue
+            except Exception as error:
+                self._fail(report, supplier, self._describe(error))
+                continue
+            if supplier.stale_reason is not None:
+                report.stale[supplier.name] = supplier.stale_reason
+                self.metrics.increment("supplier_stale",
+                                       supplier=supplier.name)
+            yield supplier, pages
+
+    # Download the feed of a supplier, timing it
+    def _fetch(self, supplier: ISupplier) -> List[BinaryIO]:
+        with self.metrics.timer("fetch", supplier=supplier.name):
+            return supplier.fetch()
+
+    # Close the pages of a fetch that finished after its deadline
+    def _close_pages(self, future: Future) -> None:
+        if future.exception() is not None:
+            return
+        for page in future.result():
+            page.close()
 
-            # If destination_ids is provided, hotel must match one of them
-            if destination_ids and hotel.destination_id not in destination_ids:
+    # Decode, parse and save the hotels of a supplier in batches, timing
+    # each step. Decoding is the time left once parsing and saving are
+    # taken out. If the feed fails to decode or parse, the records read
+    # before the failure are saved and IncompleteFeedError is raised.
+    def _ingest(self, supplier: ISupplier, pages: List[BinaryIO]) -> None:
+        clock = time.perf_counter
+        parsing = saving = 0.0
+        records = 0
+        started = clock()
+        batch = []
+        failure: Optional[Exception] = None
+        raw_hotels = iter(supplier.get_hotels(pages))
+        while True:
+            try:
+                data = next(raw_hotels, _END)
+                if data is _END:
+                    break
+                parse_started = clock()
+                hotel = supplier.parse_hotel(data)
+                parsing += clock() - parse_started
+            except Exception as error:
+                failure = error
+                break
+            batch.append(hotel)
+            if len(batch) < self._batch_size:
                 continue
+            save_started = clock()
+            self._writable().save_all(batch)
+            saving += clock() - save_started
+            records += len(batch)
+            batch = []
+        if batch:
+            save_started = clock()
+            self._writable().save_all(batch)
+            saving += clock() - save_started
+            records += len(batch)
+
+        total = clock() - started
+        labels = {"supplier": supplier.name}
+        self.metrics.observe("decode", total - parsing - saving, **labels)
+        self.metrics.observe("parse", parsing, **labels)
+        self.metrics.observe("save", saving, **labels)
+        self.metrics.increment("records_parsed", records, **labels)
+        if failure is not None:
+            raise IncompleteFeedError(failure, records) from failure
+
+    # Record that a supplier was skipped
+    def _fail(self, report: IngestReport, supplier: ISupplier,
+              reason: str) -> None:
+        report.failed[supplier.name] = reason
+        self.metrics.increment("supplier_failures", supplier=supplier.name)
+
+    # Compare a supplier feed with what was last seen from it, returning the
+    # ids of hotels whose records changed
+    def _refresh_supplier(self, supplier: ISupplier,
+                          pages: List[BinaryIO]) -> Dict[str, None]:
+        previous = self._snapshots.get(supplier.name)
+        digest = feed_digest(pages)
+        # The whole feed is unchanged, skip decoding it
+        if previous and previous.feed_digest == digest:
+            for body in pages:
+                body.close()
+            return {}
+
+        known = previous.hotels if previous else {}
+        hotels: Dict[bytes, Hotel] = {}
+        records: Dict[str, List[bytes]] = {}
+        parsed = 0
+        with self.metrics.timer("diff", supplier=supplier.name):
+            for data in supplier.get_hotels(pages):
+                fingerprint = record_fingerprint(data)
+                hotel = hotels.get(fingerprint) or known.get(fingerprint)
+                # Only new or changed records are parsed
+                if hotel is None:
+                    hotel = supplier.parse_hotel(data)
+                    parsed += 1
+                hotels[fingerprint] = hotel
+                records.setdefault(hotel.id, []).append(fingerprint)
+        self.metrics.increment("records_parsed", parsed,
+                               supplier=supplier.name)
+
+        snapshot = SupplierSnapshot(feed_digest=digest, hotels=hotels,
+                                    records={
+                                        hotel_id: tuple(fingerprints)
+                                        for hotel_id, fingerprints in
+                                        records.items()
+                                    })
+        old_records = previous.records if previous else {}
+        changed = {
+            hotel_id: None
+            for hotel_id, fingerprints in snapshot.records.items()
+            if old_records.get(hotel_id) != fingerprints
+        }
+        # Hotels this supplier no longer lists
+        changed.update((hotel_id, None) for hotel_id in old_records
+                       if hotel_id not in snapshot.records)
+        self._snapshots[supplier.name] = snapshot
+        return changed
+
+    # Merge every changed hotel again from the records of all suppliers and
+    # store the result. Merging happens outside the lock, queries only wait
+    # for the writes.
+    def _apply_changes(self, hotel_ids: List[str]) -> ChangeSet:
+        changes = ChangeSet()
+        if not hotel_ids:
+            return changes
+
+        with self._lock:
+            stored = {
+                hotel.id: hotel
+                for hotel in self._repository.find_by_criteria(hotel_ids, [])
+            }
+        merged_hotels = []
+        for hotel_id in hotel_ids:
+            records = [
+                snapshot.hotels[fingerprint]
+                for snapshot in self._supplier_snapshots()
+                for fingerprint in snapshot.records.get(hotel_id, ())
+            ]
+            if not records:
+                if hotel_id in stored:
+                    changes.removed.append(hotel_id)
+                continue
+
+            merged = self._merge_strategy.merge_all(records)
+            existing = stored.get(hotel_id)
+            if existing is None:
+                changes.added.append(hotel_id)
+            elif existing != merged:
+                changes.updated.append(hotel_id)
+            else:
+                continue
+            merged_hotels.append(merged)
+
+        with self._lock:
+            self._writable().put_all(merged_hotels)
+            self._writable().delete_all(changes.removed)
+            # Hotels changed under the cached results
+            if not changes.empty:
+                self._query_cache.clear()
+        return changes
 
-            filtered_hotels.append(hotel)
+    # Get the snapshots of the suppliers, in supplier order
+    def _supplier_snapshots(self) -> List[SupplierSnapshot]:
+        return [
+            self._snapshots[supplier.name] for supplier in self._suppliers
+            if supplier.name in self._snapshots
+        ]
 
-        return filtered_hotels
+    # Describe an error for a report
+    def _describe(self, error: Exception) -> str:
+        return str(error) or type(error).__name__
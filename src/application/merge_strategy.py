@@ -1,6 +1,8 @@
-from typing import List, Optional
+from itertools import chain
+from typing import Iterable, List, Optional, Sequence, Tuple
 from domain.interfaces import IMergeStrategy
 from domain.models import Hotel, ImageItem, Location, Amenities, Images
+from application.amenity_vocabulary import AmenityVocabulary
 
 
 class DefaultMergeStrategy(IMergeStrategy):
@@ -16,13 +18,67 @@ class DefaultMergeStrategy(IMergeStrategy):
                                           new.description),
             amenities=self._merge_amenities(existing.amenities, new.amenities),
             images=self._merge_images(existing.images, new.images),
-            booking_conditions=list(
-                set(existing.booking_conditions + new.booking_conditions)))
+            booking_conditions=tuple(
+                dict.fromkeys(existing.booking_conditions +
+                              new.booking_conditions)))
+
+    # Merge every supplier record of one hotel at once, giving the same
+    # result as merging them pairwise in order
+    def merge_all(self, hotels: Sequence[Hotel]) -> Hotel:
+        if len(hotels) == 1:
+            return hotels[0]
+
+        first = hotels[0]
+        destination_id = first.destination_id
+        name = first.name
+        description = first.description
+        # Images by URL, keeping the first position and the last item
+        rooms, site, image_amenities = {}, {}, {}
+        booking_conditions = {}
+
+        # Later values win when they exist, as with pairwise merging
+        for hotel in hotels:
+            if hotel.destination_id:
+                destination_id = hotel.destination_id
+            if hotel.name:
+                name = hotel.name
+            if hotel.description:
+                description = hotel.description
+            for img in hotel.images.rooms:
+                rooms[img.url] = img
+            for img in hotel.images.site:
+                site[img.url] = img
+            for img in hotel.images.amenities:
+                image_amenities[img.url] = img
+            for condition in hotel.booking_conditions:
+                booking_conditions[condition] = None
+
+        return Hotel(
+            id=first.id,
+            destination_id=destination_id,
+            name=name,
+            location=self._merge_locations([h.location for h in hotels]),
+            description=description,
+            amenities=self._merge_all_amenities([h.amenities
+                                                 for h in hotels]),
+            images=Images(rooms=tuple(rooms.values()),
+                          site=tuple(site.values()),
+                          amenities=tuple(image_amenities.values())),
+            booking_conditions=tuple(booking_conditions))
 
     # Merge two values, keeping the new one if it exists
     def _merge_value(self, existing: str, new: str) -> str:
         return new if new else existing
 
+    # Merge values in order, keeping the last one that exists
+    def _merge_values(self, values: Iterable[str]) -> str:
+        iterator = iter(values)
+        result = next(iterator)
+        for value in iterator:
+            if value:
+                result = value
+        return result
+
     # Merge two location objects, keeping the new one if it exists
     def _merge_location(self, existing: Location, new: Location) -> Location:
         # If existing location is not provided, return the new one
@@ -40,6 +96,27 @@ class DefaultMergeStrategy(IMergeStrategy):
                         country=self._merge_value(existing.country,
                                                   new.country))
 
+    # Merge location objects in order into a single new location
+    def _merge_locations(self,
+                         locations: List[Location]) -> Optional[Location]:
+        # Missing locations are skipped, unless none is provided at all
+        present = [location for location in locations if location]
+        if len(present) <= 1:
+            return present[0] if present else locations[-1]
+
+        lat = lng = None
+        for location in present:
+            if location.lat is not None:
+                lat = location.lat
+            if location.lng is not None:
+                lng = location.lng
+        return Location(
+            lat=lat,
+            lng=lng,
+            address=self._merge_values(l.address for l in present),
+            city=self._merge_values(l.city for l in present),
+            country=self._merge_values(l.country for l in present))
+
     # Mapping of normalized terms to preferred display format
     PREFERRED_TERMS = {
         'businesscenter': 'business center',
@@ -58,98 +135,127 @@ class DefaultMergeStrategy(IMergeStrategy):
         'bathtub',
     }
 
+    # Initialize the strategy with the amenity vocabulary compiled from the
+    # tables above, unless one is given
+    def __init__(self, vocabulary: Optional[AmenityVocabulary] = None):
+        self._vocabulary = vocabulary or AmenityVocabulary(
+            self.PREFERRED_TERMS, self.EXCLUDE_IF_SPECIFIC, self.MOVE_TO_ROOM)
+
+    # Get the key an amenity is compared by, the key of its preferred term
+    def amenity_key(self, amenity: str) -> str:
+        return self._vocabulary.canonical_key(amenity)
+
     # Normalize and filter amenities
     def _normalize_amenity(self, amenity: str) -> str:
-        return amenity.lower().strip().replace(' ', '')
+        return self._vocabulary.key(amenity)
 
     # Get preferred term if it exists, otherwise return original in lowercase
     def _get_preferred_term(self, amenity: str) -> str:
-        normalized = self._normalize_amenity(amenity)
-        preferred = self.PREFERRED_TERMS.get(normalized, amenity)
-        return preferred.lower()
+        return self._vocabulary.term(amenity)
 
     # Filter out generic terms when specific versions exist
     def _filter_generic_terms(self, amenities: List[str]) -> List[str]:
-        result = []
-        # Normalize all amenities for comparison
-        normalized_amenities = {self._normalize_amenity(a) for a in amenities}
-
-        for amenity in amenities:
-            normalized = self._normalize_amenity(amenity)
-
-            # Check if this is a generic term that should be excluded
-            should_exclude = False
-            for generic, specifics in self.EXCLUDE_IF_SPECIFIC.items():
-                # If normalized term is generic and any specific term is present, exclude it from the list
-                if normalized == generic and any(
-                        self._normalize_amenity(specific) in
-                        normalized_amenities for specific in specifics):
-                    should_exclude = True
-                    break
-            # Add to result if not excluded
-            if not should_exclude:
-                result.append(self._get_preferred_term(amenity))
-
-        return result
+        lookup = self._vocabulary.lookup
+        compiled = [lookup(amenity) for amenity in amenities]
+        # Check which generic terms have a specific version in the list
+        redundant = self._vocabulary.redundant_generics(
+            {key for key, _ in compiled})
+        return [term for key, term in compiled if key not in redundant]
 
     # Merge two amenities objects, combining and filtering out duplicates
     def _merge_amenities(self, existing: Optional[Amenities],
                          new: Optional[Amenities]) -> Amenities:
         # Handle cases where one or both objects are None
         if not existing and not new:
-            return Amenities(general=[], room=[])
+            return Amenities(general=(), room=())
         if not existing:
             return new
         if not new:
             return existing
 
-        # To remove duplicates and keep track of original terms
-        seen_items = {}  # normalized -> original mapping
-        room_items = set()  # normalized room items
-        general_items = set()  # normalized general items
+        room, general = self._combine_amenities(existing.room, existing.general,
+                                                new.room, new.general)
+        return Amenities(general=general, room=room)
+
+    # Merge amenities objects in order into a single new amenities object.
+    # Each step works on the lists of the previous one, exactly like
+    # repeated pairwise merging but without building objects in between.
+    def _merge_all_amenities(
+            self, amenities_list: List[Optional[Amenities]]) -> Amenities:
+        result = amenities_list[0]
+        # Room and general lists, once at least two objects were combined
+        combined: Optional[Tuple[List[str], List[str]]] = None
+
+        for new in amenities_list[1:]:
+            # Handle cases where one or both objects are None
+            if combined is None and not result:
+                if new:
+                    result = new
+                else:
+                    combined = ([], [])
+                continue
+            if not new:
+                continue
+
+            room, general = combined or (result.room, result.general)
+            combined = self._combine_amenities(room, general, new.room,
+                                               new.general)
+
+        if combined is None:
+            return result
+        return Amenities(general=combined[1], room=combined[0])
+
+    # Combine existing and new room and general amenity lists, filtering out
+    # duplicates and generic terms
+    def _combine_amenities(
+            self, existing_room: Optional[Sequence[str]],
+            existing_general: Optional[Sequence[str]],
+            new_room: Optional[Sequence[str]],
+            new_general: Optional[Sequence[str]]
+    ) -> Tuple[List[str], List[str]]:
+        lookup = self._vocabulary.lookup
+        room_only = self._vocabulary.room_only
+        room_items = set()  # canonical keys of room items
+        general_items = set()  # canonical keys of general items
 
         # Process room amenities first
-        all_room = (existing.room or []) + (new.room or [])
+        all_room = chain(existing_room or (), new_room or ())
         final_room = []
 
         # Process room amenities for deduplication
         for item in all_room:
-            # Normalize and check if already seen for deduplication
-            normalized = self._normalize_amenity(item)
-            if normalized not in seen_items:
-                seen_items[normalized] = self._get_preferred_term(item)
-                room_items.add(normalized)
-                final_room.append(seen_items[normalized])
+            key, term = lookup(item)
+            if key not in room_items:
+                room_items.add(key)
+                final_room.append(term)
 
         # Process general amenities
-        all_general = (existing.general or []) + (new.general or [])
+        all_general = chain(existing_general or (), new_general or ())
         final_general = []
 
         # Process general amenities for deduplication
         for item in all_general:
-            # Normalize and check if already seen for deduplication
-            normalized = self._normalize_amenity(item)
+            key, term = lookup(item)
             # Skip if should be in room only
-            if normalized in self.MOVE_TO_ROOM:
-                if normalized not in room_items:
-                    room_items.add(normalized)
-                    final_room.append(self._get_preferred_term(item))
+            if key in room_only:
+                if key not in room_items:
+                    room_items.add(key)
+                    final_room.append(term)
                 continue
 
             # Skip if already in room
-            if normalized in room_items:
+            if key in room_items:
                 continue
 
             # Add to general if not seen for deduplication
-            if normalized not in general_items:
-                seen_items[normalized] = self._get_preferred_term(item)
-                general_items.add(normalized)
-                final_general.append(seen_items[normalized])
+            if key not in general_items:
+                general_items.add(key)
+                final_general.append(term)
 
         # Filter out generic terms
         final_general = self._filter_generic_terms(final_general)
 
-        return Amenities(general=final_general, room=final_room)
+        return final_room, final_general
 
     # Merge two images objects, combining and removing duplicates
     def _merge_images(self, existing: Images, new: Images) -> Images:
@@ -159,7 +265,7 @@ class DefaultMergeStrategy(IMergeStrategy):
                                                        new.amenities))
 
     # Merge two lists of ImageItem objects, combining and removing duplicates
-    def _merge_image_list(self, existing: List[ImageItem],
-                          new: List[ImageItem]) -> List[ImageItem]:
-        merged = {img.url: img for img in existing + new}
-        return list(merged.values())
+    def _merge_image_list(self, existing: Sequence[ImageItem],
+                          new: Sequence[ImageItem]) -> Tuple[ImageItem, ...]:
+        merged = {img.url: img for img in chain(existing, new)}
+        return tuple(merged.values())
@@ -0,0 +1,175 @@
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+from domain.interfaces import IMergeStrategy
+from domain.models import Hotel
+
+# Prefix of every metric in the Prometheus text format
+PROMETHEUS_PREFIX = "hotel_merger"
+
+# A metric name and its sorted label pairs
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+# Time spent in one stage
+@dataclass
+class TimerStats:
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+# Timers and counters taken out of metrics, to be added to other metrics
+MetricsData = Tuple[Dict[_Key, TimerStats], Dict[_Key, float]]
+
+
+# Timers and counters of every stage, labelled e.g. by supplier. Updates
+# are thread-safe, so concurrent fetches can record into the same metrics.
+class Metrics:
+    # Initialize empty timers and counters
+    def __init__(self):
+        self._timers: Dict[_Key, TimerStats] = {}
+        self._counters: Dict[_Key, float] = {}
+        self._lock = threading.Lock()
+
+    # Pickle as new, empty metrics. What another process records is sent
+    # back with drain and added with absorb.
+    def __reduce__(self):
+        return Metrics, ()
+
+    # Time the enclosed block as one observation of a timer
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    # Record seconds spent in a stage
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            stats = self._timers.get(key)
+            if stats is None:
+                stats = self._timers[key] = TimerStats()
+            stats.count += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+
+    # Add to a counter
+    def increment(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    # Set a counter to a running total kept elsewhere, e.g. by the transport
+    def set_counter(self, name: str, value: float, **labels: str) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = value
+
+    # Take every timer and counter recorded so far, leaving the metrics
+    # empty
+    def drain(self) -> MetricsData:
+        with self._lock:
+            data = self._timers, self._counters
+            self._timers, self._counters = {}, {}
+        return data
+
+    # Add timers and counters drained from other metrics, e.g. those of a
+    # worker process
+    def absorb(self, data: MetricsData) -> None:
+        timers, counters = data
+        with self._lock:
+            for key, other in timers.items():
+                stats = self._timers.get(key)
+                if stats is None:
+                    stats = self._timers[key] = TimerStats()
+                stats.count += other.count
+                stats.seconds += other.seconds
+                stats.max_seconds = max(stats.max_seconds, other.max_seconds)
+            for key, value in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    # Get every timer and counter as plain data, ready to be encoded as JSON
+    def summary(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            timers = [
+                {"name": name, "labels": dict(labels), "count": stats.count,
+                 "seconds": stats.seconds, "max_seconds": stats.max_seconds}
+                for (name, labels), stats in self._timers.items()
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self._counters.items()
+            ]
+        return {"timers": timers, "counters": counters}
+
+    # Render every timer and counter in the Prometheus text format
+    def prometheus_text(self) -> str:
+        with self._lock:
+            timers = sorted(self._timers.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        seen = set()
+        for (name, labels), stats in timers:
+            metric = f"{PROMETHEUS_PREFIX}_{name}_seconds"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} summary")
+            rendered = self._labels(labels)
+            lines.append(f"{metric}_count{rendered} {stats.count}")
+            lines.append(f"{metric}_sum{rendered} {stats.seconds!r}")
+        for (name, labels), value in counters:
+            metric = f"{PROMETHEUS_PREFIX}_{name}_total"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{self._labels(labels)} {value!r}")
+        return "\n".join(lines) + "\n"
+
+    # Build the key of a metric
+    def _key(self, name: str, labels: Dict[str, str]) -> _Key:
+        return name, tuple(sorted(labels.items()))
+
+    # Render labels as {name="value",...}
+    def _labels(self, labels: Sequence[Tuple[str, str]]) -> str:
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{name}="{self._escape(value)}"'
+                              for name, value in labels) + "}"
+
+    # Escape a label value
+    def _escape(self, value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace(
+            "\n", "\\n")
+
+
+# Merge strategy that times and counts the merges of the strategy it wraps.
+# The count of the merge timer is the number of merges performed.
+class TimedMergeStrategy(IMergeStrategy):
+    # Initialize with the strategy doing the merging
+    def __init__(self, strategy: IMergeStrategy, metrics: Metrics):
+        self._strategy = strategy
+        self._metrics = metrics
+
+    # Merge existing and new hotels
+    def merge(self, existing: Hotel, new: Hotel) -> Hotel:
+        with self._metrics.timer("merge"):
+            merged = self._strategy.merge(existing, new)
+        self._metrics.increment("records_merged", 2)
+        return merged
+
+    # Merge every supplier record of one hotel
+    def merge_all(self, hotels: Sequence[Hotel]) -> Hotel:
+        with self._metrics.timer("merge"):
+            merged = self._strategy.merge_all(hotels)
+        self._metrics.increment("records_merged", len(hotels))
+        return merged
+
+    # Get the key an amenity is compared by
+    def amenity_key(self, amenity: str) -> str:
+        return self._strategy.amenity_key(amenity)
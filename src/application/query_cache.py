@@ -0,0 +1,54 @@
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Sequence, Tuple
+from domain.models import Hotel
+
+# A query with its id sets and fields normalized: sorted, without
+# duplicates
+QueryKey = Tuple[Tuple[str, ...], Tuple[str, ...], Optional[Tuple[str, ...]]]
+
+
+# Normalize a query so that queries returning the same hotels share a key.
+# Results do not depend on the order or repetition of the ids or fields,
+# hotels are always returned in the order they were first saved.
+def query_key(hotel_ids: Iterable[str], destination_ids: Iterable[str],
+              fields: Optional[Sequence[str]] = None) -> QueryKey:
+    return (tuple(sorted(set(hotel_ids))),
+            tuple(sorted(set(destination_ids))),
+            tuple(sorted(set(fields))) if fields is not None else None)
+
+
+# Least recently used cache of query results. Results are immutable
+# tuples, so a hit returns the cached result itself without copying it. The
+# owner clears the cache whenever the hotels queried may have changed.
+class QueryCache:
+    # Initialize a cache holding at most max_entries results, 0 to disable it
+    def __init__(self, max_entries: int = 1024):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[QueryKey, Tuple[Hotel, ...]]" = \
+            OrderedDict()
+        self._lock = threading.Lock()
+
+    # Get the cached result of a query, if any
+    def get(self, key: QueryKey) -> Optional[Tuple[Hotel, ...]]:
+        with self._lock:
+            hotels = self._entries.get(key)
+            if hotels is not None:
+                self._entries.move_to_end(key)
+            return hotels
+
+    # Cache the result of a query, dropping the least recently used result
+    # once the cache is full
+    def put(self, key: QueryKey, hotels: Tuple[Hotel, ...]) -> None:
+        if self._max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = hotels
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    # Drop every cached result
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
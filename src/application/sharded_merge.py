@@ -0,0 +1,257 @@
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import (BinaryIO, Callable, Dict, List, Optional, Sequence, Set,
+                    Tuple)
+from application.metrics import Metrics, MetricsData
+from domain.interfaces import IMergeStrategy, ISupplier
+from domain.models import Hotel
+
+# Suppliers, merge strategy and metrics of a worker process, sent once when
+# it starts
+_worker_suppliers: Sequence[ISupplier] = ()
+_worker_strategy: Optional[IMergeStrategy] = None
+_worker_metrics: Optional[Metrics] = None
+
+# Position of a record in the feed of its supplier: supplier index, page
+# index, then index of the record in the page. Positions sort in feed order.
+_Position = Tuple[int, int, int]
+
+# A page spilled to a file: supplier index, page index and path
+_Page = Tuple[int, int, str]
+
+
+# Keep the suppliers, merge strategy and metrics in the worker process. The
+# merge strategy may record into the metrics, they are sent in the same
+# call so that it still does in the worker.
+def _start_worker(suppliers: Sequence[ISupplier],
+                  merge_strategy: IMergeStrategy, metrics: Metrics) -> None:
+    global _worker_suppliers, _worker_strategy, _worker_metrics
+    _worker_suppliers = suppliers
+    _worker_strategy = merge_strategy
+    _worker_metrics = metrics
+
+
+# Get the shard of a hotel id, the same in every process
+def shard_of(hotel_id: str, shards: int) -> int:
+    return zlib.crc32(hotel_id.encode("utf-8")) % shards
+
+
+# Decode one page of a supplier feed in a worker process, pickling every
+# record with its index in the page into the file of its shard, path
+# followed by the shard number. Returns the hotel ids of every shard, the
+# index and error of the record the page failed at if it did, and what the
+# worker recorded into its metrics.
+def _split_page(
+    supplier_index: int, path: str, shards: int
+) -> Tuple[List[List[str]], Optional[Tuple[int, Exception]], MetricsData]:
+    supplier = _worker_suppliers[supplier_index]
+    ids: List[List[str]] = [[] for _ in range(shards)]
+    failure = None
+    files = [open(f"{path}.{shard}", "wb") for shard in range(shards)]
+    records = 0
+    try:
+        with _worker_metrics.timer("split", supplier=supplier.name):
+            try:
+                for data in supplier.get_hotels([open(path, "rb")]):
+                    hotel_id = supplier.hotel_id(data)
+                    shard = shard_of(hotel_id, shards)
+                    ids[shard].append(hotel_id)
+                    pickle.dump((records, data), files[shard],
+                                pickle.HIGHEST_PROTOCOL)
+                    records += 1
+            except Exception as error:
+                failure = (records, error)
+    finally:
+        for file in files:
+            file.close()
+    return ids, failure, _worker_metrics.drain()
+
+
+# Parse the records of one shard in a worker process and merge them per
+# hotel, after the stored copy of the hotel if there is one. Records at or
+# after the cutoff of their supplier are left out. Returns the merged hotels
+# with the position of their first record, the number of records parsed of
+# every supplier, the position and error of the first record of every
+# supplier that failed to parse, and what the worker recorded into its
+# metrics.
+def _merge_shard(
+    pages: List[_Page], cutoffs: Dict[int, _Position], stored: List[Hotel]
+) -> Tuple[List[Tuple[_Position, Hotel]], Dict[int, int],
+           Dict[int, Tuple[_Position, Exception]], MetricsData]:
+    stored_by_id = {hotel.id: hotel for hotel in stored}
+    groups: Dict[str, List[Hotel]] = {}
+    first_seen: Dict[str, _Position] = {}
+    counts: Dict[int, int] = {}
+    failures: Dict[int, Tuple[_Position, Exception]] = {}
+    for supplier_index, page_index, path in pages:
+        if supplier_index in failures:
+            continue
+        supplier = _worker_suppliers[supplier_index]
+        cutoff = cutoffs.get(supplier_index)
+        with _worker_metrics.timer("parse", supplier=supplier.name), \
+                open(path, "rb") as file:
+            while True:
+                try:
+                    index, data = pickle.load(file)
+                except EOFError:
+                    break
+                position = (supplier_index, page_index, index)
+                # Records of a page are in order, the rest are cut off too
+                if cutoff is not None and position >= cutoff:
+                    break
+                try:
+                    hotel = supplier.parse_hotel(data)
+                except Exception as error:
+                    failures[supplier_index] = (position, error)
+                    break
+                group = groups.get(hotel.id)
+                if group is None:
+                    stored_hotel = stored_by_id.get(hotel.id)
+                    group = groups[hotel.id] = ([stored_hotel]
+                                                if stored_hotel else [])
+                    first_seen[hotel.id] = position
+                group.append(hotel)
+                counts[supplier_index] = counts.get(supplier_index, 0) + 1
+
+    merged = [(first_seen[hotel_id], _worker_strategy.merge_all(group))
+              for hotel_id, group in groups.items()]
+    return merged, counts, failures, _worker_metrics.drain()
+
+
+# Parses and merges supplier feeds on several processes, with the same
+# result as ingesting them serially. Records are partitioned by a CRC32 of
+# their hotel id, so every record of a hotel is merged by the same worker,
+# and shards are merged independently.
+#
+# Work is split in two rounds on the same workers. First every page is
+# decoded once, by whichever worker is free, and its records are pickled
+# into one file per shard: pickle loads records about twice as fast as JSON
+# decodes them, and nothing but hotel ids comes back to the parent. Then
+# every worker parses and merges the records of its shard, with the stored
+# copies of the hotels of that shard only. Suppliers and the merge strategy
+# are sent once per worker, and what workers record into the metrics is
+# added to the metrics of the parent.
+#
+# As when ingesting serially, a supplier whose feed fails partway keeps the
+# records before the first one that failed to decode or parse. A record
+# that fails to parse is only found in its shard, so the shards are merged
+# again without the records after it.
+class ShardedMerger:
+    # Initialize a merger for suppliers, merging with merge_strategy on
+    # workers processes, one shard each, and recording into metrics
+    def __init__(self, suppliers: Sequence[ISupplier],
+                 merge_strategy: IMergeStrategy, workers: int,
+                 metrics: Metrics):
+        self._suppliers = suppliers
+        self._merge_strategy = merge_strategy
+        self._workers = workers
+        self._metrics = metrics
+
+    # Merge the pages of every supplier, given by supplier index, after the
+    # stored copies of the hotels that load_stored returns for their ids.
+    # Returns the merged hotels in the order they were first seen, the
+    # number of records of every supplier merged, and the error every
+    # supplier whose feed failed partway stopped at.
+    def merge(
+        self, feeds: List[Tuple[int, List[BinaryIO]]],
+        load_stored: Callable[[List[str]], List[Hotel]]
+    ) -> Tuple[List[Hotel], Dict[int, int], Dict[int, Exception]]:
+        directory = tempfile.mkdtemp(prefix="hotel-merger-")
+        try:
+            pages = self._spill(feeds, directory)
+            # Workers are spawned rather than forked, as the parent runs
+            # fetch threads and holds open connections
+            with ProcessPoolExecutor(
+                    max_workers=self._workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_start_worker,
+                    initargs=(self._suppliers, self._merge_strategy,
+                              self._metrics)) as pool:
+                cutoffs: Dict[int, _Position] = {}
+                errors: Dict[int, Exception] = {}
+                ids = self._split(pool, pages, cutoffs, errors)
+                results = self._merge_shards(pool, pages, cutoffs, ids,
+                                             load_stored)
+                for _, _, failures, _ in results:
+                    for index, (position, error) in failures.items():
+                        self._cut(cutoffs, errors, index, position, error)
+                # Shards may have merged records after a record that failed
+                # to parse in another shard
+                if any(failures for _, _, failures, _ in results):
+                    results = self._merge_shards(pool, pages, cutoffs, ids,
+                                                 load_stored)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        positioned: List[Tuple[_Position, Hotel]] = []
+        counts: Dict[int, int] = {}
+        for merged, shard_counts, _, data in results:
+            positioned.extend(merged)
+            for index, count in shard_counts.items():
+                counts[index] = counts.get(index, 0) + count
+            self._metrics.absorb(data)
+        positioned.sort(key=lambda item: item[0])
+        return [hotel for _, hotel in positioned], counts, errors
+
+    # Decode and split every page on the pool, cutting off every supplier at
+    # the first record its feed failed at. Returns the hotel ids of every
+    # shard.
+    def _split(self, pool: ProcessPoolExecutor, pages: List[_Page],
+               cutoffs: Dict[int, _Position],
+               errors: Dict[int, Exception]) -> List[Set[str]]:
+        futures = [
+            pool.submit(_split_page, supplier_index, path, self._workers)
+            for supplier_index, _, path in pages
+        ]
+        ids: List[Set[str]] = [set() for _ in range(self._workers)]
+        for (supplier_index, page_index, _), future in zip(pages, futures):
+            page_ids, failure, data = future.result()
+            self._metrics.absorb(data)
+            for shard, shard_ids in enumerate(page_ids):
+                ids[shard].update(shard_ids)
+            if failure is not None:
+                index, error = failure
+                self._cut(cutoffs, errors, supplier_index,
+                          (supplier_index, page_index, index), error)
+        return ids
+
+    # Merge every shard on the pool, loading the stored copies of a shard
+    # while the shards before it are merged
+    def _merge_shards(self, pool: ProcessPoolExecutor, pages: List[_Page],
+                      cutoffs: Dict[int, _Position], ids: List[Set[str]],
+                      load_stored: Callable[[List[str]], List[Hotel]]):
+        futures = []
+        for shard in range(self._workers):
+            shard_pages = [(supplier_index, page_index, f"{path}.{shard}")
+                           for supplier_index, page_index, path in pages]
+            futures.append(pool.submit(_merge_shard, shard_pages, cutoffs,
+                                       load_stored(sorted(ids[shard]))))
+        return [future.result() for future in futures]
+
+    # Cut a supplier off at a record that failed, unless it already is at
+    # an earlier one
+    def _cut(self, cutoffs: Dict[int, _Position],
+             errors: Dict[int, Exception], supplier_index: int,
+             position: _Position, error: Exception) -> None:
+        cutoff = cutoffs.get(supplier_index)
+        if cutoff is None or position < cutoff:
+            cutoffs[supplier_index] = position
+            errors[supplier_index] = error
+
+    # Copy every page into a file of directory, closing the page
+    def _spill(self, feeds: List[Tuple[int, List[BinaryIO]]],
+               directory: str) -> List[_Page]:
+        pages = []
+        for supplier_index, bodies in feeds:
+            for page_index, body in enumerate(bodies):
+                path = os.path.join(directory,
+                                    f"{supplier_index}-{page_index}.json")
+                with body, open(path, "wb") as file:
+                    shutil.copyfileobj(body, file, 1024 * 1024)
+                pages.append((supplier_index, page_index, path))
+        return pages
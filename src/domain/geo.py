@@ -0,0 +1,62 @@
+import math
+from typing import Optional, Tuple
+from .models import Location
+
+# Mean radius of the Earth
+EARTH_RADIUS_KM = 6371.0088
+# Length of one degree of latitude
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# South, west, north and east edges, in degrees. A box whose west edge is
+# greater than its east edge crosses the antimeridian.
+BoundingBox = Tuple[float, float, float, float]
+
+
+# Check that a location has usable coordinates
+def has_coordinates(location: Optional[Location]) -> bool:
+    return (location is not None and location.lat is not None
+            and location.lng is not None and -90 <= location.lat <= 90
+            and -180 <= location.lng <= 180)
+
+
+# Great-circle distance between two points, in km
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2)**2 + math.cos(phi1) * math.cos(phi2) *
+         math.sin(math.radians(lng2 - lng1) / 2)**2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# Check whether a point lies in a bounding box
+def in_bbox(lat: float, lng: float, bbox: BoundingBox) -> bool:
+    south, west, north, east = bbox
+    if not south <= lat <= north:
+        return False
+    if west <= east:
+        return west <= lng <= east
+    return lng >= west or lng <= east
+
+
+# Smallest bounding box holding every point within radius_km of a point
+def radius_bbox(lat: float, lng: float, radius_km: float) -> BoundingBox:
+    delta_lat = radius_km / KM_PER_DEGREE
+    south = max(-90.0, lat - delta_lat)
+    north = min(90.0, lat + delta_lat)
+    # Near a pole the circle spans every longitude
+    if south == -90.0 or north == 90.0:
+        return south, -180.0, north, 180.0
+    delta_lng = math.degrees(
+        math.asin(min(1.0,
+                      math.sin(radius_km / EARTH_RADIUS_KM) /
+                      math.cos(math.radians(lat)))))
+    if delta_lng >= 180:
+        return south, -180.0, north, 180.0
+    west = lng - delta_lng
+    east = lng + delta_lng
+    # Wrap edges beyond the antimeridian
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return south, west, north, east
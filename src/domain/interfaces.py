@@ -1,29 +1,139 @@
 from abc import ABC, abstractmethod
-from typing import List
+from functools import reduce
+from typing import (BinaryIO, Iterable, Iterator, List, Optional, Sequence,
+                    Tuple)
+from .geo import BoundingBox, has_coordinates, haversine_km, in_bbox
 from .models import Hotel
+from .search import amenity_key, hotel_amenities, matches_name, name_tokens
 
 
 # Define interfaces for supplier
 class ISupplier(ABC):
+    # Seconds a single fetch may take before the supplier is given up on
+    timeout: float = 10.0
+    # Why the pages of the last fetch are an earlier copy of the feed rather
+    # than what the supplier sent, None when they are fresh
+    stale_reason: Optional[str] = None
+
+    @property
+    # Name used when reporting on this supplier
+    def name(self) -> str:
+        return type(self).__name__
+
+    @abstractmethod
+    # Download every page of the supplier feed, ready to be decoded
+    def fetch(self) -> List[BinaryIO]:
+        pass
+
+    @abstractmethod
+    # Get raw hotels from supplier one at a time, fetching them if no pages
+    # are given
+    def get_hotels(self,
+                   pages: Optional[List[BinaryIO]] = None) -> Iterator[dict]:
+        pass
+
+    @abstractmethod
+    # Parse a raw hotel into the common Hotel model
+    def parse_hotel(self, data: dict) -> Hotel:
+        pass
+
+    # Get the hotel id of a raw hotel without parsing the rest of it.
+    # Suppliers override this with a direct lookup.
+    def hotel_id(self, data: dict) -> str:
+        return self.parse_hotel(data).id
+
+    # Get parsed hotels from supplier one at a time
+    def iter_hotels(self,
+                    pages: Optional[List[BinaryIO]] = None) -> Iterator[Hotel]:
+        for item in self.get_hotels(pages):
+            yield self.parse_hotel(item)
+
+
+# Define interfaces for reading hotels, e.g. from a read-only catalogue
+class IHotelReader(ABC):
 
     @abstractmethod
-    # Get hotels from supplier
-    def get_hotels(self) -> List[dict]:
+    # Find hotels based on criteria. Every query takes an optional list of
+    # the hotel fields the caller needs, HEAVY_FIELDS left out of it may be
+    # None in the hotels returned so repositories can skip loading them.
+    def find_by_criteria(self,
+                         hotel_ids: List[str],
+                         destination_ids: List[str],
+                         fields: Optional[Sequence[str]] = None
+                         ) -> List[Hotel]:
         pass
 
+    # Find hotels within radius_km of a point, nearest first, with their
+    # distance in km. Repositories override this with an index, this scans
+    # every hotel.
+    def find_near(self,
+                  lat: float,
+                  lng: float,
+                  radius_km: float,
+                  limit: Optional[int] = None,
+                  fields: Optional[Sequence[str]] = None
+                  ) -> List[Tuple[Hotel, float]]:
+        matches = []
+        for hotel in self.find_by_criteria([], [], fields):
+            if not has_coordinates(hotel.location):
+                continue
+            distance = haversine_km(lat, lng, hotel.location.lat,
+                                    hotel.location.lng)
+            if distance <= radius_km:
+                matches.append((hotel, distance))
+        # Equally distant hotels stay in the order they were first saved
+        matches.sort(key=lambda match: match[1])
+        return matches[:limit] if limit is not None else matches
+
+    # Find hotels in a bounding box, in the order they were first saved.
+    # Repositories override this with an index, this scans every hotel.
+    def find_in_bbox(self,
+                     bbox: BoundingBox,
+                     fields: Optional[Sequence[str]] = None) -> List[Hotel]:
+        return [
+            hotel for hotel in self.find_by_criteria([], [], fields)
+            if has_coordinates(hotel.location)
+            and in_bbox(hotel.location.lat, hotel.location.lng, bbox)
+        ]
+
+    # Find hotels matching the id and destination criteria that have every
+    # given amenity and whose name words start with the words of name.
+    # Repositories override this with an index, this scans every match.
+    def search(self,
+               hotel_ids: List[str],
+               destination_ids: List[str],
+               amenities: Sequence[str] = (),
+               name: Optional[str] = None,
+               fields: Optional[Sequence[str]] = None) -> List[Hotel]:
+        wanted = {amenity_key(amenity) for amenity in amenities}
+        prefixes = name_tokens(name)
+        # Amenities are needed to filter on them
+        if fields is not None and wanted:
+            fields = (*fields, "amenities")
+        return [
+            hotel for hotel in self.find_by_criteria(
+                hotel_ids, destination_ids, fields)
+            if wanted.issubset(map(amenity_key, hotel_amenities(hotel)))
+            and matches_name(hotel.name, prefixes)
+        ]
+
 
 # Define interfaces for repository
-class IHotelRepository(ABC):
+class IHotelRepository(IHotelReader):
 
     @abstractmethod
     # Save hotels to repository
-    def save_all(self, hotels: List[Hotel]) -> None:
+    def save_all(self, hotels: Iterable[Hotel]) -> None:
         pass
 
     @abstractmethod
-    # Find hotels based on criteria
-    def find_by_criteria(self, hotel_ids: List[str],
-                         destination_ids: List[str]) -> List[Hotel]:
+    # Store already merged hotels as they are, replacing stored copies
+    def put_all(self, hotels: Iterable[Hotel]) -> None:
+        pass
+
+    @abstractmethod
+    # Remove hotels from repository
+    def delete_all(self, hotel_ids: Iterable[str]) -> None:
         pass
 
 
@@ -34,3 +144,13 @@ class IMergeStrategy(ABC):
     # Merge existing and new hotels
     def merge(self, existing: Hotel, new: Hotel) -> Hotel:
         pass
+
+    # Merge every supplier record of one hotel, in order. Strategies can
+    # override this to avoid building the intermediate pairwise results.
+    def merge_all(self, hotels: Sequence[Hotel]) -> Hotel:
+        return reduce(self.merge, hotels)
+
+    # Get the key an amenity is compared by, the same for every spelling
+    # the strategy merges into one amenity
+    def amenity_key(self, amenity: str) -> str:
+        return amenity_key(amenity)
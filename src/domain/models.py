@@ -1,9 +1,35 @@
+import sys
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterable, Optional, Tuple
 
 
-# Define data classes for domain models
-@dataclass
+# Intern a string shared by many hotels, so that a single copy is kept
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if type(value) is str else value
+
+
+# Store a collection as a tuple, interning its strings if asked to
+def _freeze(values: Optional[Iterable], intern: bool = False) -> Optional[tuple]:
+    if values is None:
+        return None
+    if intern:
+        try:
+            return tuple(map(sys.intern, values))
+        except TypeError:
+            # Not only strings
+            return tuple(map(_intern, values))
+    return values if type(values) is tuple else tuple(values)
+
+
+# Pickle a model as a call to its constructor, so that an unpickled copy is
+# normalized and interned in the receiving process
+def _reduce(model) -> tuple:
+    return type(model), tuple(getattr(model, name) for name in model.__slots__)
+
+
+# Define data classes for domain models. They are frozen and slotted, and
+# hold tuples instead of lists, to keep millions of hotels compact.
+@dataclass(frozen=True, slots=True)
 class Location:
     lat: Optional[float]
     lng: Optional[float]
@@ -11,27 +37,48 @@ class Location:
     city: str
     country: str
 
+    __reduce__ = _reduce
+
+    def __post_init__(self):
+        object.__setattr__(self, "city", _intern(self.city))
+        object.__setattr__(self, "country", _intern(self.country))
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class ImageItem:
     url: str
     description: Optional[str]
 
+    __reduce__ = _reduce
+
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Images:
-    rooms: List[ImageItem]
-    site: List[ImageItem]
-    amenities: List[ImageItem]
+    rooms: Tuple[ImageItem, ...]
+    site: Tuple[ImageItem, ...]
+    amenities: Tuple[ImageItem, ...]
 
+    __reduce__ = _reduce
 
-@dataclass
+    def __post_init__(self):
+        object.__setattr__(self, "rooms", _freeze(self.rooms))
+        object.__setattr__(self, "site", _freeze(self.site))
+        object.__setattr__(self, "amenities", _freeze(self.amenities))
+
+
+@dataclass(frozen=True, slots=True)
 class Amenities:
-    general: List[str]
-    room: List[str]
+    general: Tuple[str, ...]
+    room: Tuple[str, ...]
+
+    __reduce__ = _reduce
 
+    def __post_init__(self):
+        object.__setattr__(self, "general", _freeze(self.general, True))
+        object.__setattr__(self, "room", _freeze(self.room, True))
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class Hotel:
     id: str
     destination_id: str
@@ -40,4 +87,20 @@ class Hotel:
     description: str
     amenities: Amenities
     images: Images
-    booking_conditions: List[str]
+    booking_conditions: Tuple[str, ...]
+
+    __reduce__ = _reduce
+
+    def __post_init__(self):
+        object.__setattr__(self, "destination_id",
+                           _intern(self.destination_id))
+        object.__setattr__(self, "booking_conditions",
+                           _freeze(self.booking_conditions, True))
+
+
+# Names of the fields of a hotel, in the order they are output
+HOTEL_FIELDS: Tuple[str, ...] = Hotel.__slots__
+
+# Fields that are large and seldom needed, loaded only when requested
+HEAVY_FIELDS = frozenset(
+    ("description", "amenities", "images", "booking_conditions"))
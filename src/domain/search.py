@@ -0,0 +1,33 @@
+import re
+from typing import Iterator, List, Optional, Sequence
+from .models import Hotel
+
+# Words of a hotel name, letters and digits of any script
+_WORD = re.compile(r"\w+")
+
+
+# Normalize an amenity for comparison
+def amenity_key(amenity: str) -> str:
+    return amenity.lower().strip().replace(' ', '')
+
+
+# Get every amenity of a hotel, general ones first
+def hotel_amenities(hotel: Hotel) -> Iterator[str]:
+    if hotel.amenities is None:
+        return
+    yield from hotel.amenities.general
+    yield from hotel.amenities.room
+
+
+# Split a name into lowercase words
+def name_tokens(name: Optional[str]) -> List[str]:
+    return _WORD.findall(name.lower()) if name else []
+
+
+# Check that every query word starts a word of a name, so that a partly
+# typed name matches
+def matches_name(name: Optional[str], prefixes: Sequence[str]) -> bool:
+    tokens = name_tokens(name)
+    return all(
+        any(token.startswith(prefix) for token in tokens)
+        for prefix in prefixes)
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import BinaryIO, List, Optional, Tuple
+from infrastructure.http_transport import (CHUNK_SIZE, CachedResponse,
+                                           ResponseCache)
+
+
+# Default location of the on-disk supplier response cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache",
+                                 "hotel-merger")
+
+
+# Keep raw supplier responses on disk, keyed by URL, so that they survive
+# between runs. Entries younger than the TTL are served without revalidation
+# and the least recently used entries are evicted once the total size of the
+# stored payloads exceeds max_bytes.
+class DiskResponseCache(ResponseCache):
+    # Initialize the cache in the given directory
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR,
+                 ttl: float = 300.0, max_bytes: int = 256 * 1024 * 1024):
+        self._directory = directory
+        self.ttl = ttl
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    # Get the cached response for a URL, if any
+    def get(self, url: str) -> Optional[CachedResponse]:
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+            size = os.path.getsize(body_path)
+        except (OSError, ValueError):
+            return None
+
+        # Guard against a hash collision or a half-written entry
+        if meta.get("url") != url or meta.get("size") != size:
+            return None
+        return CachedResponse(etag=meta.get("etag"),
+                              last_modified=meta.get("last_modified"),
+                              stored_at=meta.get("stored_at", 0.0),
+                              size=size, next_url=meta.get("next_url"))
+
+    # Open the cached payload of a URL, if it is still there
+    def open(self, url: str) -> Optional[BinaryIO]:
+        meta_path, body_path = self._paths(url)
+        with self._lock:
+            try:
+                body = open(body_path, "rb")
+                # Mark the entry as recently used for eviction
+                os.utime(meta_path)
+            except OSError:
+                return None
+        return body
+
+    # Store the response for a URL and evict old entries if needed
+    def put(self, url: str, entry: CachedResponse, body: BinaryIO) -> None:
+        meta_path, body_path = self._paths(url)
+        with self._lock:
+            self._write(body_path,
+                        lambda file: shutil.copyfileobj(body, file,
+                                                        CHUNK_SIZE))
+            self._write_meta(meta_path, url, entry)
+            self._evict()
+
+    # Record that a cached response was revalidated, keeping its payload
+    def touch(self, url: str, entry: CachedResponse) -> None:
+        meta_path, _ = self._paths(url)
+        with self._lock:
+            self._write_meta(meta_path, url, entry)
+
+    # Get the metadata and payload paths of a URL
+    def _paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self._directory, key)
+        return base + ".meta", base + ".body"
+
+    # Write the metadata of an entry
+    def _write_meta(self, meta_path: str, url: str,
+                    entry: CachedResponse) -> None:
+        meta = json.dumps({
+            "url": url,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+            "stored_at": entry.stored_at,
+            "size": entry.size,
+            "next_url": entry.next_url,
+        }).encode("utf-8")
+        self._write(meta_path, lambda file: file.write(meta))
+
+    # Write a file atomically so readers never see a partial entry
+    def _write(self, path: str, write) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                write(file)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    # Remove least recently used entries until the cache fits in max_bytes
+    def _evict(self) -> None:
+        entries: List[Tuple[float, int, str]] = []
+        total = 0
+        for name in os.listdir(self._directory):
+            if not name.endswith(".meta"):
+                continue
+            meta_path = os.path.join(self._directory, name)
+            body_path = meta_path[:-len(".meta")] + ".body"
+            try:
+                used_at = os.path.getmtime(meta_path)
+                size = os.path.getsize(body_path)
+            except OSError:
+                continue
+            entries.append((used_at, size, meta_path))
+            total += size
+
+        for _, size, meta_path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            for path in (meta_path, meta_path[:-len(".meta")] + ".body"):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
@@ -0,0 +1,132 @@
+import math
+from typing import Dict, Iterator, List, Tuple
+from domain.geo import (BoundingBox, EARTH_RADIUS_KM, haversine_km, in_bbox,
+                        radius_bbox)
+
+# NumPy is optional, distances are computed one point at a time without it
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# Cell key: row and column of the grid
+_Cell = Tuple[int, int]
+
+
+# Grid index over hotel coordinates. Points are bucketed into cells of
+# cell_degrees, so a radius or bounding-box query only looks at the points
+# of the cells the query overlaps. With NumPy, the coordinates of every cell
+# are kept as arrays and candidates are checked in vectorized form.
+class GeoIndex:
+    # Initialize an empty index
+    def __init__(self, cell_degrees: float = 0.25):
+        self._cell_degrees = cell_degrees
+        self._columns = math.ceil(360 / cell_degrees)
+        # Cell -> hotel id -> latitude and longitude
+        self._cells: Dict[_Cell, Dict[str, Tuple[float, float]]] = {}
+        self._cell_of: Dict[str, _Cell] = {}
+        # Cell -> ids, latitudes and longitudes in radians, built on demand
+        self._arrays: Dict[_Cell, tuple] = {}
+
+    # Number of hotels indexed
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    # Add a hotel, or move it if it is already indexed
+    def add(self, hotel_id: str, lat: float, lng: float) -> None:
+        self.remove(hotel_id)
+        cell = self._cell(lat, lng)
+        self._cells.setdefault(cell, {})[hotel_id] = (lat, lng)
+        self._cell_of[hotel_id] = cell
+        self._arrays.pop(cell, None)
+
+    # Remove a hotel, if it is indexed
+    def remove(self, hotel_id: str) -> None:
+        cell = self._cell_of.pop(hotel_id, None)
+        if cell is None:
+            return
+        points = self._cells[cell]
+        del points[hotel_id]
+        if not points:
+            del self._cells[cell]
+        self._arrays.pop(cell, None)
+
+    # Find hotels within radius_km of a point, with their distance in km,
+    # in no particular order
+    def near(self, lat: float, lng: float,
+             radius_km: float) -> List[Tuple[str, float]]:
+        matches = []
+        for cell in self._overlapping(radius_bbox(lat, lng, radius_km)):
+            if numpy is not None:
+                hotel_ids, lats, lngs = self._cell_arrays(cell)
+                distances = self._haversine_array(lat, lng, lats, lngs)
+                for index in numpy.flatnonzero(distances <= radius_km):
+                    matches.append((hotel_ids[index], float(distances[index])))
+                continue
+            for hotel_id, (point_lat, point_lng) in self._cells[cell].items():
+                distance = haversine_km(lat, lng, point_lat, point_lng)
+                if distance <= radius_km:
+                    matches.append((hotel_id, distance))
+        return matches
+
+    # Find hotels in a bounding box, in no particular order
+    def within(self, bbox: BoundingBox) -> List[str]:
+        matches = []
+        for cell in self._overlapping(bbox):
+            matches.extend(hotel_id
+                           for hotel_id, (lat, lng) in self._cells[cell].items()
+                           if in_bbox(lat, lng, bbox))
+        return matches
+
+    # Get the cell of a point. Longitude 180 falls in the last column rather
+    # than wrapping around, as bounding boxes compare longitudes as numbers.
+    def _cell(self, lat: float, lng: float) -> _Cell:
+        row = math.floor(lat / self._cell_degrees)
+        column = min(math.floor((lng + 180) / self._cell_degrees),
+                     self._columns - 1)
+        return row, column
+
+    # Yield the occupied cells overlapping a bounding box
+    def _overlapping(self, bbox: BoundingBox) -> Iterator[_Cell]:
+        south, west, north, east = bbox
+        first_row, west_column = self._cell(south, west)
+        last_row, east_column = self._cell(north, east)
+        if west <= east:
+            columns = east_column - west_column + 1
+        else:
+            columns = self._columns - west_column + east_column + 1
+        columns = min(columns, self._columns)
+        cells = (last_row - first_row + 1) * columns
+
+        # Scan occupied cells when there are fewer of them than in the box
+        if cells > len(self._cells):
+            for cell in self._cells:
+                row, column = cell
+                offset = (column - west_column) % self._columns
+                if first_row <= row <= last_row and offset < columns:
+                    yield cell
+            return
+        for row in range(first_row, last_row + 1):
+            for offset in range(columns):
+                cell = (row, (west_column + offset) % self._columns)
+                if cell in self._cells:
+                    yield cell
+
+    # Get the ids and coordinates in radians of the hotels of a cell
+    def _cell_arrays(self, cell: _Cell) -> tuple:
+        arrays = self._arrays.get(cell)
+        if arrays is None:
+            points = self._cells[cell]
+            coordinates = numpy.radians(
+                numpy.array(list(points.values()), dtype=float))
+            arrays = (list(points), coordinates[:, 0], coordinates[:, 1])
+            self._arrays[cell] = arrays
+        return arrays
+
+    # Great-circle distances from a point to arrays of points in radians
+    def _haversine_array(self, lat: float, lng: float, lats, lngs):
+        phi = math.radians(lat)
+        a = (numpy.sin((lats - phi) / 2)**2 + math.cos(phi) * numpy.cos(lats) *
+             numpy.sin((lngs - math.radians(lng)) / 2)**2)
+        return 2 * EARTH_RADIUS_KM * numpy.arcsin(
+            numpy.minimum(1.0, numpy.sqrt(a)))
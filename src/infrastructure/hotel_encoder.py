@@ -0,0 +1,93 @@
+import json
+from typing import BinaryIO, Dict, Iterable, Optional, Sequence, Tuple
+from domain.models import Hotel
+from infrastructure.serialization import hotel_to_dict
+
+# Output formats, by name
+FORMATS = ("json", "ndjson", "compact")
+
+
+# Encodes hotels as JSON once and keeps the bytes, so that responses are
+# built by joining cached fragments. A cached fragment is reused only while
+# the repository still holds the very hotel it was encoded from, a merged
+# hotel replacing it is encoded again.
+class HotelEncoder:
+    # Initialize an encoder for one of FORMATS. The json format is indented
+    # like json.dumps(hotels, indent=2, ensure_ascii=False). Without cache,
+    # fragments are dropped once written, for hotels written only once.
+    # With fields, a projection checked by project_fields, only those fields
+    # of every hotel are encoded.
+    def __init__(self,
+                 output_format: str = "compact",
+                 cache: bool = True,
+                 fields: Optional[Sequence[str]] = None):
+        if output_format not in FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}")
+        self._format = output_format
+        self._fields = fields
+        if output_format == "json":
+            self._encoder = json.JSONEncoder(indent=2, ensure_ascii=False)
+        else:
+            self._encoder = json.JSONEncoder(separators=(",", ":"),
+                                             ensure_ascii=False)
+        self._caching = cache
+        # Hotel id -> hotel and its encoded fragment
+        self._cache: Dict[str, Tuple[Hotel, bytes]] = {}
+
+    # Encode a hotel, reusing the cached fragment if it is still current
+    def encode(self, hotel: Hotel) -> bytes:
+        cached = self._cache.get(hotel.id)
+        if cached is not None and cached[0] is hotel:
+            return cached[1]
+        text = self._encoder.encode(hotel_to_dict(hotel, self._fields))
+        # Fragments are stored as array elements, indented one level. JSON
+        # strings escape newlines, so every newline is between tokens.
+        if self._format == "json":
+            text = text.replace("\n", "\n  ")
+        fragment = text.encode("utf-8")
+        if self._caching:
+            self._cache[hotel.id] = (hotel, fragment)
+        return fragment
+
+    # Encode hotels ahead of the queries that will return them
+    def encode_all(self, hotels: Iterable[Hotel]) -> None:
+        for hotel in hotels:
+            self.encode(hotel)
+
+    # Drop the cached fragments of hotels no longer returned
+    def forget(self, hotel_ids: Iterable[str]) -> None:
+        for hotel_id in hotel_ids:
+            self._cache.pop(hotel_id, None)
+
+    # Encode hotels as one document
+    def encode_document(self, hotels: Iterable[Hotel]) -> bytes:
+        return b"".join(self._document_parts(hotels))
+
+    # Write hotels to a stream as they are encoded, without building the
+    # whole document
+    def write(self, hotels: Iterable[Hotel], stream: BinaryIO) -> None:
+        for part in self._document_parts(hotels):
+            stream.write(part)
+
+    # Yield the parts of a document, ending with a newline
+    def _document_parts(self, hotels: Iterable[Hotel]) -> Iterable[bytes]:
+        if self._format == "ndjson":
+            for hotel in hotels:
+                yield self.encode(hotel)
+                yield b"\n"
+            return
+
+        indented = self._format == "json"
+        separator = b",\n  " if indented else b","
+        empty = True
+        for hotel in hotels:
+            if empty:
+                yield b"[\n  " if indented else b"["
+                empty = False
+            else:
+                yield separator
+            yield self.encode(hotel)
+        if empty:
+            yield b"[]\n"
+        else:
+            yield b"\n]\n" if indented else b"]\n"
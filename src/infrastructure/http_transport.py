@@ -0,0 +1,232 @@
+import io
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, replace
+from typing import BinaryIO, Dict, Optional
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Size of the chunks read from the network and from cached bodies
+CHUNK_SIZE = 64 * 1024
+
+
+# Traffic counters for a single supplier
+@dataclass
+class TransferStats:
+    requests: int = 0
+    not_modified: int = 0
+    # Responses served from the cache without touching the network
+    cache_hits: int = 0
+    # Bytes as received from the network, before decompression
+    bytes_on_wire: int = 0
+    # Bytes of the decoded response bodies
+    bytes_decoded: int = 0
+
+
+# Validators of the last successful response for a URL
+@dataclass
+class CachedResponse:
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # Unix time the payload was last fetched or revalidated
+    stored_at: float = field(default_factory=time.time)
+    # Size of the decoded payload in bytes
+    size: int = 0
+    # URL of the next page of a paginated feed
+    next_url: Optional[str] = None
+
+
+# A fetched document, with its body ready to be read from the start
+@dataclass
+class FetchedPage:
+    body: BinaryIO
+    next_url: Optional[str] = None
+    not_modified: bool = False
+    from_cache: bool = False
+
+
+# Define interface for storage of previously fetched responses
+class ResponseCache(ABC):
+    # Seconds a response is served without revalidation
+    ttl: float = 0.0
+
+    @abstractmethod
+    # Get the cached response for a URL, if any
+    def get(self, url: str) -> Optional[CachedResponse]:
+        pass
+
+    @abstractmethod
+    # Open the cached payload of a URL, if it is still there
+    def open(self, url: str) -> Optional[BinaryIO]:
+        pass
+
+    @abstractmethod
+    # Store the response for a URL, copying the payload from body
+    def put(self, url: str, entry: CachedResponse, body: BinaryIO) -> None:
+        pass
+
+    @abstractmethod
+    # Record that a cached response was revalidated by the supplier
+    def touch(self, url: str, entry: CachedResponse) -> None:
+        pass
+
+
+# Keep the last response of every URL in memory. Payloads larger than
+# max_entry_bytes are not kept, so that big feeds never sit in memory.
+class MemoryResponseCache(ResponseCache):
+    def __init__(self, max_entry_bytes: int = 16 * 1024 * 1024):
+        self._entries: Dict[str, CachedResponse] = {}
+        self._payloads: Dict[str, bytes] = {}
+        self._max_entry_bytes = max_entry_bytes
+        self._lock = threading.Lock()
+
+    # Get the cached response for a URL, if any
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(url)
+            return replace(entry) if entry else None
+
+    # Open the cached payload of a URL, if it is still there
+    def open(self, url: str) -> Optional[BinaryIO]:
+        with self._lock:
+            payload = self._payloads.get(url)
+        return io.BytesIO(payload) if payload is not None else None
+
+    # Store the response for a URL, copying the payload from body
+    def put(self, url: str, entry: CachedResponse, body: BinaryIO) -> None:
+        if entry.size > self._max_entry_bytes:
+            return
+        payload = body.read()
+        with self._lock:
+            self._entries[url] = replace(entry)
+            self._payloads[url] = payload
+
+    # Record that a cached response was revalidated by the supplier
+    def touch(self, url: str, entry: CachedResponse) -> None:
+        with self._lock:
+            if url in self._entries:
+                self._entries[url] = replace(entry)
+
+
+# Shared HTTP transport with pooled keep-alive connections, compression and
+# conditional requests. Bodies are streamed into spooled temporary files, so
+# at most spool_size bytes of a response are held in memory.
+class HttpTransport:
+    # Initialize the session, its connection pool and the response cache.
+    # With refresh set, cached responses are neither served nor revalidated.
+    def __init__(self, pool_size: int = 10,
+                 cache: Optional[ResponseCache] = None,
+                 refresh: bool = False, spool_size: int = 1024 * 1024):
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers["Accept-Encoding"] = "gzip, deflate"
+        self._cache = cache if cache is not None else MemoryResponseCache()
+        self._refresh = refresh
+        self._spool_size = spool_size
+        self._stats: Dict[str, TransferStats] = {}
+        self._lock = threading.Lock()
+
+    # Fetch a document, revalidating a previously seen response if possible
+    def fetch(self, url: str, name: str, timeout: float) -> FetchedPage:
+        cached = None if self._refresh else self._cache.get(url)
+
+        # Still fresh, no need to ask the supplier at all
+        if cached and time.time() - cached.stored_at < self._cache.ttl:
+            body = self._cache.open(url)
+            if body is not None:
+                with self._lock:
+                    stats = self._stats.setdefault(name, TransferStats())
+                    stats.cache_hits += 1
+                return FetchedPage(body, cached.next_url, from_cache=True)
+
+        headers = {}
+        if cached:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        with self._session.get(url, headers=headers, timeout=timeout,
+                               stream=True) as response:
+            # Unchanged since last time, reuse the cached payload
+            if response.status_code == 304 and cached:
+                body = self._cache.open(url)
+                if body is not None:
+                    self._record(name, response, 0, not_modified=True)
+                    cached.stored_at = time.time()
+                    self._cache.touch(url, cached)
+                    return FetchedPage(body, cached.next_url,
+                                       not_modified=True)
+            else:
+                response.raise_for_status()
+                return self._download(url, name, response)
+
+        # The payload was evicted in the meantime, fetch it unconditionally
+        with self._session.get(url, timeout=timeout,
+                               stream=True) as response:
+            response.raise_for_status()
+            return self._download(url, name, response)
+
+    # Stream a response body into a spooled file and the cache
+    def _download(self, url: str, name: str,
+                  response: requests.Response) -> FetchedPage:
+        body = tempfile.SpooledTemporaryFile(max_size=self._spool_size)
+        decoded = 0
+        try:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                body.write(chunk)
+                decoded += len(chunk)
+            self._record(name, response, decoded)
+
+            next_url = response.links.get("next", {}).get("url")
+            if next_url:
+                next_url = urljoin(response.url, next_url)
+
+            body.seek(0)
+            self._cache.put(url, CachedResponse(
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                size=decoded, next_url=next_url), body)
+            body.seek(0)
+        except BaseException:
+            body.close()
+            raise
+        return FetchedPage(body, next_url)
+
+    # Get a snapshot of the traffic counters per supplier
+    def stats(self) -> Dict[str, TransferStats]:
+        with self._lock:
+            return {name: replace(stats)
+                    for name, stats in self._stats.items()}
+
+    # Update the traffic counters of a supplier
+    def _record(self, name: str, response: requests.Response,
+                decoded: int, not_modified: bool = False) -> None:
+        # The raw stream counts what was read from the socket, i.e. compressed
+        on_wire = response.raw.tell() if response.raw is not None else decoded
+        with self._lock:
+            stats = self._stats.setdefault(name, TransferStats())
+            stats.requests += 1
+            stats.not_modified += int(not_modified)
+            stats.bytes_on_wire += on_wire
+            stats.bytes_decoded += decoded
+
+
+_default_transport: Optional[HttpTransport] = None
+_default_transport_lock = threading.Lock()
+
+
+# Get the transport shared by all suppliers
+def default_transport() -> HttpTransport:
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+        return _default_transport
@@ -0,0 +1,82 @@
+import codecs
+import json
+import re
+from typing import Any, BinaryIO, Iterator
+from infrastructure.http_transport import CHUNK_SIZE
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Characters that may follow an array element
+_DELIMITERS = frozenset(" \t\n\r,]")
+
+
+# Decode the elements of a top-level JSON array one at a time, reading the
+# stream in chunks so that only the element being decoded is held in memory
+def iter_json_array(stream: BinaryIO,
+                    chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    # JSON is UTF-8, a leading byte order mark is tolerated
+    text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    position = 0
+    finished = False
+    started = False
+    # Right after "[", where the array may still turn out to be empty
+    first = True
+    # After "[" or ",", where the next token must be a value
+    expect_value = True
+
+    while True:
+        position = _WHITESPACE.match(buffer, position).end()
+
+        # Need more input before the next token can be read
+        if position == len(buffer):
+            if finished:
+                raise ValueError("Unexpected end of JSON array")
+            chunk = stream.read(chunk_size)
+            finished = not chunk
+            buffer = text_decoder.decode(chunk, finished)
+            position = 0
+            continue
+
+        char = buffer[position]
+        if not started:
+            if char != "[":
+                raise ValueError("Expected a JSON array")
+            started = True
+            position += 1
+            continue
+        if char == "]" and (first or not expect_value):
+            return
+        if char == "," and not expect_value:
+            expect_value = True
+            position += 1
+            continue
+        if not expect_value:
+            raise ValueError(f"Expected ',' or ']' but found {char!r}")
+
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+            # A value not followed by a delimiter may be cut short, e.g. the
+            # "1" of "1.5" when the chunk ends in the middle of the number
+            complete = finished or (end < len(buffer) and
+                                    buffer[end] in _DELIMITERS)
+        except json.JSONDecodeError:
+            if finished:
+                raise
+            complete = False
+
+        # Read at least as much again as is buffered, so that retrying a
+        # large element stays linear in its size
+        if not complete:
+            buffered = buffer[position:]
+            chunk = stream.read(max(chunk_size, len(buffered)))
+            finished = not chunk
+            buffer = buffered + text_decoder.decode(chunk, finished)
+            position = 0
+            continue
+
+        yield value
+        position = end
+        first = False
+        expect_value = False
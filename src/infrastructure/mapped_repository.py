@@ -0,0 +1,330 @@
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from bisect import bisect_left
+from typing import (BinaryIO, Dict, Iterable, List, Optional, Sequence,
+                    Tuple)
+from domain.geo import BoundingBox, has_coordinates, haversine_km, in_bbox
+from domain.interfaces import IHotelReader, IMergeStrategy
+from domain.models import HEAVY_FIELDS, Hotel
+from domain.search import hotel_amenities, matches_name, name_tokens
+from application.merge_strategy import DefaultMergeStrategy
+from infrastructure.serialization import hotel_from_dict, hotel_to_dict
+
+# A catalogue file is laid out as follows, integers little-endian:
+#
+#   header        magic, version, hotel and destination counts, offsets of
+#                 the sections below
+#   positions     per hotel, in the order hotels were first saved: offset
+#                 of its record, lengths of its light and heavy parts, lat
+#                 and lng (NaN if unknown)
+#   ids           per hotel, sorted by id: offset and length of the id in
+#                 keys, position of the hotel
+#   destinations  per destination, sorted by id: offset and length of the
+#                 id in keys, start and count of its hotels in members
+#   members       positions of the hotels of every destination, in order
+#   keys          hotel and destination ids, UTF-8
+#   records       every hotel as two compact JSON objects, UTF-8: the light
+#                 part holds every field but HEAVY_FIELDS, the heavy part
+#                 follows it with HEAVY_FIELDS
+#
+# Everything but the records is an index of fixed-size entries, so lookups
+# bisect the mapped file and only the records returned are decoded. The
+# heavy part of a record is only decoded if a heavy field is wanted.
+MAGIC = b"HOTELCAT"
+VERSION = 2
+
+_HEADER = struct.Struct("<8sIIIQQQQQ")
+_POSITION = struct.Struct("<QIIdd")
+_ID = struct.Struct("<QII")
+_DESTINATION = struct.Struct("<QIII")
+_MEMBER = struct.Struct("<I")
+
+
+# Write hotels into a catalogue file, in the order given, replacing the file
+# atomically. Hotels are read once: their records are encoded and written
+# into a temporary file one at a time while the indexes are built in
+# memory, then the indexes are written and the records copied after them.
+def write_catalogue(path: str, hotels: Iterable[Hotel]) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryFile(dir=directory) as records:
+        # Positions with record offsets from the start of records
+        entries = bytearray()
+        ids: List[Tuple[str, int]] = []
+        members: Dict[str, List[int]] = {}
+        offset = 0
+        for position, hotel in enumerate(hotels):
+            data = hotel_to_dict(hotel)
+            light = _encode({name: value for name, value in data.items()
+                             if name not in HEAVY_FIELDS})
+            heavy = _encode({name: data[name] for name in HEAVY_FIELDS})
+            records.write(light)
+            records.write(heavy)
+            lat = lng = math.nan
+            if has_coordinates(hotel.location):
+                lat, lng = hotel.location.lat, hotel.location.lng
+            entries += _POSITION.pack(offset, len(light), len(heavy), lat,
+                                      lng)
+            offset += len(light) + len(heavy)
+            ids.append((hotel.id, position))
+            members.setdefault(hotel.destination_id, []).append(position)
+        records.seek(0)
+        _assemble(path, entries, ids, members, records)
+
+
+# Encode part of a record as compact JSON
+def _encode(data: dict) -> bytes:
+    return json.dumps(data, separators=(",", ":"),
+                      ensure_ascii=False).encode("utf-8")
+
+
+# Write the header and indexes of a catalogue followed by its records,
+# replacing the file at path atomically
+def _assemble(path: str, entries: bytearray, ids: List[Tuple[str, int]],
+              members: Dict[str, List[int]], records: BinaryIO) -> None:
+    keys = bytearray()
+    key_offsets: Dict[str, Tuple[int, int]] = {}
+
+    # Store every id once in keys
+    def key(value: str) -> Tuple[int, int]:
+        entry = key_offsets.get(value)
+        if entry is None:
+            encoded = value.encode("utf-8")
+            entry = key_offsets[value] = (len(keys), len(encoded))
+            keys.extend(encoded)
+        return entry
+
+    count = len(ids)
+    sorted_ids = sorted((hotel_id.encode("utf-8"), key(hotel_id), position)
+                        for hotel_id, position in ids)
+    destinations = sorted(
+        (destination_id.encode("utf-8"), key(destination_id), positions)
+        for destination_id, positions in members.items())
+
+    positions_offset = _HEADER.size
+    ids_offset = positions_offset + _POSITION.size * count
+    destinations_offset = ids_offset + _ID.size * count
+    members_offset = (destinations_offset +
+                      _DESTINATION.size * len(destinations))
+    keys_offset = members_offset + _MEMBER.size * count
+    records_offset = keys_offset + len(keys)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(_HEADER.pack(MAGIC, VERSION, count, len(destinations),
+                                    positions_offset, ids_offset,
+                                    destinations_offset, members_offset,
+                                    keys_offset))
+            for offset, light, heavy, lat, lng in _POSITION.iter_unpack(
+                    entries):
+                file.write(_POSITION.pack(records_offset + offset, light,
+                                          heavy, lat, lng))
+            for _, (start, length), position in sorted_ids:
+                file.write(_ID.pack(start, length, position))
+            first = 0
+            for _, (start, length), positions in destinations:
+                file.write(_DESTINATION.pack(start, length, first,
+                                             len(positions)))
+                first += len(positions)
+            for _, _, positions in destinations:
+                for position in positions:
+                    file.write(_MEMBER.pack(position))
+            file.write(keys)
+            shutil.copyfileobj(records, file, 1024 * 1024)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+# Read-only repository over a catalogue file written by write_catalogue,
+# mapped into memory. Opening it reads nothing but the header, whatever the
+# size of the catalogue, and queries decode only the hotels they return.
+class MappedHotelRepository(IHotelReader):
+    # Map the catalogue file at path. Raises ValueError if it is not one.
+    def __init__(self, path: str,
+                 merge_strategy: Optional[IMergeStrategy] = None):
+        self._merge_strategy = merge_strategy or DefaultMergeStrategy()
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            self._map.close()
+            raise ValueError(f"{path} is not a hotel catalogue")
+        (magic, version, self._count, self._destination_count,
+         self._positions_offset, self._ids_offset, self._destinations_offset,
+         self._members_offset, self._keys_offset) = _HEADER.unpack_from(
+             self._map)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} hotel "
+                             "catalogue")
+
+    # Find hotels based on criteria, decoding only the hotels found
+    def find_by_criteria(self,
+                         hotel_ids: List[str],
+                         destination_ids: List[str],
+                         fields: Optional[Sequence[str]] = None
+                         ) -> List[Hotel]:
+        if hotel_ids:
+            matches = {
+                position for position in map(self._position, set(hotel_ids))
+                if position is not None
+            }
+            if destination_ids:
+                members = set()
+                for destination_id in set(destination_ids):
+                    members.update(self._members(destination_id))
+                matches &= members
+            positions = sorted(matches)
+        elif destination_ids:
+            matches = set()
+            for destination_id in set(destination_ids):
+                matches.update(self._members(destination_id))
+            positions = sorted(matches)
+        else:
+            positions = range(self._count)
+        return [self._hotel(position, fields) for position in positions]
+
+    # Find hotels within radius_km of a point, nearest first, with their
+    # distance in km. Coordinates are read from the positions section.
+    def find_near(self,
+                  lat: float,
+                  lng: float,
+                  radius_km: float,
+                  limit: Optional[int] = None,
+                  fields: Optional[Sequence[str]] = None
+                  ) -> List[Tuple[Hotel, float]]:
+        matches = []
+        for position, hotel_lat, hotel_lng in self._coordinates():
+            distance = haversine_km(lat, lng, hotel_lat, hotel_lng)
+            if distance <= radius_km:
+                matches.append((distance, position))
+        # Equally distant hotels stay in the order they were first saved
+        matches.sort()
+        if limit is not None:
+            matches = matches[:limit]
+        return [(self._hotel(position, fields), distance)
+                for distance, position in matches]
+
+    # Find hotels in a bounding box, in the order they were first saved
+    def find_in_bbox(self,
+                     bbox: BoundingBox,
+                     fields: Optional[Sequence[str]] = None) -> List[Hotel]:
+        return [
+            self._hotel(position, fields)
+            for position, lat, lng in self._coordinates()
+            if in_bbox(lat, lng, bbox)
+        ]
+
+    # Find hotels matching the id and destination criteria that have every
+    # given amenity and whose name words start with the words of name,
+    # comparing amenities by the keys of the merge strategy
+    def search(self,
+               hotel_ids: List[str],
+               destination_ids: List[str],
+               amenities: Sequence[str] = (),
+               name: Optional[str] = None,
+               fields: Optional[Sequence[str]] = None) -> List[Hotel]:
+        amenity_key = self._merge_strategy.amenity_key
+        wanted = {amenity_key(amenity) for amenity in amenities}
+        prefixes = name_tokens(name)
+        # Amenities are needed to filter on them
+        if fields is not None and wanted:
+            fields = (*fields, "amenities")
+        return [
+            hotel for hotel in self.find_by_criteria(
+                hotel_ids, destination_ids, fields)
+            if wanted.issubset(map(amenity_key, hotel_amenities(hotel)))
+            and matches_name(hotel.name, prefixes)
+        ]
+
+    # Unmap the catalogue file
+    def close(self) -> None:
+        self._map.close()
+
+    # Get the position of a hotel by bisecting the ids section
+    def _position(self, hotel_id: str) -> Optional[int]:
+        index = self._bisect(self._ids_offset, _ID, self._count,
+                             hotel_id.encode("utf-8"))
+        if index is None:
+            return None
+        return _ID.unpack_from(self._map,
+                               self._ids_offset + index * _ID.size)[2]
+
+    # Get the positions of the hotels of a destination by bisecting the
+    # destinations section
+    def _members(self, destination_id: str) -> Sequence[int]:
+        index = self._bisect(self._destinations_offset, _DESTINATION,
+                             self._destination_count,
+                             destination_id.encode("utf-8"))
+        if index is None:
+            return ()
+        _, _, first, number = _DESTINATION.unpack_from(
+            self._map, self._destinations_offset + index * _DESTINATION.size)
+        start = self._members_offset + first * _MEMBER.size
+        return struct.unpack_from(f"<{number}I", self._map, start)
+
+    # Find the entry of a sorted section whose key is target
+    def _bisect(self, offset: int, entry: struct.Struct, count: int,
+                target: bytes) -> Optional[int]:
+        index = bisect_left(_Keys(self, offset, entry, count), target)
+        if index < count and self._key(offset, entry, index) == target:
+            return index
+        return None
+
+    # Get the key of an entry of a sorted section
+    def _key(self, offset: int, entry: struct.Struct, index: int) -> bytes:
+        start, length = entry.unpack_from(self._map,
+                                          offset + index * entry.size)[:2]
+        start += self._keys_offset
+        return self._map[start:start + length]
+
+    # Yield the position and coordinates of every hotel that has them
+    def _coordinates(self):
+        # A view of the map, slicing the map itself would copy the section
+        section = memoryview(self._map)[self._positions_offset:
+                                        self._ids_offset]
+        for position, (_, _, _, lat, lng) in enumerate(
+                _POSITION.iter_unpack(section)):
+            if not math.isnan(lat):
+                yield position, lat, lng
+
+    # Decode the hotel at a position. The heavy part of its record is only
+    # decoded if fields include a heavy field, and heavy fields left out of
+    # fields are neither decoded nor built.
+    def _hotel(self, position: int,
+               fields: Optional[Sequence[str]] = None) -> Hotel:
+        offset, light, heavy, _, _ = _POSITION.unpack_from(
+            self._map, self._positions_offset + position * _POSITION.size)
+        data = json.loads(self._map[offset:offset + light])
+        wanted = (HEAVY_FIELDS if fields is None
+                  else HEAVY_FIELDS.intersection(fields))
+        heavy_data = {}
+        if wanted:
+            start = offset + light
+            heavy_data = json.loads(self._map[start:start + heavy])
+        for name in HEAVY_FIELDS:
+            data[name] = heavy_data[name] if name in wanted else None
+        return hotel_from_dict(data)
+
+
+# Keys of a sorted section as a sequence, for bisect
+class _Keys:
+    def __init__(self, repository: MappedHotelRepository, offset: int,
+                 entry: struct.Struct, count: int):
+        self._repository = repository
+        self._offset = offset
+        self._entry = entry
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> bytes:
+        return self._repository._key(self._offset, self._entry, index)
@@ -0,0 +1,38 @@
+import cProfile
+import os
+import pstats
+import tracemalloc
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+# Frames kept per traced allocation
+TRACEMALLOC_FRAMES = 10
+
+
+# Run a function under cProfile and tracemalloc, writing the reports into
+# directory once it returns or raises:
+#   cpu.pstats   raw profile, for pstats or snakeviz
+#   cpu.txt      functions with the most cumulative time
+#   memory.txt   peak traced memory and the lines that allocated the most
+def run_profiled(function: Callable[[], T], directory: str,
+                 top: int = 50) -> T:
+    os.makedirs(directory, exist_ok=True)
+    profiler = cProfile.Profile()
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    try:
+        return profiler.runcall(function)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler.dump_stats(os.path.join(directory, "cpu.pstats"))
+        with open(os.path.join(directory, "cpu.txt"), "w") as report:
+            stats = pstats.Stats(profiler, stream=report)
+            stats.sort_stats("cumulative").print_stats(top)
+        with open(os.path.join(directory, "memory.txt"), "w") as report:
+            report.write(f"peak traced: {peak} bytes\n"
+                         f"still traced: {current} bytes\n\n")
+            for statistic in snapshot.statistics("lineno")[:top]:
+                report.write(f"{statistic}\n")
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import sys
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from application.change_tracking import ChangeSet
+from application.hotel_service import HotelService
+from application.metrics import Metrics
+from infrastructure.hotel_encoder import HotelEncoder
+from infrastructure.serialization import project_fields
+
+# Longest request line or header line accepted
+MAX_LINE = 8 * 1024
+# Most header lines accepted in one request
+MAX_HEADERS = 100
+
+JSON = "application/json; charset=utf-8"
+PROMETHEUS_TEXT = "text/plain; version=0.0.4; charset=utf-8"
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 500: "Internal Server Error",
+            503: "Service Unavailable"}
+
+
+# Local HTTP server that keeps merged hotels warm and answers
+# GET /hotels?hotel_ids=...&destination_ids=... from memory, and
+# GET /metrics in the Prometheus text format. Suppliers are refreshed in
+# the background with HotelService.refresh, which merges again only the
+# hotels whose records changed, then writes them under the lock of the
+# service so that queries never see a change set half applied. Queries wait
+# for that write only, not for fetching or merging, and run off the event
+# loop so that other connections are answered meanwhile. A supplier that
+# fails keeps the hotels last seen from it.
+class QueryServer:
+    # Initialize the server over a service whose repository only its
+    # refreshes write to. after_refresh is called once every refresh is
+    # done, e.g. to record metrics kept elsewhere.
+    def __init__(self, service: HotelService,
+                 host: str = "127.0.0.1", port: int = 8080,
+                 refresh_interval: float = 300.0,
+                 metrics: Optional[Metrics] = None,
+                 after_refresh: Optional[Callable[[], None]] = None):
+        self._service = service
+        self._host = host
+        self._port = port
+        self._refresh_interval = refresh_interval
+        self._metrics = metrics or Metrics()
+        self._after_refresh = after_refresh
+        # Encoded hotels of the service, kept current by its change sets
+        self._encoder = HotelEncoder()
+        service.subscribe(self._encode_changes)
+        self._loaded = False
+
+    # Load hotels, then serve queries until cancelled
+    async def serve_forever(self) -> None:
+        await self.refresh()
+        server = await asyncio.start_server(self._handle, self._host,
+                                            self._port)
+        refresher = asyncio.create_task(self._refresh_periodically())
+        addresses = ", ".join(
+            f"{host}:{port}"
+            for host, port, *_ in (s.getsockname() for s in server.sockets))
+        print(f"Serving hotels on {addresses}", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refresher.cancel()
+
+    # Fetch every supplier and apply what changed off the event loop
+    async def refresh(self) -> None:
+        try:
+            with self._metrics.timer("refresh"):
+                report, _ = await asyncio.to_thread(self._service.refresh)
+        except Exception as error:
+            print(f"Warning: refresh failed ({error})", file=sys.stderr)
+            return
+        finally:
+            if self._after_refresh is not None:
+                self._after_refresh()
+        for warning in report.warnings():
+            print(f"Warning: {warning}", file=sys.stderr)
+        self._loaded = True
+
+    # Encode the hotels a refresh added or updated rather than on the first
+    # query returning them, and drop the fragments of removed ones
+    def _encode_changes(self, changes: ChangeSet) -> None:
+        self._encoder.forget(changes.removed)
+        self._encoder.encode_all(self._service.find_hotels(
+            changes.added + changes.updated, []))
+
+    # Refresh suppliers every refresh_interval seconds
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._refresh_interval)
+            await self.refresh()
+
+    # Answer the requests of one connection, keeping it open if asked to
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, keep_alive = request
+                # Queries may wait for a refresh to write its changes
+                status, body, content_type = await asyncio.to_thread(
+                    self._respond, method, target)
+                writer.write(self._encode_response(status, body, keep_alive,
+                                                   content_type))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ValueError as error:
+            writer.write(
+                self._encode_response(400, self._error(str(error)), False))
+        except ConnectionError:
+            pass
+        except Exception as error:
+            print(f"Warning: request failed ({error!r})", file=sys.stderr)
+            writer.write(self._encode_response(
+                500, self._error("Internal server error"), False))
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    # Read the request line and headers, returning the method, target and
+    # whether the connection should be kept open, or None at end of stream
+    async def _read_request(
+            self, reader: asyncio.StreamReader
+    ) -> Optional[Tuple[str, str, bool]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if len(line) > MAX_LINE:
+            raise ValueError("Request line too long")
+        parts = line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise ValueError("Malformed request line")
+        method, target, version = parts
+
+        connection = ""
+        for _ in range(MAX_HEADERS):
+            header = await reader.readline()
+            if len(header) > MAX_LINE:
+                raise ValueError("Header line too long")
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            if name.strip().lower() == "connection":
+                connection = value.strip().lower()
+        else:
+            raise ValueError("Too many headers")
+
+        # HTTP/1.1 keeps connections open unless told otherwise
+        if version == "HTTP/1.1":
+            keep_alive = connection != "close"
+        else:
+            keep_alive = connection == "keep-alive"
+        return method, target, keep_alive
+
+    # Compute the status, body and content type answering a request
+    def _respond(self, method: str, target: str) -> Tuple[int, bytes, str]:
+        if method != "GET":
+            return 405, self._error("Only GET is supported"), JSON
+        url = urlsplit(target)
+        if url.path == "/metrics":
+            return (200, self._metrics.prometheus_text().encode("utf-8"),
+                    PROMETHEUS_TEXT)
+        if url.path != "/hotels":
+            return 404, self._error(f"Unknown path {url.path}"), JSON
+        if not self._loaded:
+            return 503, self._error("Hotels are not loaded yet"), JSON
+
+        encoder = self._encoder
+        query = parse_qs(url.query)
+        # Projections are encoded per request, the cached fragments hold
+        # every field
+        if "fields" in query:
+            try:
+                fields = project_fields(
+                    name.strip() for value in query["fields"]
+                    for name in value.split(",") if name.strip())
+            except ValueError as error:
+                return 400, self._error(str(error)), JSON
+            encoder = HotelEncoder(cache=False, fields=fields)
+        hotels = self._service.find_hotels(
+            self._parse_ids(query.get("hotel_ids")),
+            self._parse_ids(query.get("destination_ids")))
+        with self._metrics.timer("encode"):
+            body = encoder.encode_document(hotels)
+        return 200, body, JSON
+
+    # Parse comma separated ids, where none means no filter as on the
+    # command line
+    def _parse_ids(self, values: Optional[List[str]]) -> List[str]:
+        ids = []
+        for value in values or []:
+            if value.lower() == "none":
+                continue
+            ids.extend(id.strip() for id in value.split(",") if id.strip())
+        return ids
+
+    # Encode an error as a JSON body
+    def _error(self, message: str) -> bytes:
+        return json.dumps({"error": message}).encode("utf-8")
+
+    # Encode an HTTP response
+    def _encode_response(self, status: int, payload: bytes, keep_alive: bool,
+                         content_type: str = JSON) -> bytes:
+        head = (f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                "\r\n")
+        return head.encode("latin-1") + payload
@@ -1,35 +1,517 @@
-from typing import List, Dict
-from domain.interfaces import IHotelRepository
-from domain.models import Hotel
+import json
+import sqlite3
+import threading
+from itertools import count, islice
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from domain.geo import (BoundingBox, has_coordinates, haversine_km, in_bbox,
+                        radius_bbox)
+from domain.interfaces import IHotelRepository, IMergeStrategy
+from domain.models import HEAVY_FIELDS, Hotel
+from domain.search import matches_name, name_tokens
 from application.merge_strategy import DefaultMergeStrategy
+from infrastructure.geo_index import GeoIndex
+from infrastructure.search_index import SearchIndex, contains
+from infrastructure.serialization import (hotel_to_dict, location_from_dict,
+                                          amenities_from_dict,
+                                          images_from_dict)
 
 
 class InMemoryHotelRepository(IHotelRepository):
-    # Initialize in-memory repository
-    def __init__(self):
+    # Initialize in-memory repository. At most max_pending supplier records
+    # are staged before they are merged.
+    def __init__(self, merge_strategy: Optional[IMergeStrategy] = None,
+                 max_pending: int = 100000):
         self._hotels: Dict[str, Hotel] = {}
-        self._merge_strategy = DefaultMergeStrategy()
+        # Insertion position of every hotel, to return results in that order
+        self._positions: Dict[str, int] = {}
+        self._next_position = count()
+        # Secondary index from destination id to the ids of its hotels
+        self._by_destination: Dict[str, Set[str]] = {}
+        # Spatial index over the coordinates of every hotel that has them,
+        # built by the first geo query and dropped once a location changes,
+        # so that repositories never queried by location do not hold it
+        self._geo: Optional[GeoIndex] = None
+        # Supplier records saved since the last merge, per hotel id
+        self._pending: Dict[str, List[Hotel]] = {}
+        self._pending_records = 0
+        self._max_pending = max_pending
+        self._merge_strategy = merge_strategy or DefaultMergeStrategy()
+        # Inverted index over amenities and name words, by position, built
+        # by the first search and dropped once amenities or names change
+        self._search: Optional[SearchIndex] = None
 
-    # Save hotels to repository
-    def save_all(self, hotels: List[Hotel]) -> None:
+    # Save hotels to repository. Records are staged per hotel and merged
+    # all at once when the repository is next read, or sooner once
+    # max_pending of them are staged.
+    def save_all(self, hotels: Iterable[Hotel]) -> None:
         for hotel in hotels:
-            # Check if hotel already exists
-            if hotel.id in self._hotels:
-                # Merge with existing hotel data
-                merged = self._merge_strategy.merge(self._hotels[hotel.id],
-                                                    hotel)
-                self._hotels[hotel.id] = merged
-            else:
-                # New hotel
-                self._hotels[hotel.id] = hotel
-
-    # Find hotels based on criteria
-    def find_by_criteria(self, hotel_ids: List[str],
-                         destination_ids: List[str]) -> List[Hotel]:
-        results = []
-        # Filter hotels based on criteria
-        for hotel in self._hotels.values():
-            if (not hotel_ids or hotel.id in hotel_ids) and \
-               (not destination_ids or hotel.destination_id in destination_ids):
-                results.append(hotel)
-        return results
+            if self._pending_records >= self._max_pending:
+                self._merge_pending()
+            self._pending_records += 1
+            records = self._pending.get(hotel.id)
+            if records is not None:
+                records.append(hotel)
+                continue
+            self._pending[hotel.id] = [hotel]
+            # New hotel
+            if hotel.id not in self._positions:
+                self._positions[hotel.id] = next(self._next_position)
+
+    # Store already merged hotels as they are, replacing stored copies
+    def put_all(self, hotels: Iterable[Hotel]) -> None:
+        # Staged records must not be merged over the replacements later
+        self._merge_pending()
+        for hotel in hotels:
+            existing = self._hotels.get(hotel.id)
+            if existing is None:
+                self._positions[hotel.id] = next(self._next_position)
+            self._hotels[hotel.id] = hotel
+            self._reindex(existing, hotel)
+
+    # Remove hotels from repository
+    def delete_all(self, hotel_ids: Iterable[str]) -> None:
+        self._merge_pending()
+        for hotel_id in hotel_ids:
+            existing = self._hotels.pop(hotel_id, None)
+            if existing is None:
+                continue
+            self._unindex(existing)
+            del self._positions[hotel_id]
+
+    # Find hotels based on criteria. Hotels are returned whole, as they are
+    # held in memory and nothing is copied whatever the fields.
+    def find_by_criteria(self,
+                         hotel_ids: List[str],
+                         destination_ids: List[str],
+                         fields: Optional[Sequence[str]] = None
+                         ) -> List[Hotel]:
+        self._merge_pending()
+
+        # If both hotel_ids and destination_ids are empty, return all hotels
+        if not hotel_ids and not destination_ids:
+            return list(self._hotels.values())
+
+        if hotel_ids:
+            # Look the requested ids up directly
+            matches = set(hotel_ids).intersection(self._hotels)
+            if destination_ids:
+                destinations = set(destination_ids)
+                matches = {
+                    hotel_id for hotel_id in matches
+                    if self._hotels[hotel_id].destination_id in destinations
+                }
+        else:
+            # Collect the hotels of every requested destination
+            matches = set()
+            for destination_id in set(destination_ids):
+                matches |= self._by_destination.get(destination_id, set())
+
+        # Keep results in the order hotels were first saved
+        return [
+            self._hotels[hotel_id]
+            for hotel_id in sorted(matches, key=self._positions.__getitem__)
+        ]
+
+    # Find hotels within radius_km of a point, nearest first, with their
+    # distance in km
+    def find_near(self,
+                  lat: float,
+                  lng: float,
+                  radius_km: float,
+                  limit: Optional[int] = None,
+                  fields: Optional[Sequence[str]] = None
+                  ) -> List[Tuple[Hotel, float]]:
+        matches = self._geo_index().near(lat, lng, radius_km)
+        # Equally distant hotels stay in the order they were first saved
+        matches.sort(key=lambda match: (match[1], self._positions[match[0]]))
+        if limit is not None:
+            matches = matches[:limit]
+        return [(self._hotels[hotel_id], distance)
+                for hotel_id, distance in matches]
+
+    # Find hotels in a bounding box, in the order they were first saved
+    def find_in_bbox(self,
+                     bbox: BoundingBox,
+                     fields: Optional[Sequence[str]] = None) -> List[Hotel]:
+        return [
+            self._hotels[hotel_id] for hotel_id in sorted(
+                self._geo_index().within(bbox),
+                key=self._positions.__getitem__)
+        ]
+
+    # Find hotels matching the id and destination criteria that have every
+    # given amenity and whose name words start with the words of name
+    def search(self,
+               hotel_ids: List[str],
+               destination_ids: List[str],
+               amenities: Sequence[str] = (),
+               name: Optional[str] = None,
+               fields: Optional[Sequence[str]] = None) -> List[Hotel]:
+        if not amenities and not name_tokens(name):
+            return self.find_by_criteria(hotel_ids, destination_ids)
+        index = self._search_index()
+        bitmap = index.match(amenities, name)
+        if not hotel_ids and not destination_ids:
+            # Positions increase with the order hotels were first saved
+            return [
+                self._hotels[hotel_id] for hotel_id in index.hotel_ids(bitmap)
+            ]
+        return [
+            hotel
+            for hotel in self.find_by_criteria(hotel_ids, destination_ids)
+            if contains(bitmap, self._positions[hotel.id])
+        ]
+
+    # Merge the staged supplier records of every hotel in a single pass
+    def _merge_pending(self) -> None:
+        for hotel_id, records in self._pending.items():
+            existing = self._hotels.get(hotel_id)
+            # Check if hotel already exists, to merge with its data
+            if existing is not None:
+                records.insert(0, existing)
+            merged = self._merge_strategy.merge_all(records)
+            self._hotels[hotel_id] = merged
+            self._reindex(existing, merged)
+        self._pending.clear()
+        self._pending_records = 0
+
+    # Add a merged hotel to the destination index, moving it if its
+    # destination changed, and drop the search and geo indexes if what they
+    # index changed
+    def _reindex(self, existing: Optional[Hotel], merged: Hotel) -> None:
+        if (existing is None or existing.amenities != merged.amenities
+                or existing.name != merged.name):
+            self._search = None
+
+        if existing is None or existing.location != merged.location:
+            self._geo = None
+
+        if existing is None:
+            self._by_destination.setdefault(merged.destination_id,
+                                            set()).add(merged.id)
+            return
+        if existing.destination_id == merged.destination_id:
+            return
+        self._unindex_destination(existing)
+        self._by_destination.setdefault(merged.destination_id,
+                                        set()).add(merged.id)
+
+    # Remove a hotel from the indexes
+    def _unindex(self, hotel: Hotel) -> None:
+        self._unindex_destination(hotel)
+        if has_coordinates(hotel.location):
+            self._geo = None
+        self._search = None
+
+    # Get the spatial index of the merged hotels, building it if there is
+    # none
+    def _geo_index(self) -> GeoIndex:
+        self._merge_pending()
+        if self._geo is None:
+            self._geo = GeoIndex()
+            for hotel in self._hotels.values():
+                if has_coordinates(hotel.location):
+                    self._geo.add(hotel.id, hotel.location.lat,
+                                  hotel.location.lng)
+        return self._geo
+
+    # Get the search index of the merged hotels, building it if there is
+    # none
+    def _search_index(self) -> SearchIndex:
+        self._merge_pending()
+        if self._search is None:
+            self._search = SearchIndex(self._merge_strategy.amenity_key)
+            for hotel_id, hotel in self._hotels.items():
+                self._search.add(self._positions[hotel_id], hotel)
+        return self._search
+
+    # Remove a hotel from the destination index
+    def _unindex_destination(self, hotel: Hotel) -> None:
+        hotel_ids = self._by_destination[hotel.destination_id]
+        hotel_ids.discard(hotel.id)
+        if not hotel_ids:
+            del self._by_destination[hotel.destination_id]
+
+
+class SqliteHotelRepository(IHotelRepository):
+    # Columns of the hotels table, in the order rows are read and written
+    _COLUMNS = ("id", "destination_id", "name", "lat", "lng", "location",
+                "description", "amenities", "images", "booking_conditions")
+
+    # Initialize a repository persisted in an SQLite database file
+    def __init__(self, path: str,
+                 merge_strategy: Optional[IMergeStrategy] = None,
+                 batch_size: int = 1000):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._merge_strategy = merge_strategy or DefaultMergeStrategy()
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            # Rows keep their rowid on upsert, so ordering by rowid returns
+            # hotels in the order they were first saved
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS hotels (
+                    id TEXT PRIMARY KEY,
+                    destination_id TEXT NOT NULL,
+                    name TEXT,
+                    lat REAL,
+                    lng REAL,
+                    location TEXT,
+                    description TEXT,
+                    amenities TEXT,
+                    images TEXT,
+                    booking_conditions TEXT
+                )""")
+            self._connection.execute("""
+                CREATE INDEX IF NOT EXISTS hotels_destination_id
+                ON hotels (destination_id)""")
+            self._connection.execute("""
+                CREATE INDEX IF NOT EXISTS hotels_lat_lng
+                ON hotels (lat, lng)""")
+
+    # Save hotels to repository, merging them with stored copies
+    def save_all(self, hotels: Iterable[Hotel]) -> None:
+        iterator = iter(hotels)
+        with self._lock, self._connection:
+            while True:
+                batch = list(islice(iterator, self._batch_size))
+                if not batch:
+                    return
+                self._upsert(batch)
+
+    # Store already merged hotels as they are, replacing stored copies
+    def put_all(self, hotels: Iterable[Hotel]) -> None:
+        iterator = iter(hotels)
+        with self._lock, self._connection:
+            while True:
+                batch = list(islice(iterator, self._batch_size))
+                if not batch:
+                    return
+                self._write(batch)
+
+    # Remove hotels from repository
+    def delete_all(self, hotel_ids: Iterable[str]) -> None:
+        hotel_ids = list(hotel_ids)
+        if not hotel_ids:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM hotels "
+                "WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(hotel_ids), ))
+
+    # Find hotels based on criteria, reading only the heavy columns of the
+    # fields requested
+    def find_by_criteria(self,
+                         hotel_ids: List[str],
+                         destination_ids: List[str],
+                         fields: Optional[Sequence[str]] = None
+                         ) -> List[Hotel]:
+        conditions, parameters = self._criteria(hotel_ids, destination_ids)
+        return [
+            self._from_row(row)
+            for row in self._select(conditions, parameters, fields)
+        ]
+
+    # Find hotels within radius_km of a point, nearest first, with their
+    # distance in km
+    def find_near(self,
+                  lat: float,
+                  lng: float,
+                  radius_km: float,
+                  limit: Optional[int] = None,
+                  fields: Optional[Sequence[str]] = None
+                  ) -> List[Tuple[Hotel, float]]:
+        # The index narrows the search down to the bounding box of the
+        # circle, distances are checked on the rows found
+        matches = []
+        for row in self._select_bbox(radius_bbox(lat, lng, radius_km),
+                                     fields):
+            distance = haversine_km(lat, lng, row[3], row[4])
+            if distance <= radius_km:
+                matches.append((distance, row))
+        # Rows come in rowid order, so equally distant hotels stay in the
+        # order they were first saved
+        matches.sort(key=lambda match: match[0])
+        if limit is not None:
+            matches = matches[:limit]
+        return [(self._from_row(row), distance) for distance, row in matches]
+
+    # Find hotels in a bounding box, in the order they were first saved
+    def find_in_bbox(self,
+                     bbox: BoundingBox,
+                     fields: Optional[Sequence[str]] = None) -> List[Hotel]:
+        return [
+            self._from_row(row) for row in self._select_bbox(bbox, fields)
+        ]
+
+    # Find hotels matching the id and destination criteria that have every
+    # given amenity and whose name words start with the words of name
+    def search(self,
+               hotel_ids: List[str],
+               destination_ids: List[str],
+               amenities: Sequence[str] = (),
+               name: Optional[str] = None,
+               fields: Optional[Sequence[str]] = None) -> List[Hotel]:
+        prefixes = name_tokens(name)
+        if not amenities and not prefixes:
+            return self.find_by_criteria(hotel_ids, destination_ids, fields)
+        # Amenities are needed to filter on them
+        if fields is not None and amenities:
+            fields = (*fields, "amenities")
+        conditions, parameters = self._criteria(hotel_ids, destination_ids)
+        # Name words are narrowed down in SQL, then matched word by word.
+        # LIKE only ignores the case of ASCII letters.
+        for prefix in prefixes:
+            if prefix.isascii():
+                conditions.append("name LIKE ? ESCAPE '\\'")
+                parameters.append("%" + prefix.replace("\\", "\\\\").replace(
+                    "%", "\\%").replace("_", "\\_") + "%")
+        rows = self._select(conditions, parameters, fields)
+
+        # Amenities are compared by the keys of the merge strategy, only the
+        # amenities column is decoded until a row matches
+        amenity_key = self._merge_strategy.amenity_key
+        wanted = {amenity_key(amenity) for amenity in amenities}
+        matches = []
+        for row in rows:
+            if not matches_name(row[2], prefixes):
+                continue
+            if wanted:
+                stored = json.loads(row[7]) or {}
+                keys = {
+                    amenity_key(amenity)
+                    for amenity in (stored.get("general") or []) +
+                    (stored.get("room") or [])
+                }
+                if not wanted.issubset(keys):
+                    continue
+            matches.append(self._from_row(row))
+        return matches
+
+    # Close the database connection
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    # Merge a batch of hotels with their stored copies and write them back
+    def _upsert(self, batch: List[Hotel]) -> None:
+        stored = self._load([hotel.id for hotel in batch])
+
+        # Collect every record of a hotel, stored copy first, and merge them
+        # in one pass
+        records: Dict[str, List[Hotel]] = {}
+        for hotel in batch:
+            if hotel.id not in records:
+                stored_hotel = stored.get(hotel.id)
+                records[hotel.id] = ([stored_hotel]
+                                     if stored_hotel is not None else [])
+            records[hotel.id].append(hotel)
+        self._write([
+            self._merge_strategy.merge_all(hotel_records)
+            for hotel_records in records.values()
+        ])
+
+    # Insert hotels, or replace the stored copies while keeping their rowid
+    def _write(self, hotels: List[Hotel]) -> None:
+        placeholders = ", ".join("?" for _ in self._COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}"
+                            for column in self._COLUMNS[1:])
+        self._connection.executemany(
+            f"INSERT INTO hotels ({', '.join(self._COLUMNS)}) "
+            f"VALUES ({placeholders}) "
+            f"ON CONFLICT (id) DO UPDATE SET {updates}",
+            [self._to_row(hotel) for hotel in hotels])
+
+    # Build the conditions selecting hotels by id and destination. Id lists
+    # are passed as one JSON parameter, whatever their length.
+    def _criteria(self, hotel_ids: List[str],
+                  destination_ids: List[str]) -> Tuple[List[str], List[Any]]:
+        conditions = []
+        parameters: List[Any] = []
+        if hotel_ids:
+            conditions.append("id IN (SELECT value FROM json_each(?))")
+            parameters.append(json.dumps(hotel_ids))
+        if destination_ids:
+            conditions.append(
+                "destination_id IN (SELECT value FROM json_each(?))")
+            parameters.append(json.dumps(destination_ids))
+        return conditions, parameters
+
+    # Select the rows matching every condition, in rowid order. The heavy
+    # columns of fields left out are selected as NULL, so they are never
+    # read and rows keep the layout of _COLUMNS.
+    def _select(self,
+                conditions: List[str],
+                parameters: List[Any],
+                fields: Optional[Sequence[str]] = None
+                ) -> List[Sequence[Any]]:
+        columns = self._COLUMNS
+        if fields is not None:
+            columns = [
+                column if column not in HEAVY_FIELDS or column in fields
+                else "NULL" for column in self._COLUMNS
+            ]
+        query = f"SELECT {', '.join(columns)} FROM hotels"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY rowid"
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchall()
+
+    # Select the rows of the hotels in a bounding box, in rowid order
+    def _select_bbox(self,
+                     bbox: BoundingBox,
+                     fields: Optional[Sequence[str]] = None
+                     ) -> List[Sequence[Any]]:
+        south, west, north, east = bbox
+        # A box crossing the antimeridian holds both ends of the longitudes
+        if west <= east:
+            longitudes = "lng BETWEEN ? AND ?"
+        else:
+            longitudes = "(lng >= ? OR lng <= ?)"
+        rows = self._select(["lat BETWEEN ? AND ?", longitudes],
+                            [south, north, west, east], fields)
+        return [row for row in rows if in_bbox(row[3], row[4], bbox)]
+
+    # Load the stored copies of the given hotels
+    def _load(self, hotel_ids: Sequence[str]) -> Dict[str, Hotel]:
+        rows = self._connection.execute(
+            f"SELECT {', '.join(self._COLUMNS)} FROM hotels "
+            "WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(set(hotel_ids))), )).fetchall()
+        return {row[0]: self._from_row(row) for row in rows}
+
+    # Convert a hotel into a table row
+    def _to_row(self, hotel: Hotel) -> tuple:
+        data = hotel_to_dict(hotel)
+        location = data["location"]
+        return (hotel.id, hotel.destination_id, hotel.name,
+                location["lat"] if location else None,
+                location["lng"] if location else None,
+                self._encode(location), hotel.description,
+                self._encode(data["amenities"]), self._encode(data["images"]),
+                self._encode(data["booking_conditions"]))
+
+    # Build a hotel back from a table row
+    def _from_row(self, row: Sequence[Any]) -> Hotel:
+        (hotel_id, destination_id, name, _, _, location, description,
+         amenities, images, booking_conditions) = row
+        return Hotel(id=hotel_id,
+                     destination_id=destination_id,
+                     name=name,
+                     location=location_from_dict(self._decode(location)),
+                     description=description,
+                     amenities=amenities_from_dict(self._decode(amenities)),
+                     images=images_from_dict(self._decode(images)),
+                     booking_conditions=self._decode(booking_conditions))
+
+    # Decode a nested field, left as NULL if it was not selected
+    def _decode(self, value: Optional[str]) -> Any:
+        return json.loads(value) if value is not None else None
+
+    # Encode a nested field as compact JSON
+    def _encode(self, value: Any) -> str:
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
@@ -0,0 +1,171 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from domain.models import Hotel
+from domain.search import hotel_amenities, name_tokens
+
+# Posting bitmaps are split into chunks of 2 ** CHUNK_BITS positions, each
+# held in a Python int, so a rare term costs one small int rather than a
+# bitmap as long as the repository
+CHUNK_BITS = 12
+_CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# Number of name prefixes whose united bitmaps are kept
+PREFIX_CACHE_SIZE = 1024
+
+# Chunk number -> bits of the positions in that chunk. Chunks with no bit
+# set are never stored.
+Bitmap = Dict[int, int]
+
+
+# Intersect bitmaps
+def intersect(bitmaps: List[Bitmap]) -> Bitmap:
+    if not bitmaps:
+        return {}
+    # Start from the smallest, the result can only shrink
+    bitmaps = sorted(bitmaps, key=len)
+    result = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+        result = {
+            chunk: bits & bitmap[chunk]
+            for chunk, bits in result.items()
+            if chunk in bitmap and bits & bitmap[chunk]
+        }
+        if not result:
+            break
+    return result
+
+
+# Unite bitmaps
+def unite(bitmaps: Iterable[Bitmap]) -> Bitmap:
+    result: Bitmap = {}
+    for bitmap in bitmaps:
+        for chunk, bits in bitmap.items():
+            result[chunk] = result.get(chunk, 0) | bits
+    return result
+
+
+# Check whether a position is set in a bitmap
+def contains(bitmap: Bitmap, position: int) -> bool:
+    bits = bitmap.get(position >> CHUNK_BITS, 0)
+    return bool(bits >> (position & _CHUNK_MASK) & 1)
+
+
+# Yield the positions set in a bitmap, in increasing order
+def positions(bitmap: Bitmap) -> Iterator[int]:
+    for chunk in sorted(bitmap):
+        base = chunk << CHUNK_BITS
+        # Binary digits lowest first, searched for set bits at C speed
+        digits = bin(bitmap[chunk])[:1:-1]
+        offset = digits.find("1")
+        while offset >= 0:
+            yield base + offset
+            offset = digits.find("1", offset + 1)
+
+
+# Inverted index from canonical amenity keys and name words to the bitmap
+# of the positions of the hotels that have them. Multi-amenity queries are
+# bitmap intersections, name prefixes are unions of the bitmaps of every
+# word with that prefix, found by bisecting the sorted words.
+class SearchIndex:
+    # Initialize an empty index, comparing amenities by amenity_key
+    def __init__(self, amenity_key: Callable[[str], str]):
+        self._amenity_key = amenity_key
+        self._amenities: Dict[str, Bitmap] = {}
+        self._words: Dict[str, Bitmap] = {}
+        # Position -> id of the hotel indexed there
+        self._ids: Dict[int, str] = {}
+        # Words in sorted order, rebuilt when a word is added or removed
+        self._sorted_words: Optional[List[str]] = None
+        # Prefix -> united bitmap of its words. A short prefix unites many
+        # words, and stays valid until a word bitmap changes.
+        self._prefixes: Dict[str, Bitmap] = {}
+
+    # Index a hotel at a position
+    def add(self, position: int, hotel: Hotel) -> None:
+        self._ids[position] = hotel.id
+        for key in self._keys(hotel):
+            self._set(self._amenities, key, position)
+        words = set(name_tokens(hotel.name))
+        if words:
+            self._prefixes.clear()
+        for word in words:
+            if word not in self._words:
+                self._sorted_words = None
+            self._set(self._words, word, position)
+
+    # Remove the hotel indexed at a position
+    def remove(self, position: int, hotel: Hotel) -> None:
+        self._ids.pop(position, None)
+        for key in self._keys(hotel):
+            self._clear(self._amenities, key, position)
+        words = set(name_tokens(hotel.name))
+        if words:
+            self._prefixes.clear()
+        for word in words:
+            self._clear(self._words, word, position)
+            if word not in self._words:
+                self._sorted_words = None
+
+    # Get the positions of the hotels that have every amenity and a name
+    # whose words start with the words of name. The bitmap may be shared
+    # with the index and must not be modified.
+    def match(self, amenities: Iterable[str],
+              name: Optional[str] = None) -> Bitmap:
+        bitmaps = [
+            self._amenities.get(self._amenity_key(amenity), {})
+            for amenity in set(amenities)
+        ]
+        bitmaps.extend(self._prefixed(prefix)
+                       for prefix in set(name_tokens(name)))
+        return intersect(bitmaps)
+
+    # Get the ids of the hotels in a bitmap, in position order
+    def hotel_ids(self, bitmap: Bitmap) -> List[str]:
+        return [self._ids[position] for position in positions(bitmap)]
+
+    # Get the canonical keys of the amenities of a hotel
+    def _keys(self, hotel: Hotel) -> set:
+        return {self._amenity_key(amenity)
+                for amenity in hotel_amenities(hotel)}
+
+    # Unite the bitmaps of every word starting with prefix
+    def _prefixed(self, prefix: str) -> Bitmap:
+        bitmap = self._prefixes.get(prefix)
+        if bitmap is not None:
+            return bitmap
+        if self._sorted_words is None:
+            self._sorted_words = sorted(self._words)
+        words = self._sorted_words
+        index = bisect_left(words, prefix)
+        matches = []
+        while index < len(words) and words[index].startswith(prefix):
+            matches.append(self._words[words[index]])
+            index += 1
+        bitmap = unite(matches)
+        # Drop the oldest prefix once the cache is full
+        if len(self._prefixes) >= PREFIX_CACHE_SIZE:
+            del self._prefixes[next(iter(self._prefixes))]
+        self._prefixes[prefix] = bitmap
+        return bitmap
+
+    # Set a position in the bitmap of a term
+    def _set(self, postings: Dict[str, Bitmap], term: str,
+             position: int) -> None:
+        bitmap = postings.setdefault(term, {})
+        chunk = position >> CHUNK_BITS
+        bitmap[chunk] = bitmap.get(chunk, 0) | 1 << (position & _CHUNK_MASK)
+
+    # Clear a position in the bitmap of a term, dropping emptied bitmaps
+    def _clear(self, postings: Dict[str, Bitmap], term: str,
+               position: int) -> None:
+        bitmap = postings.get(term)
+        if bitmap is None:
+            return
+        chunk = position >> CHUNK_BITS
+        bits = bitmap.get(chunk, 0) & ~(1 << (position & _CHUNK_MASK))
+        if bits:
+            bitmap[chunk] = bits
+            return
+        bitmap.pop(chunk, None)
+        if not bitmap:
+            del postings[term]
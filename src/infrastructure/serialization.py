@@ -0,0 +1,130 @@
+from typing import (Any, Callable, Dict, Iterable, List, Optional, Sequence,
+                    Tuple)
+from domain.models import (HOTEL_FIELDS, Hotel, Location, Images, ImageItem,
+                           Amenities)
+
+
+# Check a projection, a list of hotel field names, and put it in output
+# order. Raises ValueError on an unknown field.
+def project_fields(names: Iterable[str]) -> Tuple[str, ...]:
+    names = set(names)
+    unknown = names.difference(HOTEL_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown hotel fields: {', '.join(sorted(unknown))}"
+                         f", expected some of {', '.join(HOTEL_FIELDS)}")
+    return tuple(name for name in HOTEL_FIELDS if name in names)
+
+
+# Convert a hotel into plain dicts and lists, ready to be encoded as JSON.
+# Keys follow the field order of the models. With fields, only those fields
+# are converted, in the order given.
+def hotel_to_dict(hotel: Hotel,
+                  fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    if fields is not None:
+        return {name: _FIELD_TO_DICT[name](hotel) for name in fields}
+    return {
+        "id": hotel.id,
+        "destination_id": hotel.destination_id,
+        "name": hotel.name,
+        "location": location_to_dict(hotel.location),
+        "description": hotel.description,
+        "amenities": amenities_to_dict(hotel.amenities),
+        "images": images_to_dict(hotel.images),
+        "booking_conditions": _list(hotel.booking_conditions),
+    }
+
+
+# Converters of every hotel field into its dict form, by field name
+_FIELD_TO_DICT: Dict[str, Callable[[Hotel], Any]] = {
+    "id": lambda hotel: hotel.id,
+    "destination_id": lambda hotel: hotel.destination_id,
+    "name": lambda hotel: hotel.name,
+    "location": lambda hotel: location_to_dict(hotel.location),
+    "description": lambda hotel: hotel.description,
+    "amenities": lambda hotel: amenities_to_dict(hotel.amenities),
+    "images": lambda hotel: images_to_dict(hotel.images),
+    "booking_conditions": lambda hotel: _list(hotel.booking_conditions),
+}
+
+
+# Convert a location into its dict form
+def location_to_dict(location: Optional[Location]) -> Optional[Dict[str, Any]]:
+    if location is None:
+        return None
+    return {
+        "lat": location.lat,
+        "lng": location.lng,
+        "address": location.address,
+        "city": location.city,
+        "country": location.country,
+    }
+
+
+# Convert amenities into their dict form
+def amenities_to_dict(
+        amenities: Optional[Amenities]) -> Optional[Dict[str, Any]]:
+    if amenities is None:
+        return None
+    return {
+        "general": _list(amenities.general),
+        "room": _list(amenities.room),
+    }
+
+
+# Convert images into their dict form
+def images_to_dict(images: Optional[Images]) -> Optional[Dict[str, Any]]:
+    if images is None:
+        return None
+    return {
+        "rooms": _image_dicts(images.rooms),
+        "site": _image_dicts(images.site),
+        "amenities": _image_dicts(images.amenities),
+    }
+
+
+# Build a hotel back from the output of hotel_to_dict
+def hotel_from_dict(data: Dict[str, Any]) -> Hotel:
+    return Hotel(id=data["id"],
+                 destination_id=data["destination_id"],
+                 name=data["name"],
+                 location=location_from_dict(data["location"]),
+                 description=data["description"],
+                 amenities=amenities_from_dict(data["amenities"]),
+                 images=images_from_dict(data["images"]),
+                 booking_conditions=data["booking_conditions"])
+
+
+# Build a location back from its dict form
+def location_from_dict(data: Optional[Dict[str, Any]]) -> Optional[Location]:
+    return Location(**data) if data is not None else None
+
+
+# Build amenities back from their dict form
+def amenities_from_dict(
+        data: Optional[Dict[str, Any]]) -> Optional[Amenities]:
+    return Amenities(**data) if data is not None else None
+
+
+# Build images back from their dict form
+def images_from_dict(data: Optional[Dict[str, Any]]) -> Optional[Images]:
+    if data is None:
+        return None
+    return Images(rooms=_image_items(data["rooms"]),
+                  site=_image_items(data["site"]),
+                  amenities=_image_items(data["amenities"]))
+
+
+# Convert image items into their dict form
+def _image_dicts(items: Sequence[ImageItem]) -> List[Dict[str, Any]]:
+    return [{"url": item.url, "description": item.description}
+            for item in items]
+
+
+# Copy a tuple field into a list, keeping a missing one missing
+def _list(values: Optional[Sequence]) -> Optional[list]:
+    return list(values) if values is not None else None
+
+
+# Build a list of image items back from their dict form
+def _image_items(items: List[Dict[str, Any]]) -> Tuple[ImageItem, ...]:
+    return tuple(ImageItem(**item) for item in items)
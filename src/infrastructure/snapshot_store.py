@@ -0,0 +1,193 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from urllib.parse import quote
+from application.change_tracking import feed_digest
+from infrastructure.http_transport import CHUNK_SIZE
+
+
+# Define interface for storage of the last feed fetched from every supplier,
+# served while the supplier is down
+class SnapshotStore(ABC):
+
+    @abstractmethod
+    # Store the pages of a supplier feed, replacing its previous snapshot,
+    # or only marking it as saved now if the feed is unchanged. Returns
+    # pages ready to be read instead of the given ones, which may be
+    # consumed and closed.
+    def save(self, name: str, pages: List[BinaryIO]) -> List[BinaryIO]:
+        pass
+
+    @abstractmethod
+    # Check whether there is a snapshot of a supplier
+    def contains(self, name: str) -> bool:
+        pass
+
+    @abstractmethod
+    # Open the pages of the snapshot of a supplier with the Unix time it
+    # was saved, if there is one
+    def load(self, name: str) -> Optional[Tuple[List[BinaryIO], float]]:
+        pass
+
+
+# Keep the snapshot of every supplier for the life of the process, in
+# spooled temporary files so that at most spool_size bytes of a page are
+# held in memory
+class MemorySnapshotStore(SnapshotStore):
+    def __init__(self, spool_size: int = 1024 * 1024):
+        self._snapshots: Dict[str, Tuple[List[BinaryIO], bytes, float]] = {}
+        self._spool_size = spool_size
+        self._lock = threading.Lock()
+
+    # Store the pages of a supplier feed
+    def save(self, name: str, pages: List[BinaryIO]) -> List[BinaryIO]:
+        digest = feed_digest(pages)
+        with self._lock:
+            snapshot = self._snapshots.get(name)
+            if snapshot is not None and snapshot[1] == digest:
+                self._snapshots[name] = (snapshot[0], digest, time.time())
+                return pages
+        copies = [self._copy(page) for page in pages]
+        with self._lock:
+            previous = self._snapshots.get(name)
+            self._snapshots[name] = (copies, digest, time.time())
+        if previous is not None:
+            for copy in previous[0]:
+                copy.close()
+        return pages
+
+    # Check whether there is a snapshot of a supplier
+    def contains(self, name: str) -> bool:
+        with self._lock:
+            return name in self._snapshots
+
+    # Open the pages of the snapshot of a supplier
+    def load(self, name: str) -> Optional[Tuple[List[BinaryIO], float]]:
+        # Stored pages are copied under the lock, as reading them moves
+        # their position and a save may close them
+        with self._lock:
+            snapshot = self._snapshots.get(name)
+            if snapshot is None:
+                return None
+            copies, _, saved_at = snapshot
+            return [self._copy(copy) for copy in copies], saved_at
+
+    # Copy a page from its start into a new spooled file, rewinding both
+    def _copy(self, page: BinaryIO) -> BinaryIO:
+        copy = tempfile.SpooledTemporaryFile(max_size=self._spool_size)
+        shutil.copyfileobj(page, copy, CHUNK_SIZE)
+        page.seek(0)
+        copy.seek(0)
+        return copy
+
+
+# Keep the snapshot of every supplier on disk, so that it survives between
+# runs. Each snapshot is written into a new generation directory, then a
+# manifest naming it is replaced atomically, so readers never see a partial
+# snapshot. A feed with the digest of the snapshot is not written again.
+class DiskSnapshotStore(SnapshotStore):
+    # Initialize the store in the given directory
+    def __init__(self, directory: str):
+        self._directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    # Store the pages of a supplier feed
+    def save(self, name: str, pages: List[BinaryIO]) -> List[BinaryIO]:
+        supplier_directory = self._supplier_directory(name)
+        digest = feed_digest(pages).hex()
+        with self._lock:
+            manifest = self._read_manifest(supplier_directory)
+            if manifest is not None and manifest.get("digest") == digest \
+                    and manifest.get("pages") == len(pages):
+                manifest["saved_at"] = time.time()
+                self._write_manifest(supplier_directory, manifest)
+                return pages
+            os.makedirs(supplier_directory, exist_ok=True)
+            generation = tempfile.mkdtemp(dir=supplier_directory,
+                                          prefix="generation-")
+            try:
+                for index, page in enumerate(pages):
+                    with page, open(self._page_path(generation, index),
+                                    "wb") as file:
+                        shutil.copyfileobj(page, file, CHUNK_SIZE)
+                self._write_manifest(supplier_directory, {
+                    "generation": os.path.basename(generation),
+                    "pages": len(pages),
+                    "digest": digest,
+                    "saved_at": time.time(),
+                })
+            except BaseException:
+                for page in pages:
+                    page.close()
+                shutil.rmtree(generation, ignore_errors=True)
+                raise
+            # Older generations are no longer named by the manifest
+            for entry in os.listdir(supplier_directory):
+                path = os.path.join(supplier_directory, entry)
+                if entry.startswith("generation-") and path != generation:
+                    shutil.rmtree(path, ignore_errors=True)
+        return [
+            open(self._page_path(generation, index), "rb")
+            for index in range(len(pages))
+        ]
+
+    # Check whether there is a snapshot of a supplier
+    def contains(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self._supplier_directory(name),
+                                           "manifest.json"))
+
+    # Open the pages of the snapshot of a supplier
+    def load(self, name: str) -> Optional[Tuple[List[BinaryIO], float]]:
+        supplier_directory = self._supplier_directory(name)
+        pages: List[BinaryIO] = []
+        with self._lock:
+            manifest = self._read_manifest(supplier_directory)
+            if manifest is None:
+                return None
+            try:
+                generation = os.path.join(supplier_directory,
+                                          manifest["generation"])
+                for index in range(manifest["pages"]):
+                    pages.append(open(self._page_path(generation, index),
+                                      "rb"))
+            except (OSError, ValueError, KeyError):
+                for page in pages:
+                    page.close()
+                return None
+        return pages, manifest["saved_at"]
+
+    # Get the directory of the snapshots of a supplier
+    def _supplier_directory(self, name: str) -> str:
+        return os.path.join(self._directory, quote(name, safe=""))
+
+    # Get the path of a page of a generation
+    def _page_path(self, generation: str, index: int) -> str:
+        return os.path.join(generation, f"{index}.json")
+
+    # Read the manifest of a supplier, if there is a readable one
+    def _read_manifest(self, supplier_directory: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(supplier_directory, "manifest.json"),
+                      "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    # Replace the manifest of a supplier atomically
+    def _write_manifest(self, supplier_directory: str, manifest: dict) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=supplier_directory,
+                                         suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(manifest, file)
+            os.replace(temp_path,
+                       os.path.join(supplier_directory, "manifest.json"))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
@@ -1,27 +1,34 @@
 from .base import BaseSupplier
+from infrastructure.http_transport import HttpTransport
 from domain.models import Hotel, Location, Images, Amenities
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 
 class AcmeSupplier(BaseSupplier):
-    # Initialize the supplier with the API URL
-    def __init__(self):
-        super().__init__(
-            "https://5f2be0b4ffc88500167b85a0.mockapi.io/suppliers/acme")
+    # Initialize the supplier with the API URL, which can point elsewhere,
+    # e.g. at a local stub
+    def __init__(self, transport: Optional[HttpTransport] = None,
+                 api_url: str = ("https://5f2be0b4ffc88500167b85a0.mockapi.io"
+                                 "/suppliers/acme")):
+        super().__init__(api_url, transport=transport)
+
+    # Get the hotel id of a raw hotel
+    def hotel_id(self, data: Dict[str, Any]) -> str:
+        return str(data.get("Id", ""))
 
     # Parse the hotel data from the JSON response
     def parse_hotel(self, data: Dict[str, Any]) -> Hotel:
         return Hotel(
-            id=str(data.get("Id", "")),
+            id=self.hotel_id(data),
             destination_id=str(data.get("DestinationId", "")),
             name=data.get("Name", ""),
             description=data.get("Description", ""),
             location=self._parse_location(data),
             amenities=self._parse_amenities(data),
             images=Images(
-                rooms=[], site=[],
-                amenities=[]),  # Not found in JSON from ACME supplier
-            booking_conditions=[]  # Not found in JSON from ACME supplier
+                rooms=(), site=(),
+                amenities=()),  # Not found in JSON from ACME supplier
+            booking_conditions=()  # Not found in JSON from ACME supplier
         )
 
     # Parse the location data from the JSON response
@@ -36,8 +43,8 @@ class AcmeSupplier(BaseSupplier):
 
     # Parse the amenities data from the JSON response
     def _parse_amenities(self, data: Dict[str, Any]) -> Amenities:
-        facilities = [f.strip() for f in data.get("Facilities", [])]
+        facilities = tuple(f.strip() for f in data.get("Facilities", []))
         return Amenities(
             general=facilities,
-            room=[]  # Not found in JSON from ACME supplier
+            room=()  # Not found in JSON from ACME supplier
         )
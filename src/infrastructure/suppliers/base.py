@@ -1,16 +1,60 @@
-import requests
 from domain.interfaces import ISupplier
-from typing import List
+from infrastructure.http_transport import HttpTransport, default_transport
+from infrastructure.json_stream import iter_json_array
+from typing import BinaryIO, Iterator, List, Optional
 
 
 # Define base supplier class
 class BaseSupplier(ISupplier):
-    # Initialize base supplier with API URL
-    def __init__(self, api_url: str):
+    # Maximum number of pages followed, guarding against pagination loops
+    max_pages: int = 1000
+
+    # Initialize base supplier with API URL, an optional fetch timeout and
+    # the HTTP transport to use (shared by all suppliers by default)
+    def __init__(self, api_url: str, timeout: Optional[float] = None,
+                 transport: Optional[HttpTransport] = None):
         self.api_url = api_url
+        if timeout is not None:
+            self.timeout = timeout
+        self._transport = transport or default_transport()
+
+    # Pickle without the transport, so that worker processes can parse
+    # hotels. An unpickled supplier fetches with the default transport.
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_transport"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._transport = None
+
+    # Download every page of the supplier feed, following "next" links
+    def fetch(self) -> List[BinaryIO]:
+        pages = []
+        url = self.api_url
+        visited = set()
+        try:
+            while url and url not in visited and len(pages) < self.max_pages:
+                visited.add(url)
+                page = (self._transport or default_transport()).fetch(
+                    url, self.name, self.timeout)
+                pages.append(page.body)
+                url = page.next_url
+        except BaseException:
+            for body in pages:
+                body.close()
+            raise
+        return pages
 
-    # Get hotels from supplier
-    def get_hotels(self) -> List[dict]:
-        response = requests.get(self.api_url)
-        response.raise_for_status()
-        return response.json()
+    # Get raw hotels from supplier, decoding each page incrementally
+    def get_hotels(self,
+                   pages: Optional[List[BinaryIO]] = None) -> Iterator[dict]:
+        if pages is None:
+            pages = self.fetch()
+        try:
+            for body in pages:
+                yield from iter_json_array(body)
+        finally:
+            for body in pages:
+                body.close()
@@ -1,16 +1,24 @@
 from .base import BaseSupplier
+from infrastructure.http_transport import HttpTransport
 from domain.models import Hotel, Location, Images, Amenities, ImageItem
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 class PaperfliesSupplier(BaseSupplier):
-    # Initialize the supplier with the API URL
-    def __init__(self):
-        super().__init__("https://5f2be0b4ffc88500167b85a0.mockapi.io/suppliers/paperflies")
+    # Initialize the supplier with the API URL, which can point elsewhere,
+    # e.g. at a local stub
+    def __init__(self, transport: Optional[HttpTransport] = None,
+                 api_url: str = ("https://5f2be0b4ffc88500167b85a0.mockapi.io"
+                                 "/suppliers/paperflies")):
+        super().__init__(api_url, transport=transport)
+
+    # Get the hotel id of a raw hotel
+    def hotel_id(self, data: Dict[str, Any]) -> str:
+        return str(data.get("hotel_id", ""))
 
     # Parse the hotel data from the JSON response
     def parse_hotel(self, data: Dict[str, Any]) -> Hotel:
         return Hotel(
-            id=str(data.get("hotel_id", "")),
+            id=self.hotel_id(data),
             destination_id=str(data.get("destination_id", "")),
             name=data.get("hotel_name", ""),
             description=data.get("details", ""),
@@ -40,9 +48,9 @@ class PaperfliesSupplier(BaseSupplier):
     # Parse the images data from the JSON response
     def _parse_images(self, images: Dict[str, List[Dict[str, str]]]) -> Images:
         return Images(
-            rooms=[ImageItem(url=img["link"], description=img.get("caption")) 
-                  for img in images.get("rooms", [])],
-            site=[ImageItem(url=img["link"], description=img.get("caption"))
-                 for img in images.get("site", [])],
-            amenities=[]  # Not found in JSON from Paperflies supplier
+            rooms=tuple(ImageItem(url=img["link"], description=img.get("caption"))
+                        for img in images.get("rooms", [])),
+            site=tuple(ImageItem(url=img["link"], description=img.get("caption"))
+                       for img in images.get("site", [])),
+            amenities=()  # Not found in JSON from Paperflies supplier
         )
\ No newline at end of file
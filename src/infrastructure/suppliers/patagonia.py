@@ -1,25 +1,32 @@
 from .base import BaseSupplier
+from infrastructure.http_transport import HttpTransport
 from domain.models import Hotel, Location, Images, Amenities, ImageItem
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 
 class PatagoniaSupplier(BaseSupplier):
-    # Initialize the supplier with the API URL
-    def __init__(self):
-        super().__init__(
-            "https://5f2be0b4ffc88500167b85a0.mockapi.io/suppliers/patagonia")
+    # Initialize the supplier with the API URL, which can point elsewhere,
+    # e.g. at a local stub
+    def __init__(self, transport: Optional[HttpTransport] = None,
+                 api_url: str = ("https://5f2be0b4ffc88500167b85a0.mockapi.io"
+                                 "/suppliers/patagonia")):
+        super().__init__(api_url, transport=transport)
+
+    # Get the hotel id of a raw hotel
+    def hotel_id(self, data: Dict[str, Any]) -> str:
+        return str(data.get("id", ""))
 
     # Parse the hotel data from the JSON response
     def parse_hotel(self, data: Dict[str, Any]) -> Hotel:
         return Hotel(
-            id=str(data.get("id", "")),
+            id=self.hotel_id(data),
             destination_id=str(data.get("destination", "")),
             name=data.get("name", ""),
             description=data.get("info", ""),
             location=self._parse_location(data),
             amenities=self._parse_amenities(data.get("amenities", [])),
             images=self._parse_images(data.get("images", {})),
-            booking_conditions=[]  # Not found in JSON from Patagonia supplier
+            booking_conditions=()  # Not found in JSON from Patagonia supplier
         )
 
     # Parse the location data from the JSON response
@@ -36,18 +43,16 @@ class PatagoniaSupplier(BaseSupplier):
     def _parse_amenities(self, amenities: List[str]) -> Amenities:
         return Amenities(
             general=amenities,  # All amenities go to general list
-            room=[]  # Empty room amenities as they're not provided
+            room=()  # Empty room amenities as they're not provided
         )
 
     # Parse the images data from the JSON response
     def _parse_images(self, images: Dict[str, List[Dict[str, str]]]) -> Images:
         return Images(
-            rooms=[
+            rooms=tuple(
                 ImageItem(url=img["url"], description=img.get("description"))
-                for img in images.get("rooms", [])
-            ],
-            site=[],  # Not found in JSON from Patagonia supplier
-            amenities=[
+                for img in images.get("rooms", [])),
+            site=(),  # Not found in JSON from Patagonia supplier
+            amenities=tuple(
                 ImageItem(url=img["url"], description=img.get("description"))
-                for img in images.get("amenities", [])
-            ])
+                for img in images.get("amenities", [])))
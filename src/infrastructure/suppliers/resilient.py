@@ -0,0 +1,361 @@
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from typing import BinaryIO, Deque, Iterator, List, Optional
+import requests
+from application.background import run_in_background
+from domain.interfaces import ISupplier
+from domain.models import Hotel
+from infrastructure.snapshot_store import SnapshotStore
+
+# Seconds of the deadline of a fetch kept to open the snapshot after the
+# attempts
+FALLBACK_SECONDS = 1.0
+
+# Client errors that are worth trying again
+_RETRYABLE_STATUSES = frozenset((408, 425, 429))
+
+
+# How hard to try a supplier before falling back to its snapshot
+@dataclass
+class ResiliencePolicy:
+    # Attempts per fetch, the first one included
+    attempts: int = 3
+    # Base and cap of the exponential backoff between attempts, in seconds.
+    # Each wait is drawn uniformly below the current backoff.
+    backoff: float = 0.25
+    max_backoff: float = 4.0
+    # Seconds a fetch takes at most, the fallback to the snapshot included
+    deadline: float = 10.0
+    # Seconds after which a second request is sent if the first one has not
+    # answered, until enough latencies are known to use their quantile.
+    # The quantile must lie above the share of slow requests to cut them.
+    # None disables hedging.
+    hedge_after: Optional[float] = 2.0
+    hedge_quantile: float = 0.95
+    # Serve the snapshot once a fetch takes twice the hedge delay, while the
+    # fetch goes on in the background and saves the next snapshot. Only for
+    # long-running processes: a one-shot run exits before the fetch ends, so
+    # it would never see a newer snapshot. Otherwise the snapshot is served
+    # once the fetch failed.
+    stale_while_revalidate: bool = False
+    # Latencies of the last successful requests kept to compute the quantile
+    latency_window: int = 50
+    # Failed fetches in a row that open the circuit, and seconds it stays
+    # open before a trial fetch is let through
+    failure_threshold: int = 3
+    reset_after: float = 60.0
+
+
+# Raised when a supplier is skipped because its circuit is open
+class CircuitOpenError(Exception):
+    pass
+
+
+# Circuit breaker of one supplier. Closed, it lets every fetch through and
+# counts failures in a row. Once open, fetches are refused until
+# reset_after has passed, then a single trial fetch decides whether it
+# closes again.
+class CircuitBreaker:
+    # Initialize a closed breaker
+    def __init__(self, failure_threshold: int, reset_after: float):
+        self._failure_threshold = failure_threshold
+        self._reset_after = reset_after
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    # State of the breaker: closed, open or half-open
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._trial or time.monotonic() - self._opened_at >= \
+                    self._reset_after:
+                return "half-open"
+            return "open"
+
+    # Check whether a fetch may go through, taking the trial fetch if the
+    # breaker is due for one
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < \
+                    self._reset_after:
+                return False
+            self._trial = True
+            return True
+
+    # Record a successful fetch, closing the breaker
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    # Record a failed fetch, opening the breaker after enough of them or
+    # when the trial fetch failed
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self._failure_threshold:
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+# Supplier wrapper that retries failed fetches with jittered exponential
+# backoff, hedges slow ones with a second request, and stops calling a
+# supplier that keeps failing. The feed of every successful fetch is kept in
+# a snapshot store. It is served instead while the supplier is unavailable,
+# and with stale_while_revalidate while it is slower than usual: the fetch
+# then goes on in the background and updates the snapshot for the next
+# fetch. stale_reason tells why the snapshot was served.
+class ResilientSupplier(ISupplier):
+    # Initialize the wrapper of supplier
+    def __init__(self,
+                 supplier: ISupplier,
+                 policy: Optional[ResiliencePolicy] = None,
+                 snapshots: Optional[SnapshotStore] = None,
+                 rng: Optional[random.Random] = None):
+        self._supplier = supplier
+        self._policy = policy or ResiliencePolicy()
+        self._snapshots = snapshots
+        self._rng = rng or random.Random()
+        self._start()
+
+    # Pickle the wrapped supplier and policy only, so that worker processes
+    # can parse hotels. An unpickled wrapper has no snapshots.
+    def __getstate__(self) -> dict:
+        return {"_supplier": self._supplier, "_policy": self._policy}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._snapshots = None
+        self._rng = random.Random()
+        self._start()
+
+    # The service gives up on a fetch once its deadline has passed
+    @property
+    def timeout(self) -> float:
+        return self._policy.deadline
+
+    # Name of the wrapped supplier
+    @property
+    def name(self) -> str:
+        return self._supplier.name
+
+    # State of the circuit breaker of the supplier
+    @property
+    def circuit(self) -> str:
+        return self._breaker.state
+
+    # Download the supplier feed, falling back to its snapshot if the
+    # supplier fails or is slower than usual
+    def fetch(self) -> List[BinaryIO]:
+        self.stale_reason = None
+        if not self._breaker.allow():
+            return self._fallback(CircuitOpenError(
+                f"{self.name} is failing, its circuit is open"))
+        # A fetch an earlier one gave up on is waited for again rather than
+        # sending more requests to a slow supplier
+        with self._revalidation_lock:
+            future = self._revalidation
+            owned = future is None or future.done()
+            if owned:
+                future = run_in_background(self._fetch_and_save,
+                                           name=f"revalidate-{self.name}")
+        budget = self._policy.deadline - FALLBACK_SECONDS
+        hedge_after = self._hedge_after()
+        if self._policy.stale_while_revalidate and hedge_after is not None \
+                and self._has_snapshot():
+            # The hedged request had as long as the first one to answer
+            budget = min(budget, 2 * hedge_after)
+        done, _ = wait([future], timeout=max(budget, 0))
+        if not done:
+            if owned:
+                future.add_done_callback(self._close_pages)
+                if self._snapshots is not None:
+                    # It goes on and saves the snapshot for the next fetch
+                    with self._revalidation_lock:
+                        self._revalidation = future
+            return self._fallback(TimeoutError(
+                f"{self.name} did not answer within {budget:.2f}s"))
+        error = future.exception()
+        if error is not None:
+            return self._fallback(error)
+        if owned:
+            return future.result()
+        # Its pages were closed, but it saved them as the snapshot
+        return self._snapshots.load(self.name)[0]
+
+    # Get raw hotels from the supplier, fetching them if no pages are given
+    def get_hotels(self,
+                   pages: Optional[List[BinaryIO]] = None) -> Iterator[dict]:
+        if pages is None:
+            pages = self.fetch()
+        return self._supplier.get_hotels(pages)
+
+    # Parse a raw hotel with the wrapped supplier
+    def parse_hotel(self, data: dict) -> Hotel:
+        return self._supplier.parse_hotel(data)
+
+    # Get the hotel id of a raw hotel with the wrapped supplier
+    def hotel_id(self, data: dict) -> str:
+        return self._supplier.hotel_id(data)
+
+    # Set up the breaker and latencies
+    def _start(self) -> None:
+        policy = self._policy
+        self._breaker = CircuitBreaker(policy.failure_threshold,
+                                       policy.reset_after)
+        self._latencies: Deque[float] = deque(maxlen=policy.latency_window)
+        self._latency_lock = threading.Lock()
+        self._revalidation: Optional[Future] = None
+        self._revalidation_lock = threading.Lock()
+        self.stale_reason: Optional[str] = None
+
+    # Fetch the feed with retries, recording the outcome in the breaker and
+    # replacing the snapshot with the feed. Returns the stored copies.
+    def _fetch_and_save(self) -> List[BinaryIO]:
+        try:
+            pages = self._fetch_with_retries()
+        except Exception:
+            self._breaker.record_failure()
+            raise
+        self._breaker.record_success()
+        if self._snapshots is not None:
+            pages = self._snapshots.save(self.name, pages)
+        return pages
+
+    # Check whether there is a snapshot to serve while the supplier is slow
+    def _has_snapshot(self) -> bool:
+        return (self._snapshots is not None
+                and self._snapshots.contains(self.name))
+
+    # Try the supplier until an attempt succeeds, attempts run out, the
+    # error is not worth retrying or the deadline is too close
+    def _fetch_with_retries(self) -> List[BinaryIO]:
+        policy = self._policy
+        deadline = time.monotonic() + policy.deadline - FALLBACK_SECONDS
+        for attempt in range(policy.attempts):
+            try:
+                return self._hedged_fetch(deadline)
+            except Exception as error:
+                if attempt + 1 == policy.attempts or not self._retryable(
+                        error):
+                    raise
+                # Full jitter spreads the retries of concurrent clients
+                delay = self._rng.uniform(
+                    0, min(policy.max_backoff, policy.backoff * 2**attempt))
+                if time.monotonic() + delay >= deadline:
+                    raise
+                time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    # Fetch the feed, sending a second request if the first one is slower
+    # than usual, and return whichever succeeds first
+    def _hedged_fetch(self, deadline: float) -> List[BinaryIO]:
+        pending = {self._start_request()}
+        hedge_after = self._hedge_after()
+        if hedge_after is not None:
+            done, pending = wait(pending,
+                                 timeout=min(hedge_after,
+                                             self._remaining(deadline)))
+            # Still running, so the request is in the slow tail
+            if pending and self._remaining(deadline) > 0:
+                pending.add(self._start_request())
+            pending |= done
+
+        error: Optional[BaseException] = None
+        while pending:
+            remaining = self._remaining(deadline)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self._discard(pending)
+                    return future.result()
+                error = future.exception()
+        if pending:
+            self._discard(pending)
+            raise TimeoutError(
+                f"{self.name} did not answer within "
+                f"{self._policy.deadline - FALLBACK_SECONDS:.2f}s")
+        raise error
+
+    # Send a request on a daemon thread, so that one still running when the
+    # fetch gives up does not keep the process alive
+    def _start_request(self) -> Future:
+        return run_in_background(self._timed_fetch,
+                                 name=f"fetch-{self.name}")
+
+    # Fetch the feed once, recording how long a successful request took
+    def _timed_fetch(self) -> List[BinaryIO]:
+        started = time.monotonic()
+        pages = self._supplier.fetch()
+        with self._latency_lock:
+            self._latencies.append(time.monotonic() - started)
+        return pages
+
+    # Get the seconds to wait before hedging, the configured quantile of
+    # the recent latencies once there are enough of them
+    def _hedge_after(self) -> Optional[float]:
+        policy = self._policy
+        if policy.hedge_after is None:
+            return None
+        with self._latency_lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < 10:
+            return policy.hedge_after
+        index = min(len(latencies) - 1,
+                    math.ceil(policy.hedge_quantile * len(latencies)) - 1)
+        return latencies[index]
+
+    # Close the pages of requests that lost the race once they finish
+    def _discard(self, futures) -> None:
+        for future in futures:
+            future.add_done_callback(self._close_pages)
+
+    # Close the pages fetched by a request, if it succeeded
+    def _close_pages(self, future: Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        for page in future.result():
+            page.close()
+
+    # Serve the snapshot of the supplier after a failed fetch, raising the
+    # failure if there is none
+    def _fallback(self, error: Exception) -> List[BinaryIO]:
+        snapshot = (self._snapshots.load(self.name)
+                    if self._snapshots is not None else None)
+        if snapshot is None:
+            raise error
+        pages, saved_at = snapshot
+        age = time.time() - saved_at
+        self.stale_reason = (f"{str(error) or type(error).__name__}, serving "
+                             f"the snapshot from {age:.0f}s ago")
+        return pages
+
+    # Get the seconds left before a deadline
+    def _remaining(self, deadline: float) -> float:
+        return deadline - time.monotonic()
+
+    # Check whether a failed fetch is worth trying again. Client errors
+    # other than timeouts and rate limits will fail the same way.
+    def _retryable(self, error: Exception) -> bool:
+        if isinstance(error, TimeoutError):
+            return False
+        if isinstance(error, requests.HTTPError) and \
+                error.response is not None:
+            status = error.response.status_code
+            return status >= 500 or status in _RETRYABLE_STATUSES
+        return True
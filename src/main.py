@@ -1,62 +1,389 @@
 import argparse
+import contextlib
 import json
+import os
 import sys
+from typing import List
 from application.hotel_service import HotelService
-from infrastructure.suppliers.acme import AcmeSupplier
+from application.metrics import Metrics, TimedMergeStrategy
 from application.merge_strategy import DefaultMergeStrategy
-from infrastructure.repositories import InMemoryHotelRepository
-from infrastructure.suppliers.patagonia import PatagoniaSupplier
-from infrastructure.suppliers.paperflies import PaperfliesSupplier
+from infrastructure.hotel_encoder import FORMATS, HotelEncoder
+from infrastructure.serialization import project_fields
+
+# Modules pulling in requests, numpy, sqlite3 or asyncio are imported where
+# they are used, so that a query answered from a catalogue starts quickly
 
 def main():
     parser = argparse.ArgumentParser(description='Hotel Data Merger')
-    # If there are arguments to be passed
-    if len(sys.argv) > 1:
-        parser.add_argument('hotel_ids', type=str, help='Hotel IDs')
-        parser.add_argument('destination_ids', type=str, help='Destination IDs')
-        args = parser.parse_args()
-    # If there are no arguments to be passed then hotel_ids and destination_ids are set to none
+    # If hotel_ids and destination_ids are not passed then they are set to none
+    parser.add_argument('hotel_ids', type=str, nargs='?', default='none',
+                        help='Hotel IDs')
+    parser.add_argument('destination_ids', type=str, nargs='?', default='none',
+                        help='Destination IDs')
+    parser.add_argument('--stats', action='store_true',
+                        help='Print requests and bytes per supplier to stderr')
+    parser.add_argument('--cache-dir',
+                        help='Directory of the supplier response cache, '
+                        '~/.cache/hotel-merger by default')
+    parser.add_argument('--cache-ttl', type=float, default=300.0,
+                        help='Seconds a cached supplier response is reused '
+                        'without asking the supplier')
+    parser.add_argument('--cache-max-bytes', type=int,
+                        default=256 * 1024 * 1024,
+                        help='Total size the response cache may grow to')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not read or write the response cache')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Fetch every supplier again and update the cache')
+    parser.add_argument('--attempts', type=int, default=3,
+                        help='Times a failing supplier is tried before its '
+                        'last good feed is used')
+    parser.add_argument('--deadline', type=float, default=10.0,
+                        help='Seconds a supplier fetch may take, falling '
+                        'back to its last good feed included')
+    parser.add_argument('--hedge-after', type=float, default=2.0,
+                        help='Seconds after which a slow supplier request is '
+                        'sent again, until its usual latency is known, 0 '
+                        'to never send it again. With --serve, its last '
+                        'good feed is used once twice that has passed')
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help='Skip suppliers that cannot be reached instead '
+                        'of using their last good feed')
+    parser.add_argument('--db',
+                        help='Keep merged hotels in this SQLite database '
+                        'instead of in memory')
+    parser.add_argument('--no-ingest', action='store_true',
+                        help='Query the hotels already in --db or '
+                        '--catalogue without fetching suppliers')
+    parser.add_argument('--catalogue', metavar='FILE',
+                        help='Write the merged hotels to this catalogue file '
+                        'after fetching suppliers, read it with --no-ingest')
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help='Print results as an indented JSON array, one '
+                        'compact hotel per line, or a compact JSON array')
+    parser.add_argument('--serve', action='store_true',
+                        help='Keep merged hotels in memory and answer '
+                        'GET /hotels?hotel_ids=...&destination_ids=... '
+                        'over HTTP instead of printing one query')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address the server listens on')
+    parser.add_argument('--port', type=int, default=8080,
+                        help='Port the server listens on')
+    parser.add_argument('--refresh-interval', type=float, default=300.0,
+                        help='Seconds between background supplier refreshes '
+                        'of the server')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Parse and merge on this many processes, 0 for '
+                        'one per CPU')
+    parser.add_argument('--metrics', choices=('summary', 'prometheus'),
+                        help='Print the time spent in every stage and the '
+                        'records, merges and bytes processed to stderr, as '
+                        'JSON or in the Prometheus text format')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='Run under cProfile and tracemalloc and write '
+                        'their reports into DIR')
+    area = parser.add_mutually_exclusive_group()
+    area.add_argument('--near', type=coordinates(2), metavar='LAT,LNG',
+                      help='Only return hotels within --radius of this '
+                      'point, nearest first')
+    area.add_argument('--bbox', type=coordinates(4), metavar='S,W,N,E',
+                      help='Only return hotels inside this bounding box')
+    parser.add_argument('--radius', type=float, default=10.0,
+                        help='Radius of --near in km')
+    parser.add_argument('--limit', type=int,
+                        help='Return at most this many hotels of --near or '
+                        '--bbox')
+    parser.add_argument('--amenity', action='append', default=[],
+                        metavar='AMENITY',
+                        help='Only return hotels with this amenity, can be '
+                        'repeated to require several')
+    parser.add_argument('--fields', type=fields_list,
+                        metavar='FIELD,...',
+                        help='Only load and output these hotel fields, e.g. '
+                        'id,name,location')
+    parser.add_argument('--name',
+                        help='Only return hotels whose name has words '
+                        'starting with the words of NAME')
+    parser.add_argument('--batch', metavar='FILE',
+                        help='Answer the queries of FILE, or of stdin if it '
+                        'is -, one "HOTEL_IDS [DESTINATION_IDS]" per line, '
+                        'writing one result document per query')
+    args = parser.parse_args()
+    if args.batch:
+        if args.serve:
+            parser.error('--serve and --batch answer queries differently')
+        if (args.hotel_ids.lower() != 'none'
+                or args.destination_ids.lower() != 'none'
+                or args.near or args.bbox or args.amenity or args.name
+                or args.limit is not None):
+            parser.error('--batch reads its queries from FILE, and only '
+                         'filters hotels by id and destination, without a '
+                         'limit')
+        if args.format == 'ndjson':
+            parser.error('--batch needs the json or compact format to keep '
+                         'the results of queries apart')
+    if args.serve and args.db:
+        parser.error('--serve keeps hotels in memory and cannot use --db')
+    if args.serve and args.catalogue:
+        parser.error('--serve keeps hotels in memory and cannot use '
+                     '--catalogue')
+    if args.serve and args.workers != 1:
+        parser.error('--serve refreshes only the hotels that changed and '
+                     'cannot use --workers')
+    if args.no_ingest and args.db and args.catalogue:
+        parser.error('--no-ingest reads either --db or --catalogue')
+    if args.no_ingest and not (args.db or args.catalogue):
+        parser.error('--no-ingest requires --db or --catalogue')
+
+    if args.profile:
+        from infrastructure.profiling import run_profiled
+        run_profiled(lambda: run(args), args.profile)
+        print(f"Profile reports written to {args.profile}", file=sys.stderr)
+    else:
+        run(args)
+
+
+# Ingest suppliers and answer the query, or serve queries
+def run(args: argparse.Namespace) -> None:
+    metrics = Metrics()
+    workers = args.workers or os.cpu_count() or 1
+
+    # Initialize merge strategy to merge data, timing merges if asked to
+    merge_strategy = DefaultMergeStrategy()
+    if args.metrics:
+        merge_strategy = TimedMergeStrategy(merge_strategy, metrics)
+
+    # Serve queries from memory, refreshing the hotels incrementally
+    if args.serve:
+        import asyncio
+        from infrastructure.query_server import QueryServer
+        from infrastructure.repositories import InMemoryHotelRepository
+        suppliers, transport = build_suppliers(args)
+        server = QueryServer(
+            HotelService(InMemoryHotelRepository(merge_strategy), suppliers,
+                         merge_strategy, metrics=metrics),
+            host=args.host, port=args.port,
+            refresh_interval=args.refresh_interval, metrics=metrics,
+            after_refresh=lambda: record_transfers(metrics, transport))
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Answer from a catalogue without fetching suppliers, decoding only the
+    # hotels returned
+    transport = None
+    if args.no_ingest and args.catalogue:
+        from infrastructure.mapped_repository import MappedHotelRepository
+        service = HotelService(
+            MappedHotelRepository(args.catalogue, merge_strategy), [],
+            merge_strategy, metrics=metrics)
+    else:
+        # Initialize repository to save data in memory or in an SQLite
+        # database
+        if args.db:
+            from infrastructure.repositories import SqliteHotelRepository
+            repository = SqliteHotelRepository(args.db, merge_strategy)
+        else:
+            from infrastructure.repositories import InMemoryHotelRepository
+            repository = InMemoryHotelRepository(merge_strategy)
+
+        # Process hotels, reporting suppliers that could not be reached in
+        # time
+        if args.db and args.no_ingest:
+            service = HotelService(repository, [], merge_strategy,
+                                   metrics=metrics)
+        else:
+            suppliers, transport = build_suppliers(args)
+            service = HotelService(repository, suppliers, merge_strategy,
+                                   metrics=metrics, workers=workers)
+            report = service.process_hotels()
+            for warning in report.warnings():
+                print(f"Warning: {warning}", file=sys.stderr)
+
+        # Keep the merged hotels for later queries
+        if args.catalogue:
+            from infrastructure.mapped_repository import write_catalogue
+            with metrics.timer("write_catalogue"):
+                write_catalogue(args.catalogue, service.find_hotels([], []))
+
+    # Show how much traffic each supplier cost
+    if args.stats and transport is not None:
+        for supplier_name, stats in transport.stats().items():
+            print(f"{supplier_name}: {stats.requests} requests, "
+                  f"{stats.not_modified} not modified, "
+                  f"{stats.cache_hits} cache hits, "
+                  f"{stats.bytes_on_wire} bytes on wire, "
+                  f"{stats.bytes_decoded} bytes decoded", file=sys.stderr)
+
+    # Answer every query of a batch against the hotels ingested once, or
+    # the query of the command line
+    if args.batch:
+        answer_batch(service, args, metrics)
     else:
-        args = argparse.Namespace(hotel_ids='none', destination_ids='none')
+        answer_query(service, args, metrics)
 
-    # Initialize suppliers to get data from suppliers
+    if args.metrics:
+        if transport is not None:
+            record_transfers(metrics, transport)
+        if args.metrics == 'prometheus':
+            sys.stderr.write(metrics.prometheus_text())
+        else:
+            print(json.dumps(metrics.summary(), indent=2), file=sys.stderr)
+
+
+# Find and output the hotels of the query given on the command line
+def answer_query(service: HotelService, args: argparse.Namespace,
+                 metrics: Metrics) -> None:
+    hotel_ids = id_list(args.hotel_ids)
+    destination_ids = id_list(args.destination_ids)
+
+    # Find and output results, restricted to an area if one is given
+    filtered = bool(hotel_ids or destination_ids or args.amenity
+                    or args.name)
+    if args.near or args.bbox:
+        limit = None if filtered else args.limit
+        if args.near:
+            lat, lng = args.near
+            results = [hotel for hotel, _ in service.find_near(
+                lat, lng, args.radius, limit, args.fields)]
+        else:
+            results = service.find_in_bbox(tuple(args.bbox),
+                                           args.fields)[:limit]
+        if filtered:
+            matching = {hotel.id for hotel in service.search_hotels(
+                hotel_ids, destination_ids, args.amenity, args.name,
+                ('id', ))}
+            results = [hotel for hotel in results
+                       if hotel.id in matching][:args.limit]
+    else:
+        results = service.search_hotels(hotel_ids, destination_ids,
+                                         args.amenity, args.name, args.fields)
+
+    # Write results as they are encoded, without building the whole output
+    with metrics.timer("encode"):
+        HotelEncoder(args.format, cache=False,
+                     fields=args.fields).write(results, sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+
+
+# Answer the queries of the batch file, or stdin if it is -, one per line.
+# A query is the hotel_ids and destination_ids arguments, separated by
+# whitespace. Results are written and flushed query by query, in order, as
+# one document each. Hotels are encoded once however many queries return
+# them, and repeated queries are answered from the cache of the service.
+def answer_batch(service: HotelService, args: argparse.Namespace,
+                 metrics: Metrics) -> None:
+    encoder = HotelEncoder(args.format, fields=args.fields)
+    # Stdin is left open, only a file opened here is closed
+    with contextlib.ExitStack() as stack:
+        queries = (sys.stdin if args.batch == '-' else stack.enter_context(
+            open(args.batch, encoding='utf-8')))
+        for number, line in enumerate(queries, 1):
+            arguments = line.split()
+            # Blank lines and comments are not queries
+            if not arguments or arguments[0].startswith('#'):
+                continue
+            if len(arguments) > 2:
+                print(f"Warning: line {number} skipped (expected "
+                      f"hotel_ids and destination_ids, got {line.strip()!r})",
+                      file=sys.stderr)
+                continue
+            arguments.append('none')
+            results = service.find_hotels(id_list(arguments[0]),
+                                          id_list(arguments[1]), args.fields)
+            with metrics.timer("encode"):
+                encoder.write(results, sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+
+
+# Build the suppliers, sharing an HTTP transport backed by the response
+# cache, retrying them and falling back to the last good feed of each one
+# kept next to the cache
+def build_suppliers(args: argparse.Namespace):
+    from infrastructure.disk_cache import DEFAULT_CACHE_DIR, DiskResponseCache
+    from infrastructure.http_transport import (HttpTransport,
+                                               MemoryResponseCache)
+    from infrastructure.snapshot_store import (DiskSnapshotStore,
+                                               MemorySnapshotStore)
+    from infrastructure.suppliers.acme import AcmeSupplier
+    from infrastructure.suppliers.paperflies import PaperfliesSupplier
+    from infrastructure.suppliers.patagonia import PatagoniaSupplier
+    from infrastructure.suppliers.resilient import (ResiliencePolicy,
+                                                    ResilientSupplier)
+
+    cache_dir = args.cache_dir or DEFAULT_CACHE_DIR
+    if args.no_cache:
+        cache = MemoryResponseCache()
+    else:
+        cache = DiskResponseCache(cache_dir, ttl=args.cache_ttl,
+                                  max_bytes=args.cache_max_bytes)
+    transport = HttpTransport(cache=cache, refresh=args.refresh)
+
+    snapshots = None
+    if not args.no_snapshot:
+        snapshots = (MemorySnapshotStore() if args.no_cache else
+                     DiskSnapshotStore(os.path.join(cache_dir, 'snapshots')))
+    # Only a server lives long enough to use a feed fetched in the
+    # background after serving the snapshot
+    policy = ResiliencePolicy(attempts=args.attempts, deadline=args.deadline,
+                              hedge_after=args.hedge_after or None,
+                              stale_while_revalidate=args.serve)
     suppliers = [
-        AcmeSupplier(), 
-        PatagoniaSupplier(),
-        PaperfliesSupplier()
+        ResilientSupplier(supplier, policy, snapshots) for supplier in (
+            AcmeSupplier(transport),
+            PatagoniaSupplier(transport),
+            PaperfliesSupplier(transport))
     ]
+    return suppliers, transport
 
-    # Initialize repository to save data in memory
-    repository = InMemoryHotelRepository()
-    # Initialize merge strategy to merge data
-    merge_strategy = DefaultMergeStrategy()
 
-    # Initialize service
-    service = HotelService(repository, suppliers, merge_strategy)
+# Parse comma-separated ids, where none means no filter
+def id_list(value: str) -> List[str]:
+    if value.lower() == 'none':
+        return []
+    return [id.strip() for id in value.split(',') if id.strip()]
 
-    # Process hotels
-    service.process_hotels()
 
-    hotel_ids = []
-    destination_ids = []
+# Build an argument type parsing a comma-separated list of count numbers
+def coordinates(count: int):
+    def parse(value: str):
+        try:
+            numbers = [float(number) for number in value.split(',')]
+        except ValueError:
+            numbers = []
+        if len(numbers) != count:
+            raise argparse.ArgumentTypeError(
+                f"expected {count} comma-separated numbers, got {value!r}")
+        return numbers
+    return parse
 
-    if args.hotel_ids.lower() != 'none':
-        hotel_ids = [id.strip() for id in args.hotel_ids.split(',') if id.strip()]
 
-    if args.destination_ids.lower() != 'none':
-        destination_ids = [id.strip() for id in args.destination_ids.split(',') if id.strip()]
+# Parse a comma-separated list of hotel fields
+def fields_list(value: str):
+    try:
+        return project_fields(name.strip() for name in value.split(',')
+                              if name.strip())
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
 
-    # Find and output results
-    results = service.find_hotels(hotel_ids, destination_ids)
 
-    # Convert to JSON with proper handling of nested objects
-    json_results = json.dumps(
-        [hotel.__dict__ for hotel in results],
-        default=lambda o: o.__dict__,
-        indent=2,
-        ensure_ascii=False
-    )
-    print(json_results)
+# Record the traffic of every supplier so far into the metrics. The
+# transport keeps running totals, so this can be called again after every
+# refresh.
+def record_transfers(metrics: Metrics, transport) -> None:
+    for supplier_name, stats in transport.stats().items():
+        metrics.set_counter('requests', stats.requests,
+                            supplier=supplier_name)
+        metrics.set_counter('not_modified', stats.not_modified,
+                            supplier=supplier_name)
+        metrics.set_counter('cache_hits', stats.cache_hits,
+                            supplier=supplier_name)
+        metrics.set_counter('bytes_fetched', stats.bytes_on_wire,
+                            supplier=supplier_name)
+        metrics.set_counter('bytes_decoded', stats.bytes_decoded,
+                            supplier=supplier_name)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
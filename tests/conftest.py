@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import the application from src and the stub server from benchmarks
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,213 @@
+import json
+import random
+import threading
+import time
+from typing import Dict, List, Tuple
+import pytest
+import requests
+from infrastructure.http_transport import HttpTransport, MemoryResponseCache
+from infrastructure.snapshot_store import MemorySnapshotStore
+from infrastructure.suppliers.acme import AcmeSupplier
+from infrastructure.suppliers.resilient import (CircuitBreaker,
+                                                CircuitOpenError,
+                                                ResiliencePolicy,
+                                                ResilientSupplier)
+from stub_server import FaultPlan, StubServer
+
+FEED = [{"Id": "h1", "DestinationId": 1, "Name": "Beach Villa"},
+        {"Id": "h2", "DestinationId": 2, "Name": "Hill Lodge"}]
+
+
+# Fault plan counting the requests of every supplier, failing or delaying
+# the first ones as scripted
+class ScriptedPlan(FaultPlan):
+    def __init__(self, failures: int = 0, delays: Tuple[float, ...] = ()):
+        super().__init__()
+        self.failures = failures
+        self.delays = list(delays)
+        self.requests: Dict[str, int] = {}
+        self._count_lock = threading.Lock()
+
+    # Count the request, then fail it or delay it if it is one of the first
+    def draw(self, name: str) -> Tuple[float, bool]:
+        with self._count_lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            if self.failures:
+                self.failures -= 1
+                return 0.0, True
+            return (self.delays.pop(0) if self.delays else 0.0), False
+
+
+# Serve the feed with a scripted plan, yielding the plan and the base URL
+@pytest.fixture
+def served(tmp_path):
+    with open(tmp_path / "acme.json", "w", encoding="utf-8") as file:
+        json.dump(FEED, file)
+    plan = ScriptedPlan()
+    with StubServer(str(tmp_path), faults=plan) as server:
+        yield plan, server.url
+
+
+# Wrap the acme supplier of the stub server with short waits, without a
+# response cache so that every fetch reaches the server
+def resilient(url: str, snapshots=None, feed: str = "acme",
+              **policy) -> ResilientSupplier:
+    transport = HttpTransport(cache=MemoryResponseCache(max_entry_bytes=0))
+    supplier = AcmeSupplier(transport, api_url=f"{url}/{feed}")
+    settings = dict(attempts=3, backoff=0.01, max_backoff=0.05, deadline=5.0,
+                    hedge_after=None, failure_threshold=3, reset_after=60.0)
+    settings.update(policy)
+    return ResilientSupplier(supplier, ResiliencePolicy(**settings),
+                             snapshots, rng=random.Random(0))
+
+
+# Get the hotel ids of fetched pages, closing them
+def hotel_ids(supplier: ResilientSupplier, pages: List) -> List[str]:
+    try:
+        return [supplier.hotel_id(data) for data in supplier.get_hotels(pages)]
+    finally:
+        for page in pages:
+            page.close()
+
+
+# A 503 is retried until an attempt succeeds
+def test_retries_service_unavailable(served):
+    plan, url = served
+    plan.failures = 2
+    supplier = resilient(url)
+    assert hotel_ids(supplier, supplier.fetch()) == ["h1", "h2"]
+    assert plan.requests["acme"] == 3
+    assert supplier.stale_reason is None
+
+
+# A 503 on every attempt fails the fetch after the last one
+def test_gives_up_after_the_last_attempt(served):
+    plan, url = served
+    plan.failures = 10
+    supplier = resilient(url)
+    with pytest.raises(requests.HTTPError):
+        supplier.fetch()
+    assert plan.requests["acme"] == 3
+
+
+# A 404 fails the same way every time, so it is not retried
+def test_does_not_retry_not_found(served):
+    plan, url = served
+    supplier = resilient(url, feed="missing")
+    with pytest.raises(requests.HTTPError) as raised:
+        supplier.fetch()
+    assert raised.value.response.status_code == 404
+    # Unknown feeds are answered before faults are drawn
+    assert plan.requests == {}
+    assert supplier.circuit == "closed"
+
+
+# Failed fetches in a row open the circuit, then no request is sent
+def test_open_circuit_skips_the_supplier(served):
+    plan, url = served
+    plan.failures = 10
+    supplier = resilient(url, attempts=1, failure_threshold=2)
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            supplier.fetch()
+    assert supplier.circuit == "open"
+    with pytest.raises(CircuitOpenError):
+        supplier.fetch()
+    assert plan.requests["acme"] == 2
+
+
+# An open breaker lets a single trial through once reset_after has passed,
+# and closes again if it succeeds
+def test_breaker_half_opens_then_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_after=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    # Only one trial at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+# A failed trial opens the breaker again for another reset_after
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_after=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+# A request slower than hedge_after is sent again, and the second answer
+# is used without waiting for the first
+def test_hedges_a_slow_request(served):
+    plan, url = served
+    plan.delays = [2.0]
+    supplier = resilient(url, hedge_after=0.1)
+    started = time.monotonic()
+    pages = supplier.fetch()
+    assert time.monotonic() - started < 1.0
+    assert hotel_ids(supplier, pages) == ["h1", "h2"]
+    assert plan.requests["acme"] == 2
+
+
+# The snapshot of the last good feed is served while the supplier is down
+def test_serves_the_snapshot_when_down(served):
+    plan, url = served
+    supplier = resilient(url, MemorySnapshotStore())
+    hotel_ids(supplier, supplier.fetch())
+    plan.failures = 10
+    assert hotel_ids(supplier, supplier.fetch()) == ["h1", "h2"]
+    assert "serving the snapshot" in supplier.stale_reason
+
+
+# Without a snapshot, a supplier that is down fails the fetch
+def test_fails_without_a_snapshot(served):
+    plan, url = served
+    plan.failures = 10
+    supplier = resilient(url, MemorySnapshotStore())
+    with pytest.raises(requests.HTTPError):
+        supplier.fetch()
+
+
+# A slow supplier is answered from the snapshot once the hedge budget has
+# passed, and the fetch going on in the background serves the next one
+def test_serves_the_snapshot_while_revalidating(served):
+    plan, url = served
+    snapshots = MemorySnapshotStore()
+    supplier = resilient(url, snapshots, hedge_after=0.1,
+                         stale_while_revalidate=True)
+    hotel_ids(supplier, supplier.fetch())
+    saved_at = snapshots.load(supplier.name)[1]
+
+    plan.delays = [0.5, 0.5]
+    started = time.monotonic()
+    assert hotel_ids(supplier, supplier.fetch()) == ["h1", "h2"]
+    assert time.monotonic() - started < 0.4
+    assert supplier.stale_reason is not None
+
+    # The background fetch saves the feed again once it answers
+    time.sleep(0.6)
+    assert snapshots.load(supplier.name)[1] > saved_at
+    hotel_ids(supplier, supplier.fetch())
+    assert supplier.stale_reason is None
+
+
+# Without stale_while_revalidate, as in a one-shot run, a slow supplier is
+# waited for up to the deadline and its feed replaces the snapshot
+def test_waits_for_a_slow_supplier_by_default(served):
+    plan, url = served
+    snapshots = MemorySnapshotStore()
+    supplier = resilient(url, snapshots, hedge_after=0.1, deadline=3.0)
+    hotel_ids(supplier, supplier.fetch())
+    saved_at = snapshots.load(supplier.name)[1]
+
+    plan.delays = [0.5, 0.5]
+    assert hotel_ids(supplier, supplier.fetch()) == ["h1", "h2"]
+    assert supplier.stale_reason is None
+    assert snapshots.load(supplier.name)[1] > saved_at
@@ -0,0 +1,66 @@
+import io
+import os
+import time
+import pytest
+from infrastructure.snapshot_store import (DiskSnapshotStore,
+                                           MemorySnapshotStore)
+
+
+# Both stores, the disk one in a temporary directory
+@pytest.fixture(params=["memory", "disk"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemorySnapshotStore(spool_size=4)
+    return DiskSnapshotStore(str(tmp_path))
+
+
+# Read and close pages
+def read(pages) -> list:
+    try:
+        return [page.read() for page in pages]
+    finally:
+        for page in pages:
+            page.close()
+
+
+# Saved pages can be read straight away and loaded again later
+def test_saves_and_loads_pages(store):
+    assert not store.contains("acme") and store.load("acme") is None
+    pages = store.save("acme", [io.BytesIO(b"[1, 2]"), io.BytesIO(b"[3]")])
+    assert read(pages) == [b"[1, 2]", b"[3]"]
+    assert store.contains("acme")
+    loaded, saved_at = store.load("acme")
+    assert read(loaded) == [b"[1, 2]", b"[3]"]
+    assert saved_at <= time.time()
+    # Every load reads from the start
+    assert read(store.load("acme")[0]) == [b"[1, 2]", b"[3]"]
+
+
+# A new feed replaces the snapshot
+def test_replaces_a_changed_feed(store):
+    read(store.save("acme", [io.BytesIO(b"[1]")]))
+    read(store.save("acme", [io.BytesIO(b"[2]"), io.BytesIO(b"[3]")]))
+    assert read(store.load("acme")[0]) == [b"[2]", b"[3]"]
+
+
+# An unchanged feed is only marked as saved again
+def test_keeps_an_unchanged_feed(store):
+    read(store.save("acme", [io.BytesIO(b"[1]")]))
+    first = store.load("acme")
+    read(first[0])
+    time.sleep(0.01)
+    assert read(store.save("acme", [io.BytesIO(b"[1]")])) == [b"[1]"]
+    pages, saved_at = store.load("acme")
+    assert read(pages) == [b"[1]"]
+    assert saved_at > first[1]
+
+
+# The disk store does not write an unchanged feed into a new generation
+def test_disk_store_skips_unchanged_feed(tmp_path):
+    store = DiskSnapshotStore(str(tmp_path))
+    read(store.save("acme", [io.BytesIO(b"[1]")]))
+    generations = os.listdir(tmp_path / "acme")
+    read(store.save("acme", [io.BytesIO(b"[1]")]))
+    assert os.listdir(tmp_path / "acme") == generations
+    read(store.save("acme", [io.BytesIO(b"[2]")]))
+    assert os.listdir(tmp_path / "acme") != generations